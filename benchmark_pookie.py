@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Benchmark of the orchestration overhead of pookie.
+# build_docker_images and run_docker_images are run over synthetic target x Python version
+# matrices against a stub docker executable, so no Docker daemon and no network are needed.
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+
+TARGETS = ['manylinux_2_17_x86_64', 'manylinux_2_17_aarch64', 'manylinux_2_17_armv7l', 'manylinux_2_17_ppc64le', 'manylinux_2_17_s390x', 'musllinux_1_2_x86_64', 'win_amd64', 'macosx_11_0_x86_64', 'macosx_11_0_arm64']
+MINORS = ['7', '8', '9', '10', '11', '12', '13', '14']
+
+DEFAULT_MATRICES = ['1x1', '3x2', '5x4', '9x4', '9x8']
+
+# Stub of the docker CLI. Every call is appended to $STUB_DOCKER_CALLS, built images are
+# kept in $STUB_DOCKER_IMAGES, warm containers in $STUB_DOCKER_CONTAINERS and the latency (seconds)
+# and failure rate (percent) of every command are read from STUB_DOCKER_<COMMAND>_LATENCY and
+# STUB_DOCKER_<COMMAND>_FAILURE_RATE. Builds copy the wheel $STUB_WHEEL to the dist directory.
+STUB_DOCKER = r'''#!/bin/bash
+echo "$1" >> "$STUB_DOCKER_CALLS"
+command="$1"
+shift
+
+latency_var="STUB_DOCKER_${command^^}_LATENCY"
+failure_var="STUB_DOCKER_${command^^}_FAILURE_RATE"
+latency="${!latency_var:-0}"
+failure_rate="${!failure_var:-0}"
+
+fail() {
+    [ "$failure_rate" != "0" ] && [ $((RANDOM % 100)) -lt "$failure_rate" ]
+}
+
+case "$command" in
+    images)
+        name=""
+        while [ $# -gt 0 ]; do
+            case "$1" in
+                --format) shift ;;
+                *) name="$1" ;;
+            esac
+            shift
+        done
+        touch "$STUB_DOCKER_IMAGES"
+        while read -r image; do
+            if [ -z "$name" ] || [ "$image" == "$name" ] || [ "$image" == "$name:latest" ]; then
+                printf '%s\tsha256:%s\t2025-01-01 00:00:00 +0000 UTC\t1.2GB\n' "$image" "$(echo "$image" | md5sum | cut -c1-12)"
+            fi
+        done < "$STUB_DOCKER_IMAGES"
+        ;;
+    build)
+        sleep "$latency"
+        fail && exit 1
+        while [ $# -gt 0 ]; do
+            [ "$1" == "-t" ] && echo "$2:latest" >> "$STUB_DOCKER_IMAGES"
+            shift
+        done
+        ;;
+    run|exec)
+        detached=0
+        workspace=""
+        image=""
+        container=""
+        for arg in "$@"; do
+            case "$arg" in
+                -d) detached=1 ;;
+                *:/workspace) workspace="${arg%:/workspace}" ;;
+                *-lvl3-cp*) image="$arg" ;;
+                -*) ;;
+                *) [ -z "$container" ] && container="$arg" ;;
+            esac
+        done
+        if [ "$detached" == "1" ]; then
+            id="stub$RANDOM$RANDOM"
+            echo "$id $workspace $image" >> "$STUB_DOCKER_CONTAINERS"
+            echo "$id"
+            exit 0
+        fi
+        if [ "$command" == "exec" ]; then
+            read -r _ workspace image < <(grep "^$container " "$STUB_DOCKER_CONTAINERS")
+        fi
+        sleep "$latency"
+        fail && exit 1
+        # builds write a wheel tagged for the build machine, as the real ones
+        if [[ "$*" == *"python -m build"* ]] && [ -n "$workspace" ] && [ -n "$image" ]; then
+            target="${image#*-lvl3-cp*-}"
+            python="${image#*-lvl3-}"
+            python="${python%%-*}"
+            case "$target" in
+                win_amd64) platform="win_amd64" ;;
+                macosx_*|*_x86_64) platform="linux_x86_64" ;;
+                *_armv7l) platform="linux_armv7" ;;
+                *) platform="linux_${target##*_}" ;;
+            esac
+            mkdir -p "$workspace/dist"
+            cp "$STUB_WHEEL" "$workspace/dist/stub-0.1-$python-$python-$platform.whl"
+        fi
+        ;;
+esac
+exit 0
+'''
+
+# Stub of auditwheel, which writes the wheel with the requested platform next to the original one
+STUB_AUDITWHEEL = r'''#!/bin/bash
+wheel="$2"
+shift 2
+while [ $# -gt 0 ]; do
+    case "$1" in
+        --plat) platform="$2"; shift ;;
+        -w) directory="$2"; shift ;;
+    esac
+    shift
+done
+name="$(basename "$wheel")"
+cp "$wheel" "$directory/${name%-*}-$platform.whl"
+'''
+
+def parse_matrix(matrix):
+    """
+    Parse a matrix size written as <targets>x<minors> (e.g., "9x8").
+
+    Parameters:
+    - matrix (str): The matrix size.
+
+    Returns:
+    - tuple: The number of targets and the number of Python versions.
+    """
+    n_targets, n_minors = (int(n) for n in matrix.lower().split('x'))
+    if not 1 <= n_targets <= len(TARGETS) or not 1 <= n_minors <= len(MINORS):
+        raise argparse.ArgumentTypeError(f"Matrix {matrix} is out of 1x1..{len(TARGETS)}x{len(MINORS)}")
+    return n_targets, n_minors
+
+def prepare_scenario(root, targets, python_versions_dic):
+    """
+    Create the workspace, the pookie cache (with the Python tarballs already cached) and the stub docker of a scenario.
+
+    Parameters:
+    - root (str): The temporary directory of the scenario.
+    - targets (list): The targets of the matrix.
+    - python_versions_dic (dict): The synthetic Python versions of the matrix.
+
+    Returns:
+    - tuple: The workspace and cache directories.
+    """
+    from docker_images_builder import get_image_graph
+    from tarball_cache import get_tarball_path, load_index, save_index
+
+    workspace = os.path.join(root, 'workspace')
+    cache_dir = os.path.join(root, 'cache')
+    bin_dir = os.path.join(root, 'bin')
+    os.makedirs(workspace)
+    os.makedirs(bin_dir)
+
+    with open(os.path.join(workspace, 'setup.py'), 'w') as f:
+        f.write("from setuptools import setup\nsetup(name='stub')\n")
+
+    # every tarball is already in the tarball cache
+    index = load_index(cache_dir)
+    for image in get_image_graph(targets, python_versions_dic).values():
+        for key in ('python_filename', 'python_cross_filename'):
+            if key in image and image[key] not in index:
+                path = get_tarball_path(cache_dir, image[key], 'stub')
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(b'stub')
+                index[image[key]] = {'sha256': 'stub', 'size': 4, 'last_used': time.time()}
+    save_index(cache_dir, index)
+
+    for name, script in (('docker', STUB_DOCKER), ('auditwheel', STUB_AUDITWHEEL)):
+        path = os.path.join(bin_dir, name)
+        with open(path, 'w') as f:
+            f.write(script)
+        os.chmod(path, 0o755)
+
+    wheel = os.path.join(root, 'stub.whl')
+    with zipfile.ZipFile(wheel, 'w') as f:
+        f.writestr('stub-0.1.dist-info/WHEEL', "Wheel-Version: 1.0\nGenerator: stub\nRoot-Is-Purelib: false\nTag: py3-none-any\n")
+        f.writestr('stub-0.1.dist-info/RECORD', "stub-0.1.dist-info/WHEEL,,\nstub-0.1.dist-info/RECORD,,\n")
+
+    os.environ['PATH'] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+    os.environ['STUB_DOCKER_CALLS'] = os.path.join(root, 'calls')
+    os.environ['STUB_DOCKER_IMAGES'] = os.path.join(root, 'images')
+    os.environ['STUB_DOCKER_CONTAINERS'] = os.path.join(root, 'containers')
+    os.environ['STUB_WHEEL'] = wheel
+
+    return workspace, cache_dir
+
+def run_scenario(n_targets, n_minors, jobs, warm_containers):
+    """
+    Run build_docker_images and run_docker_images over a synthetic matrix in the current process.
+
+    Parameters:
+    - n_targets (int): The number of targets.
+    - n_minors (int): The number of Python versions.
+    - jobs (int): The number of parallel jobs.
+    - warm_containers (bool): Whether to use warm containers.
+
+    Returns:
+    - dict: The measurements of the scenario.
+    """
+    sys.path.insert(0, SRC_DIR)
+    from docker_images_builder import build_docker_images
+    from docker_images_runner import run_docker_images
+    from docker_engine import set_engine_api
+
+    # the stub replaces the docker CLI, not the Docker socket
+    set_engine_api(False)
+
+    targets = TARGETS[:n_targets]
+    minors = MINORS[:n_minors]
+    python_versions_dic = {
+        minor: {
+            target: {
+                'url': f"https://example.invalid/cpython-3.{minor}.0-{target}.tar.gz",
+                'filename': f"cpython-3.{minor}.0-{target}.tar.gz",
+                'tag': 'stub'
+            }
+            for target in TARGETS
+        }
+        for minor in minors
+    }
+
+    # count every process started by pookie
+    forks = 0
+    popen_init = subprocess.Popen.__init__
+    def counting_popen_init(self, *args, **kwargs):
+        nonlocal forks
+        forks += 1
+        popen_init(self, *args, **kwargs)
+
+    with tempfile.TemporaryDirectory() as root:
+        workspace, cache_dir = prepare_scenario(root, targets, python_versions_dic)
+        os.chdir(workspace)
+        subprocess.Popen.__init__ = counting_popen_init
+
+        with open(os.devnull, 'w') as devnull, open(os.path.join(root, 'pookie.log'), 'a') as logfile:
+            stdout = sys.stdout
+            sys.stdout = devnull
+            try:
+                start = time.perf_counter()
+                images_status = build_docker_images(targets, logfile, python_versions_dic, cache_dir, jobs)
+                build_images_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                run_docker_images(targets, logfile, python_versions_dic, 'python -m build', 'python -m pytest', 'gcc', 'cross', workspace, jobs, warm_containers)
+                run_images_time = time.perf_counter() - start
+            finally:
+                sys.stdout = stdout
+                subprocess.Popen.__init__ = popen_init
+
+        with open(os.environ['STUB_DOCKER_CALLS']) as f:
+            docker_calls = len(f.read().splitlines())
+        wheels = len(os.listdir(os.path.join(workspace, 'dist'))) if os.path.isdir(os.path.join(workspace, 'dist')) else 0
+
+    return {
+        'matrix': f"{n_targets}x{n_minors}",
+        'jobs': jobs,
+        'images': len(images_status),
+        'failed_images': sum(1 for status in images_status.values() if status != 'ok'),
+        'wheels': wheels,
+        'build_images_seconds': build_images_time,
+        'run_images_seconds': run_images_time,
+        'wall_seconds': build_images_time + run_images_time,
+        'forks': forks,
+        'docker_calls': docker_calls,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the orchestration overhead of pookie against a stub docker CLI')
+    parser.add_argument(
+        '--matrix',
+        type=str,
+        nargs='+',
+        default=DEFAULT_MATRICES,
+        help=f'Matrix size(s) as <targets>x<python versions>, from 1x1 to {len(TARGETS)}x{len(MINORS)} (default: {" ".join(DEFAULT_MATRICES)})'
+        )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        nargs='+',
+        default=[1, 4],
+        help='Number(s) of parallel jobs (default: 1 4)'
+        )
+    parser.add_argument(
+        '--warm-containers',
+        action='store_true',
+        help='Run the jobs in warm containers'
+        )
+    parser.add_argument(
+        '--latency',
+        type=str,
+        nargs='+',
+        default=['build=0.05', 'run=0.02', 'exec=0.01'],
+        metavar='COMMAND=SECONDS',
+        help='Latency of the stub docker commands (default: build=0.05 run=0.02 exec=0.01)'
+        )
+    parser.add_argument(
+        '--failure-rate',
+        type=str,
+        nargs='+',
+        default=[],
+        metavar='COMMAND=PERCENT',
+        help='Failure rate of the stub docker commands (e.g. build=5 run=10, default: none)'
+        )
+    parser.add_argument(
+        '--json',
+        type=str,
+        metavar='FILE',
+        help='Also write the results to FILE as JSON'
+        )
+    parser.add_argument(
+        '--scenario',
+        type=str,
+        help=argparse.SUPPRESS
+        )
+    args = parser.parse_args()
+
+    # a single scenario, run in its own process so that its peak RSS is measured alone
+    if args.scenario:
+        matrix, jobs = args.scenario.split(':')
+        n_targets, n_minors = parse_matrix(matrix)
+        print(json.dumps(run_scenario(n_targets, n_minors, int(jobs), args.warm_containers)))
+        return
+
+    env = dict(os.environ)
+    for setting, suffix in [(args.latency, 'LATENCY'), (args.failure_rate, 'FAILURE_RATE')]:
+        for item in setting:
+            command, value = item.split('=')
+            env[f"STUB_DOCKER_{command.upper()}_{suffix}"] = value
+
+    results = []
+    print(f"{'matrix':>7} {'jobs':>4} {'images':>6} {'wheels':>6} {'build imgs':>10} {'run imgs':>9} {'wall':>8} {'forks':>6} {'docker':>6} {'RSS MB':>7}")
+    for matrix in args.matrix:
+        parse_matrix(matrix)
+        for jobs in args.jobs:
+            command = [sys.executable, os.path.abspath(__file__), '--scenario', f"{matrix}:{jobs}"]
+            if args.warm_containers:
+                command.append('--warm-containers')
+            result = subprocess.run(command, stdout=subprocess.PIPE, text=True, env=env, check=True)
+            r = json.loads(result.stdout.splitlines()[-1])
+            results.append(r)
+            print(f"{r['matrix']:>7} {r['jobs']:>4} {r['images']:>6} {r['wheels']:>6} {r['build_images_seconds']:>9.2f}s {r['run_images_seconds']:>8.2f}s {r['wall_seconds']:>7.2f}s {r['forks']:>6} {r['docker_calls']:>6} {r['peak_rss_mb']:>7.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -24,6 +24,10 @@ while [[ "$#" -gt 0 ]]; do
             WORKSPACE_DIR="$2"
             shift 2
             ;;
+        --cache-dir)
+            CACHE_DIR="$2"
+            shift 2
+            ;;
         *)
             ARGS+=("$1")
             shift
@@ -34,10 +38,14 @@ done
 # Check if WORKSPACE_DIR is set
 if [ -z "$WORKSPACE_DIR" ]; then
     echo "Error: You must specify a workspace directory using --workspace"
-    echo "Usage: $0 --workspace /path/to/workspace [OTHER_ARGUMENTS]"
+    echo "Usage: $0 --workspace /path/to/workspace [--cache-dir /path/to/cache] [OTHER_ARGUMENTS]"
     exit 1
 fi
 
+# Cache directory shared between runs (downloaded Python tarballs, ...)
+CACHE_DIR="${CACHE_DIR:-$HOME/.cache/pookie}"
+mkdir -p "$CACHE_DIR"
+
 echo ">> Creating pookie docker image"
 
 # Check if Docker images exist and build if necessary
@@ -61,6 +69,9 @@ fi
 docker run -it --rm \
     -v "$WORKSPACE_DIR":/workspace \
     -e WORKSPACE_PWD="$WORKSPACE_DIR" \
+    -v "$CACHE_DIR":/cache \
+    -e CACHE_PWD="$CACHE_DIR" \
+    -e GITHUB_TOKEN \
     -w /workspace \
     -v /var/run/docker.sock:/var/run/docker.sock \
     --network host \
@@ -0,0 +1,184 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import fnmatch
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import threading
+
+MANIFEST_FILE = os.path.join('.pookie', 'manifest.json')
+
+# Files generated by pookie or by the builds, never part of the fingerprint
+IGNORED_PATTERNS = [
+    '.git',
+    '.pookie',
+    'pookie_logs',
+    'pookie.log',
+    'dist',
+    'build',
+    '*.egg-info',
+    '__pycache__',
+    '*.pyc',
+    'clang-wrapper.sh',
+    'mingw-wrapper.sh'
+]
+
+_manifest_lock = threading.Lock()
+
+def is_ignored(path):
+    """
+    Check if a workspace path is generated by pookie or by the builds.
+
+    Parameters:
+    - path (str): The path relative to the workspace.
+
+    Returns:
+    - bool: True if any component of the path matches IGNORED_PATTERNS.
+    """
+    return any(
+        fnmatch.fnmatch(part, pattern)
+        for part in path.split('/')
+        for pattern in IGNORED_PATTERNS
+    )
+
+def list_workspace_files(workspace, ignored=is_ignored):
+    """
+    List the source files of the workspace.
+    In a git repository the .gitignore rules are respected, otherwise every file is listed.
+
+    Parameters:
+    - workspace (str): The path to the workspace.
+    - ignored (callable): Predicate on the relative paths of the files left out (default: is_ignored).
+
+    Returns:
+    - list: Sorted paths relative to the workspace.
+    """
+    result = subprocess.run([
+        'git',
+            '-c',
+                'safe.directory=*',
+            'ls-files',
+            '-z',
+            '--cached',
+            '--others',
+            '--exclude-standard'],
+        cwd=workspace,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+
+    if result.returncode == 0:
+        files = [path for path in result.stdout.decode().split('\0') if path]
+    else:
+        files = []
+        for root, dirs, filenames in os.walk(workspace):
+            for filename in filenames:
+                files.append(os.path.relpath(os.path.join(root, filename), workspace).replace(os.sep, '/'))
+
+    return sorted(
+        path for path in files
+        if not ignored(path) and os.path.isfile(os.path.join(workspace, path))
+    )
+
+def hash_workspace(workspace):
+    """
+    Compute the hash of the source tree of the workspace (file paths, modes and contents).
+
+    Parameters:
+    - workspace (str): The path to the workspace.
+
+    Returns:
+    - str: The SHA-256 hex digest of the source tree.
+    """
+    digest = hashlib.sha256()
+    for path in list_workspace_files(workspace):
+        file_digest = hashlib.sha256()
+        with open(os.path.join(workspace, path), 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                file_digest.update(chunk)
+        executable = os.access(os.path.join(workspace, path), os.X_OK)
+        digest.update(f"{path}\0{int(executable)}\0{file_digest.hexdigest()}\n".encode())
+    return digest.hexdigest()
+
+def compute_fingerprint(tree_hash, inputs):
+    """
+    Compute the fingerprint of a build job.
+
+    Parameters:
+    - tree_hash (str): The hash of the workspace source tree (see hash_workspace).
+    - inputs (list): The other inputs of the job (build command, target, minor, flags, image ID...).
+
+    Returns:
+    - str: The SHA-256 hex digest of the job inputs.
+    """
+    return hashlib.sha256(json.dumps([tree_hash] + [str(i) for i in inputs]).encode()).hexdigest()
+
+def load_manifest():
+    """
+    Load the manifest of the wheels produced by previous builds.
+
+    Returns:
+    - dict: Mapping of fingerprint to a dictionary with the keys 'job' and 'wheels'.
+    """
+    try:
+        with open(MANIFEST_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def get_cached_wheels(fingerprint, dist_dir='dist'):
+    """
+    Get the wheels built by a previous job with the same fingerprint, if they are still in the dist directory.
+
+    Parameters:
+    - fingerprint (str): The fingerprint of the job.
+    - dist_dir (str): The dist directory of the workspace.
+
+    Returns:
+    - list: The wheel filenames, or None if the job has to be built.
+    """
+    entry = load_manifest().get(fingerprint)
+    if not entry or not entry['wheels']:
+        return None
+    if not all(os.path.exists(os.path.join(dist_dir, wheel)) for wheel in entry['wheels']):
+        return None
+    return entry['wheels']
+
+def record_wheels(fingerprint, job_name, wheels):
+    """
+    Record the wheels produced by a job, replacing older entries of the same job.
+
+    Parameters:
+    - fingerprint (str): The fingerprint of the job.
+    - job_name (str): The name of the job (e.g., "cp312-manylinux_2_17_x86_64").
+    - wheels (list): The wheel filenames produced by the job.
+    """
+    with _manifest_lock:
+        manifest = {
+            key: entry for key, entry in load_manifest().items()
+            if entry['job'] != job_name
+        }
+        manifest[fingerprint] = {'job': job_name, 'wheels': sorted(wheels)}
+
+        os.makedirs(os.path.dirname(MANIFEST_FILE), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(MANIFEST_FILE), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, MANIFEST_FILE)
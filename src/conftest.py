@@ -0,0 +1,30 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+
+import pytest
+import docker_engine
+
+@pytest.fixture(autouse=True)
+def docker_cli():
+    """
+    Run the tests against the docker CLI, whose calls they mock, even where a Docker daemon answers on the Docker socket.
+    """
+    docker_engine.set_engine_api(False)
+    yield
+    docker_engine.set_engine_api(False)
@@ -0,0 +1,492 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+
+import asyncio
+import json
+import os
+import tarfile
+import tempfile
+import urllib.parse
+
+DOCKER_SOCKET = '/var/run/docker.sock'
+
+# Docker Engine API version of the requests (Docker 20.10 and later)
+API_VERSION = '1.41'
+
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Size under which a build context is kept in memory rather than in a temporary file
+MAX_MEMORY_CONTEXT_BYTES = 16 * 1024 * 1024
+
+# Name of the Dockerfile inside the build contexts
+DOCKERFILE_NAME = '.pookie.Dockerfile'
+
+# Idle keep-alive connections by socket path, only used from the event loop of docker_engine
+_idle_connections = {}
+
+async def _get_connection():
+    """
+    Take an idle keep-alive connection to the Docker socket, or open a new one.
+
+    Returns:
+    - tuple: Whether the connection was reused, and its stream reader and writer.
+    """
+    idle = _idle_connections.setdefault(DOCKER_SOCKET, [])
+    while idle:
+        reader, writer = idle.pop()
+        if not reader.at_eof() and not writer.is_closing():
+            return True, reader, writer
+        writer.close()
+    reader, writer = await asyncio.open_unix_connection(DOCKER_SOCKET)
+    return False, reader, writer
+
+def close_connections():
+    """
+    Close every idle connection (only called from the event loop).
+    """
+    for idle in _idle_connections.values():
+        for reader, writer in idle:
+            writer.close()
+        idle.clear()
+
+async def _send_request(writer, method, path, params, body, content_type):
+    """
+    Write an HTTP/1.1 request, streaming the body when it is a file.
+
+    Parameters:
+    - writer (asyncio.StreamWriter): The connection.
+    - method (str): The HTTP method.
+    - path (str): The path of the endpoint, without the API version.
+    - params (dict): The query parameters, or None.
+    - body (bytes or file object): The body of the request, or None.
+    - content_type (str): The content type of the body.
+    """
+    target = f"/v{API_VERSION}{path}"
+    if params:
+        target += '?' + urllib.parse.urlencode(params)
+
+    if body is None:
+        length = 0
+    elif isinstance(body, bytes):
+        length = len(body)
+    else:
+        length = body.seek(0, os.SEEK_END)
+        body.seek(0)
+
+    head = [f"{method} {target} HTTP/1.1", "Host: docker", f"Content-Length: {length}"]
+    if body is not None:
+        head.append(f"Content-Type: {content_type}")
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1'))
+
+    if isinstance(body, bytes):
+        writer.write(body)
+    elif body is not None:
+        while True:
+            chunk = body.read(STREAM_CHUNK_BYTES)
+            if not chunk:
+                break
+            writer.write(chunk)
+            await writer.drain()
+    await writer.drain()
+
+async def _read_head(reader):
+    """
+    Read the status line and the headers of an HTTP response.
+
+    Parameters:
+    - reader (asyncio.StreamReader): The connection.
+
+    Returns:
+    - tuple: The status code and the headers (with lowercase names).
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("The Docker socket closed the connection")
+    status = int(status_line.split(b' ', 2)[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return status, headers
+
+async def _read_body(reader, headers):
+    """
+    Read the body of an HTTP response as it arrives.
+
+    Parameters:
+    - reader (asyncio.StreamReader): The connection.
+    - headers (dict): The headers of the response.
+
+    Yields:
+    - bytes: The chunks of the body.
+    """
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                while await reader.readline() not in (b'\r\n', b'\n', b''):
+                    pass
+                return
+            data = await reader.readexactly(size)
+            await reader.readexactly(2)
+            yield data
+    elif 'content-length' in headers:
+        remaining = int(headers['content-length'])
+        while remaining:
+            data = await reader.read(min(remaining, STREAM_CHUNK_BYTES))
+            if not data:
+                raise asyncio.IncompleteReadError(b'', remaining)
+            remaining -= len(data)
+            yield data
+    else:
+        while True:
+            data = await reader.read(STREAM_CHUNK_BYTES)
+            if not data:
+                return
+            yield data
+
+async def api_request(method, path, params=None, body=None, content_type='application/json', on_chunk=None):
+    """
+    Send a request to the Docker Engine API over a keep-alive connection to the Docker socket.
+    A reused connection that the daemon closed in the meantime is replaced once.
+
+    Parameters:
+    - method (str): The HTTP method.
+    - path (str): The path of the endpoint, without the API version (e.g., "/images/json").
+    - params (dict): The query parameters, or None.
+    - body (bytes or file object): The body of the request, or None.
+    - content_type (str): The content type of the body.
+    - on_chunk (callable): Function called with every chunk of the response body as it arrives,
+      or None to return the whole body.
+
+    Returns:
+    - tuple: The status code and the body of the response (empty when on_chunk is given).
+    """
+    for attempt in range(2):
+        reused, reader, writer = await _get_connection()
+        keep = False
+        try:
+            try:
+                await _send_request(writer, method, path, params, body, content_type)
+                status, headers = await _read_head(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if reused and attempt == 0:
+                    continue
+                raise
+
+            chunks = []
+            async for chunk in _read_body(reader, headers):
+                if on_chunk is not None:
+                    on_chunk(chunk)
+                else:
+                    chunks.append(chunk)
+            keep = headers.get('connection', '').lower() != 'close' and (
+                'content-length' in headers or headers.get('transfer-encoding', '').lower() == 'chunked')
+            return status, b''.join(chunks)
+        finally:
+            if keep:
+                _idle_connections.setdefault(DOCKER_SOCKET, []).append((reader, writer))
+            else:
+                writer.close()
+
+def get_error_message(status, body):
+    """
+    Get the error message of a failed Docker Engine API request.
+
+    Parameters:
+    - status (int): The status code of the response.
+    - body (bytes): The body of the response.
+
+    Returns:
+    - str: The message of the daemon, or the status code.
+    """
+    try:
+        return json.loads(body)['message']
+    except (ValueError, KeyError, TypeError):
+        return f"HTTP {status}"
+
+def make_demuxer(on_output):
+    """
+    Make a function splitting the multiplexed stdout and stderr stream of a container without TTY
+    into the output it carries, frames being an 8 bytes header (stream, 3 zeros, big-endian size) and the data.
+
+    Parameters:
+    - on_output (callable): Function called with the output of every frame.
+
+    Returns:
+    - callable: The function to call with every chunk of the stream.
+    """
+    buffer = bytearray()
+
+    def on_chunk(chunk):
+        buffer.extend(chunk)
+        while len(buffer) >= 8:
+            size = int.from_bytes(buffer[4:8], 'big')
+            if len(buffer) < 8 + size:
+                break
+            on_output(bytes(buffer[8:8 + size]))
+            del buffer[:8 + size]
+    return on_chunk
+
+def make_build_context(dockerfile, context_dir=None):
+    """
+    Pack a build context into a tar file, with the Dockerfile as DOCKERFILE_NAME.
+    The .dockerignore file of the context directory is not applied.
+
+    Parameters:
+    - dockerfile (str): The path of the Dockerfile.
+    - context_dir (str): The directory of the build context, or None for a context with the Dockerfile alone.
+
+    Returns:
+    - file object: The tar file, at its start.
+    """
+    context = tempfile.SpooledTemporaryFile(max_size=MAX_MEMORY_CONTEXT_BYTES)
+    with tarfile.open(fileobj=context, mode='w') as tar:
+        if context_dir is not None:
+            for entry in sorted(os.listdir(context_dir)):
+                tar.add(os.path.join(context_dir, entry), arcname=entry)
+        tar.add(dockerfile, arcname=DOCKERFILE_NAME)
+    context.seek(0)
+    return context
+
+async def ping_async():
+    """
+    Check that the Docker daemon answers on the Docker socket.
+
+    Returns:
+    - bool: True if it answered.
+    """
+    try:
+        status, body = await api_request('GET', '/_ping')
+    except (OSError, asyncio.IncompleteReadError, ValueError):
+        return False
+    return status == 200
+
+async def list_images_async():
+    """
+    List the local images.
+
+    Returns:
+    - list: The images, dictionaries with the keys 'RepoTags', 'Id', 'Created' (seconds since the epoch) and 'Size'.
+    """
+    status, body = await api_request('GET', '/images/json')
+    if status != 200:
+        raise OSError(get_error_message(status, body))
+    return json.loads(body)
+
+async def inspect_image_async(image_name):
+    """
+    Inspect a local image.
+
+    Parameters:
+    - image_name (str): The name of the image.
+
+    Returns:
+    - dict: The image, with the keys 'RepoTags', 'Id', 'Created' (RFC 3339 date) and 'Size', or None if it does not exist.
+    """
+    status, body = await api_request('GET', f"/images/{urllib.parse.quote(image_name)}/json")
+    if status == 404:
+        return None
+    if status != 200:
+        raise OSError(get_error_message(status, body))
+    return json.loads(body)
+
+async def build_image_async(image_name, context, build_args=None, on_output=None):
+    """
+    Build an image from a build context with the builder of the Docker Engine API (without BuildKit).
+
+    Parameters:
+    - image_name (str): The name of the image.
+    - context (file object): The build context (see make_build_context).
+    - build_args (dict): The build arguments, or None.
+    - on_output (callable): Function called with every line of the build output, errors included, or None.
+
+    Returns:
+    - str: The error of the build, or None if the image was built.
+    """
+    errors = []
+    partial = b''
+
+    def on_chunk(chunk):
+        nonlocal partial
+        lines = (partial + chunk).split(b'\n')
+        partial = lines.pop()
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if 'error' in message:
+                errors.append(message['error'])
+            text = message.get('stream') or message.get('status') or message.get('error')
+            if text and on_output is not None:
+                on_output(text if text.endswith('\n') else text + '\n')
+
+    status, body = await api_request('POST', '/build', {
+        't': image_name,
+        'dockerfile': DOCKERFILE_NAME,
+        'buildargs': json.dumps(build_args or {}),
+        'rm': '1',
+        'forcerm': '1'
+    }, context, 'application/x-tar', on_chunk)
+    if status != 200:
+        errors.append(get_error_message(status, body))
+        if on_output is not None:
+            on_output(errors[-1] + '\n')
+    return errors[-1] if errors else None
+
+async def create_container_async(name, image_name, command, working_dir=None, binds=None, env=None, tty=False, privileged=False):
+    """
+    Create a container.
+
+    Parameters:
+    - name (str): The name of the container, or None for a random one.
+    - image_name (str): The name of the image.
+    - command (list): The command of the container.
+    - working_dir (str): The working directory, or None for the one of the image.
+    - binds (list): The volumes, as "host path:container path", or None.
+    - env (dict): The environment variables, or None.
+    - tty (bool): Whether to allocate a pseudo-terminal.
+    - privileged (bool): Whether to give extended privileges to the container.
+
+    Returns:
+    - str: The ID of the container.
+    """
+    config = {
+        'Image': image_name,
+        'Cmd': command,
+        'Env': [f"{key}={value}" for key, value in (env or {}).items()],
+        'Tty': tty,
+        'HostConfig': {'Binds': binds or [], 'Privileged': privileged}
+    }
+    if working_dir is not None:
+        config['WorkingDir'] = working_dir
+    status, body = await api_request('POST', '/containers/create', {'name': name} if name else None, json.dumps(config).encode())
+    if status != 201:
+        raise OSError(f"Failed to create a container from {image_name}: {get_error_message(status, body)}")
+    return json.loads(body)['Id']
+
+async def start_container_async(container_id):
+    """
+    Start a container.
+
+    Parameters:
+    - container_id (str): The ID of the container.
+    """
+    status, body = await api_request('POST', f"/containers/{container_id}/start")
+    if status not in (204, 304):
+        raise OSError(f"Failed to start the container {container_id[:12]}: {get_error_message(status, body)}")
+
+async def follow_logs_async(container_id, tty, on_output):
+    """
+    Follow the output of a container until it stops.
+
+    Parameters:
+    - container_id (str): The ID of the container.
+    - tty (bool): Whether the container has a pseudo-terminal, whose output is not multiplexed.
+    - on_output (callable): Function called with the output as it arrives.
+    """
+    status, body = await api_request('GET', f"/containers/{container_id}/logs", {
+        'follow': '1',
+        'stdout': '1',
+        'stderr': '1'
+    }, on_chunk=on_output if tty else make_demuxer(on_output))
+    if status != 200:
+        raise OSError(f"Failed to read the output of the container {container_id[:12]}: {get_error_message(status, body)}")
+
+async def wait_container_async(container_id):
+    """
+    Wait for a container to stop.
+
+    Parameters:
+    - container_id (str): The ID of the container.
+
+    Returns:
+    - int: The exit code of the container.
+    """
+    status, body = await api_request('POST', f"/containers/{container_id}/wait")
+    if status != 200:
+        raise OSError(f"Failed to wait for the container {container_id[:12]}: {get_error_message(status, body)}")
+    return json.loads(body)['StatusCode']
+
+async def delete_container_async(container):
+    """
+    Stop and remove a container, if it exists.
+
+    Parameters:
+    - container (str): The name or ID of the container.
+    """
+    await api_request('DELETE', f"/containers/{container}", {'force': '1'})
+
+async def create_exec_async(container_id, command, tty=False):
+    """
+    Create a command to run inside a running container.
+
+    Parameters:
+    - container_id (str): The ID of the container.
+    - command (list): The command.
+    - tty (bool): Whether to allocate a pseudo-terminal.
+
+    Returns:
+    - str: The ID of the exec instance.
+    """
+    config = {
+        'Cmd': command,
+        'AttachStdout': True,
+        'AttachStderr': True,
+        'Tty': tty
+    }
+    status, body = await api_request('POST', f"/containers/{container_id}/exec", body=json.dumps(config).encode())
+    if status != 201:
+        raise OSError(f"Failed to run a command in the container {container_id[:12]}: {get_error_message(status, body)}")
+    return json.loads(body)['Id']
+
+async def start_exec_async(exec_id, tty, on_output):
+    """
+    Start an exec instance and read its output until the command ends.
+
+    Parameters:
+    - exec_id (str): The ID of the exec instance.
+    - tty (bool): Whether the command has a pseudo-terminal, whose output is not multiplexed.
+    - on_output (callable): Function called with the output as it arrives.
+    """
+    status, body = await api_request('POST', f"/exec/{exec_id}/start", body=json.dumps({'Detach': False, 'Tty': tty}).encode(),
+                                     on_chunk=on_output if tty else make_demuxer(on_output))
+    if status != 200:
+        raise OSError(f"Failed to start the command {exec_id[:12]}: {get_error_message(status, body)}")
+
+async def inspect_exec_async(exec_id):
+    """
+    Get the exit code of an exec instance.
+
+    Parameters:
+    - exec_id (str): The ID of the exec instance.
+
+    Returns:
+    - int: The exit code of the command, or None if it is still running.
+    """
+    status, body = await api_request('GET', f"/exec/{exec_id}/json")
+    if status != 200:
+        raise OSError(f"Failed to inspect the command {exec_id[:12]}: {get_error_message(status, body)}")
+    return json.loads(body)['ExitCode']
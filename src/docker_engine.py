@@ -0,0 +1,667 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import codecs
+import concurrent.futures
+import os
+import signal
+import subprocess
+import sys
+import threading
+from log_streamer import READ_CHUNK_BYTES, MAX_LINE_BYTES, show_line, is_live_view_started
+from docker_api import (
+    close_connections, make_build_context, ping_async, list_images_async, inspect_image_async, build_image_async,
+    create_container_async, start_container_async, follow_logs_async, wait_container_async, delete_container_async,
+    create_exec_async, start_exec_async, inspect_exec_async
+)
+
+# Exit code of a command stopped because it exceeded its timeout (as the timeout utility)
+TIMEOUT_EXIT_CODE = 124
+
+# Seconds given to a cancelled command to stop its container
+CANCEL_GRACE_SECONDS = 30
+
+# Exit code of a container the Docker daemon could not run (as docker run)
+DAEMON_ERROR_EXIT_CODE = 125
+
+_loop = None
+_loop_lock = threading.Lock()
+_semaphore = None
+_max_processes = None
+_interrupted = False
+_command_tasks = set()
+_engine_api = None
+_engine_api_lock = threading.Lock()
+
+def _get_loop():
+    """
+    Get the event loop of the engine, started on first use in a background thread.
+
+    Returns:
+    - asyncio.AbstractEventLoop: The event loop running every docker process.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='docker-engine', daemon=True).start()
+        return _loop
+
+def set_max_processes(max_processes):
+    """
+    Limit the number of docker processes running at the same time.
+
+    Parameters:
+    - max_processes (int): The maximum number of processes, or None for no limit.
+    """
+    global _max_processes, _semaphore
+    _max_processes = max_processes
+    _semaphore = None
+
+def _get_semaphore():
+    """
+    Get the semaphore enforcing the concurrency limit (only called from the event loop).
+
+    Returns:
+    - asyncio.Semaphore: The semaphore.
+    """
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(_max_processes or sys.maxsize)
+    return _semaphore
+
+def _track_command_task():
+    """
+    Register the current task as a docker command, to be cancelled by cancel_all (only called from the event loop).
+    """
+    task = asyncio.current_task()
+    _command_tasks.add(task)
+    task.add_done_callback(_command_tasks.discard)
+
+async def _remove_container_async(container, env=None):
+    """
+    Stop and remove a container, ignoring the concurrency limit and the interruption.
+
+    Parameters:
+    - container (str): The name or ID of the container.
+    - env (dict): The environment of the docker command (which selects the Docker host), or None to inherit it.
+    """
+    if env is None and _engine_api:
+        try:
+            await delete_container_async(container)
+            return
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+    process = await asyncio.create_subprocess_exec(
+        'docker', 'rm', '-f', container,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env=env)
+    await process.wait()
+
+async def _terminate(process, container, env=None):
+    """
+    Kill a process and remove the container it was running, if any.
+
+    Parameters:
+    - process (asyncio.subprocess.Process): The process.
+    - container (str): The name or ID of the container, or None.
+    - env (dict): The environment of the process, or None if it inherited it.
+    """
+    if process.returncode is None:
+        process.kill()
+        await process.wait()
+    if container is not None:
+        await _remove_container_async(container, env)
+
+async def _pump_output(stream, log_path, logfile, prefix):
+    """
+    Read the output of a process until it ends into the log file, the text log and the live view.
+
+    Parameters:
+    - stream (asyncio.StreamReader): The output of the process.
+    - log_path (str): The path of the log file (overwritten), or None.
+    - logfile (file object): Text file where the output is also appended, or None.
+    - prefix (str): The name printed before the lines in the live view, or None.
+    """
+    log = open(log_path, 'wb') if log_path is not None else None
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    partial = b''
+    try:
+        while True:
+            chunk = await stream.read(READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            if log is not None:
+                log.write(chunk)
+            if logfile is not None:
+                logfile.write(decoder.decode(chunk))
+
+            if prefix is not None and is_live_view_started():
+                lines = (partial + chunk).split(b'\n')
+                partial = lines.pop()[:MAX_LINE_BYTES]
+                for line in lines:
+                    show_line(prefix, line[:MAX_LINE_BYTES].rstrip(b'\r'))
+
+        if partial:
+            show_line(prefix, partial.rstrip(b'\r'))
+    finally:
+        if log is not None:
+            log.close()
+        if logfile is not None:
+            logfile.flush()
+
+async def run_command_async(args, log_path=None, logfile=None, prefix=None, env=None, timeout=None, container=None):
+    """
+    Run a docker command, reading its stdout and stderr through a pipe.
+    When it exceeds its timeout or is cancelled, the process is killed and its container removed.
+
+    Parameters:
+    - args (list): The command line.
+    - log_path (str): The path of the log file of the output (overwritten), or None.
+    - logfile (file object): Text file where the output is also appended, or None.
+    - prefix (str): The name printed before the output lines in the live view, or None to hide them.
+    - env (dict): The environment of the process, or None to inherit it.
+    - timeout (float): Seconds after which the command is stopped, or None.
+    - container (str): The name of the container started by the command, removed when it is stopped.
+
+    Returns:
+    - int: The exit code of the command, or TIMEOUT_EXIT_CODE if it timed out.
+    """
+    if _interrupted:
+        raise asyncio.CancelledError()
+    _track_command_task()
+
+    async with _get_semaphore():
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=env)
+
+        async def communicate():
+            await _pump_output(process.stdout, log_path, logfile, prefix)
+            return await process.wait()
+
+        try:
+            return await asyncio.wait_for(communicate(), timeout)
+        except asyncio.TimeoutError:
+            print(f">> {prefix or ' '.join(args[:2])} timed out after {timeout} seconds")
+            await _terminate(process, container, env)
+            return TIMEOUT_EXIT_CODE
+        except asyncio.CancelledError:
+            await _terminate(process, container, env)
+            raise
+
+async def capture_command_async(args, env=None, timeout=None):
+    """
+    Run a docker command and capture its output.
+
+    Parameters:
+    - args (list): The command line.
+    - env (dict): The environment of the process, or None to inherit it.
+    - timeout (float): Seconds after which the command is stopped, or None.
+
+    Returns:
+    - tuple: The exit code (TIMEOUT_EXIT_CODE if it timed out), the stdout and the stderr of the command.
+    """
+    if _interrupted:
+        raise asyncio.CancelledError()
+    _track_command_task()
+
+    async with _get_semaphore():
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env)
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            await _terminate(process, None)
+            return TIMEOUT_EXIT_CODE, '', f"timed out after {timeout} seconds"
+        except asyncio.CancelledError:
+            await _terminate(process, None)
+            raise
+        return process.returncode, stdout.decode(errors='replace'), stderr.decode(errors='replace')
+
+def _append_output(log_path, logfile, text):
+    """
+    Append a message to the log file of a command and to the text log.
+
+    Parameters:
+    - log_path (str): The path of the log file, or None.
+    - logfile (file object): Text file where the message is also appended, or None.
+    - text (str): The message.
+    """
+    if log_path is not None:
+        with open(log_path, 'a') as log:
+            log.write(text)
+    if logfile is not None:
+        logfile.write(text)
+        logfile.flush()
+
+async def run_container_async(name, image_name, command, log_path=None, logfile=None, prefix=None, working_dir=None, binds=None, env=None, tty=False, privileged=False, timeout=None):
+    """
+    Run a container through the Docker Engine API, as docker run --rm would, reading its output as it is produced.
+    When it exceeds its timeout or is cancelled, the container is removed.
+
+    Parameters:
+    - name (str): The name of the container.
+    - image_name (str): The name of the image.
+    - command (list): The command of the container.
+    - log_path (str): The path of the log file of the output (overwritten), or None.
+    - logfile (file object): Text file where the output is also appended, or None.
+    - prefix (str): The name printed before the output lines in the live view, or None to hide them.
+    - working_dir (str): The working directory, or None for the one of the image.
+    - binds (list): The volumes, as "host path:container path", or None.
+    - env (dict): The environment variables of the container, or None.
+    - tty (bool): Whether to allocate a pseudo-terminal.
+    - privileged (bool): Whether to give extended privileges to the container.
+    - timeout (float): Seconds after which the container is stopped, or None.
+
+    Returns:
+    - int: The exit code of the container, TIMEOUT_EXIT_CODE if it timed out or DAEMON_ERROR_EXIT_CODE if it could not run.
+    """
+    if _interrupted:
+        raise asyncio.CancelledError()
+    _track_command_task()
+
+    async with _get_semaphore():
+        try:
+            container_id = await create_container_async(name, image_name, command, working_dir, binds, env, tty, privileged)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            _append_output(log_path, logfile, f"{e}\n")
+            return DAEMON_ERROR_EXIT_CODE
+
+        output = asyncio.StreamReader()
+
+        async def communicate():
+            await start_container_async(container_id)
+            pump = asyncio.ensure_future(_pump_output(output, log_path, logfile, prefix))
+            try:
+                await follow_logs_async(container_id, tty, output.feed_data)
+            finally:
+                output.feed_eof()
+                await pump
+            return await wait_container_async(container_id)
+
+        try:
+            return await asyncio.wait_for(communicate(), timeout)
+        except asyncio.TimeoutError:
+            print(f">> {prefix or image_name} timed out after {timeout} seconds")
+            return TIMEOUT_EXIT_CODE
+        except (OSError, asyncio.IncompleteReadError) as e:
+            _append_output(log_path, logfile, f"{e}\n")
+            return DAEMON_ERROR_EXIT_CODE
+        finally:
+            try:
+                await delete_container_async(container_id)
+            except (OSError, asyncio.IncompleteReadError):
+                pass
+
+async def exec_container_async(container_id, command, log_path=None, logfile=None, prefix=None, tty=False, timeout=None):
+    """
+    Run a command inside a running container through the Docker Engine API, as docker exec would,
+    reading its output as it is produced. When it exceeds its timeout or is cancelled, the container is removed.
+
+    Parameters:
+    - container_id (str): The ID of the container.
+    - command (list): The command.
+    - log_path (str): The path of the log file of the output (overwritten), or None.
+    - logfile (file object): Text file where the output is also appended, or None.
+    - prefix (str): The name printed before the output lines in the live view, or None to hide them.
+    - tty (bool): Whether to allocate a pseudo-terminal.
+    - timeout (float): Seconds after which the command is stopped, or None.
+
+    Returns:
+    - int: The exit code of the command, TIMEOUT_EXIT_CODE if it timed out or DAEMON_ERROR_EXIT_CODE if it could not run.
+    """
+    if _interrupted:
+        raise asyncio.CancelledError()
+    _track_command_task()
+
+    async with _get_semaphore():
+        output = asyncio.StreamReader()
+
+        async def communicate():
+            exec_id = await create_exec_async(container_id, command, tty)
+            pump = asyncio.ensure_future(_pump_output(output, log_path, logfile, prefix))
+            try:
+                await start_exec_async(exec_id, tty, output.feed_data)
+            finally:
+                output.feed_eof()
+                await pump
+            return await inspect_exec_async(exec_id)
+
+        async def remove():
+            try:
+                await delete_container_async(container_id)
+            except (OSError, asyncio.IncompleteReadError):
+                pass
+
+        try:
+            return await asyncio.wait_for(communicate(), timeout)
+        except asyncio.TimeoutError:
+            print(f">> {prefix or container_id[:12]} timed out after {timeout} seconds")
+            await remove()
+            return TIMEOUT_EXIT_CODE
+        except asyncio.CancelledError:
+            await remove()
+            raise
+        except (OSError, asyncio.IncompleteReadError) as e:
+            _append_output(log_path, logfile, f"{e}\n")
+            return DAEMON_ERROR_EXIT_CODE
+
+async def _start_container_async(name, image_name, command, working_dir=None, binds=None, env=None, privileged=False):
+    """
+    Create and start a container in the background through the Docker Engine API.
+
+    Parameters:
+    - name (str): The name of the container, or None for a random one.
+    - image_name (str): The name of the image.
+    - command (list): The command of the container.
+    - working_dir (str): The working directory, or None for the one of the image.
+    - binds (list): The volumes, as "host path:container path", or None.
+    - env (dict): The environment variables of the container, or None.
+    - privileged (bool): Whether to give extended privileges to the container.
+
+    Returns:
+    - str: The ID of the container.
+    """
+    if _interrupted:
+        raise asyncio.CancelledError()
+    _track_command_task()
+
+    async with _get_semaphore():
+        container_id = await create_container_async(name, image_name, command, working_dir, binds, env, False, privileged)
+        try:
+            await start_container_async(container_id)
+        except BaseException:
+            await delete_container_async(container_id)
+            raise
+        return container_id
+
+async def _build_image_async(image_name, dockerfile, context_dir=None, build_args=None, logfile=None):
+    """
+    Build an image through the Docker Engine API, streaming its build context.
+
+    Parameters:
+    - image_name (str): The name of the image.
+    - dockerfile (str): The path of the Dockerfile.
+    - context_dir (str): The directory of the build context, or None for a context with the Dockerfile alone.
+    - build_args (dict): The build arguments, or None.
+    - logfile (file object): Text file where the build output is appended, or None.
+
+    Returns:
+    - int: 0 if the image was built, 1 otherwise.
+    """
+    if _interrupted:
+        raise asyncio.CancelledError()
+    _track_command_task()
+
+    async with _get_semaphore():
+        with make_build_context(dockerfile, context_dir) as context:
+            try:
+                error = await build_image_async(image_name, context, build_args, logfile.write if logfile is not None else None)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                error = str(e)
+                _append_output(None, logfile, f"{error}\n")
+        if logfile is not None:
+            logfile.flush()
+        return 0 if error is None else 1
+
+def _run_sync(coroutine):
+    """
+    Run a coroutine on the event loop of the engine and wait for its result.
+    When the caller is interrupted, the coroutine is cancelled and given some time to clean up.
+
+    Parameters:
+    - coroutine (coroutine): The coroutine.
+
+    Returns:
+    - The result of the coroutine.
+    """
+    future = asyncio.run_coroutine_threadsafe(coroutine, _get_loop())
+    try:
+        return future.result()
+    except KeyboardInterrupt:
+        future.cancel()
+        try:
+            future.result(CANCEL_GRACE_SECONDS)
+        except BaseException:
+            pass
+        raise
+    except concurrent.futures.CancelledError:
+        raise KeyboardInterrupt()
+
+def run_command(args, log_path=None, logfile=None, prefix=None, env=None, timeout=None, container=None):
+    """
+    Synchronous version of run_command_async.
+
+    Parameters:
+    - args (list): The command line.
+    - log_path (str): The path of the log file of the output (overwritten), or None.
+    - logfile (file object): Text file where the output is also appended, or None.
+    - prefix (str): The name printed before the output lines in the live view, or None to hide them.
+    - env (dict): The environment of the process, or None to inherit it.
+    - timeout (float): Seconds after which the command is stopped, or None.
+    - container (str): The name of the container started by the command, removed when it is stopped.
+
+    Returns:
+    - int: The exit code of the command, or TIMEOUT_EXIT_CODE if it timed out.
+    """
+    return _run_sync(run_command_async(args, log_path, logfile, prefix, env, timeout, container))
+
+def capture_command(args, env=None, timeout=None):
+    """
+    Synchronous version of capture_command_async.
+
+    Parameters:
+    - args (list): The command line.
+    - env (dict): The environment of the process, or None to inherit it.
+    - timeout (float): Seconds after which the command is stopped, or None.
+
+    Returns:
+    - tuple: The exit code, the stdout and the stderr of the command.
+    """
+    return _run_sync(capture_command_async(args, env, timeout))
+
+def remove_container(container, env=None):
+    """
+    Stop and remove a container, even after an interruption.
+
+    Parameters:
+    - container (str): The name or ID of the container.
+    - env (dict): The environment of the docker command (which selects the Docker host), or None to inherit it.
+    """
+    asyncio.run_coroutine_threadsafe(_remove_container_async(container, env), _get_loop()).result(CANCEL_GRACE_SECONDS)
+
+def set_engine_api(enabled):
+    """
+    Choose whether the containers, the commands run inside them, the image listings and the image builds
+    of the local Docker daemon go through the Docker Engine API on the Docker socket, when it answers,
+    or through the docker CLI.
+
+    Parameters:
+    - enabled (bool): Whether to use the Docker Engine API.
+    """
+    global _engine_api
+    with _engine_api_lock:
+        _engine_api = None if enabled else False
+
+def use_engine_api():
+    """
+    Check whether the Docker Engine API is used, probing the Docker socket on first use.
+    It is not used when DOCKER_HOST or DOCKER_CONTEXT select another daemon.
+
+    Returns:
+    - bool: True if the Docker Engine API is used, False to fall back to the docker CLI.
+    """
+    global _engine_api
+    with _engine_api_lock:
+        if _engine_api is None:
+            _engine_api = 'DOCKER_HOST' not in os.environ and 'DOCKER_CONTEXT' not in os.environ and _run_sync(ping_async())
+        return _engine_api
+
+def run_container(name, image_name, command, log_path=None, logfile=None, prefix=None, working_dir=None, binds=None, env=None, tty=False, privileged=False, timeout=None):
+    """
+    Synchronous version of run_container_async.
+
+    Parameters:
+    - name (str): The name of the container.
+    - image_name (str): The name of the image.
+    - command (list): The command of the container.
+    - log_path (str): The path of the log file of the output (overwritten), or None.
+    - logfile (file object): Text file where the output is also appended, or None.
+    - prefix (str): The name printed before the output lines in the live view, or None to hide them.
+    - working_dir (str): The working directory, or None for the one of the image.
+    - binds (list): The volumes, as "host path:container path", or None.
+    - env (dict): The environment variables of the container, or None.
+    - tty (bool): Whether to allocate a pseudo-terminal.
+    - privileged (bool): Whether to give extended privileges to the container.
+    - timeout (float): Seconds after which the container is stopped, or None.
+
+    Returns:
+    - int: The exit code of the container, TIMEOUT_EXIT_CODE if it timed out or DAEMON_ERROR_EXIT_CODE if it could not run.
+    """
+    return _run_sync(run_container_async(name, image_name, command, log_path, logfile, prefix, working_dir, binds, env, tty, privileged, timeout))
+
+def exec_container(container_id, command, log_path=None, logfile=None, prefix=None, tty=False, timeout=None):
+    """
+    Synchronous version of exec_container_async.
+
+    Parameters:
+    - container_id (str): The ID of the container.
+    - command (list): The command.
+    - log_path (str): The path of the log file of the output (overwritten), or None.
+    - logfile (file object): Text file where the output is also appended, or None.
+    - prefix (str): The name printed before the output lines in the live view, or None to hide them.
+    - tty (bool): Whether to allocate a pseudo-terminal.
+    - timeout (float): Seconds after which the command is stopped, or None.
+
+    Returns:
+    - int: The exit code of the command, TIMEOUT_EXIT_CODE if it timed out or DAEMON_ERROR_EXIT_CODE if it could not run.
+    """
+    return _run_sync(exec_container_async(container_id, command, log_path, logfile, prefix, tty, timeout))
+
+def start_container(name, image_name, command, working_dir=None, binds=None, env=None, privileged=False):
+    """
+    Create and start a container in the background through the Docker Engine API.
+
+    Parameters:
+    - name (str): The name of the container, or None for a random one.
+    - image_name (str): The name of the image.
+    - command (list): The command of the container.
+    - working_dir (str): The working directory, or None for the one of the image.
+    - binds (list): The volumes, as "host path:container path", or None.
+    - env (dict): The environment variables of the container, or None.
+    - privileged (bool): Whether to give extended privileges to the container.
+
+    Returns:
+    - str: The ID of the container.
+
+    Raises:
+    - OSError: If the container could not be started.
+    """
+    return _run_sync(_start_container_async(name, image_name, command, working_dir, binds, env, privileged))
+
+def build_image(image_name, dockerfile, context_dir=None, build_args=None, logfile=None):
+    """
+    Build an image through the Docker Engine API, with its classic builder (the Dockerfile cannot use RUN --mount).
+
+    Parameters:
+    - image_name (str): The name of the image.
+    - dockerfile (str): The path of the Dockerfile.
+    - context_dir (str): The directory of the build context, or None for a context with the Dockerfile alone.
+    - build_args (dict): The build arguments, or None.
+    - logfile (file object): Text file where the build output is appended, or None.
+
+    Returns:
+    - int: 0 if the image was built, 1 otherwise.
+    """
+    return _run_sync(_build_image_async(image_name, dockerfile, context_dir, build_args, logfile))
+
+def list_images():
+    """
+    List the local images through the Docker Engine API.
+
+    Returns:
+    - list: The images (see docker_api.list_images_async).
+
+    Raises:
+    - OSError: If the images could not be listed.
+    """
+    return _run_sync(list_images_async())
+
+def inspect_image(image_name):
+    """
+    Inspect a local image through the Docker Engine API.
+
+    Parameters:
+    - image_name (str): The name of the image.
+
+    Returns:
+    - dict: The image (see docker_api.inspect_image_async), or None if it does not exist.
+
+    Raises:
+    - OSError: If the image could not be inspected.
+    """
+    return _run_sync(inspect_image_async(image_name))
+
+def close_api_connections():
+    """
+    Close the idle connections to the Docker socket.
+    """
+    if _loop is not None:
+        asyncio.run_coroutine_threadsafe(_close_connections_async(), _loop).result(CANCEL_GRACE_SECONDS)
+
+async def _close_connections_async():
+    """
+    Close the idle connections to the Docker socket on the event loop.
+    """
+    close_connections()
+
+def cancel_all():
+    """
+    Cancel every running docker command, stopping its container, and refuse new ones.
+    """
+    global _interrupted
+    _interrupted = True
+    loop = _loop
+    if loop is None:
+        return
+
+    def cancel_tasks():
+        for task in list(_command_tasks):
+            task.cancel()
+    loop.call_soon_threadsafe(cancel_tasks)
+
+def install_interrupt_handler():
+    """
+    Make Ctrl-C cancel the running docker commands and stop their containers before
+    raising KeyboardInterrupt in the main thread.
+    """
+    def handle_interrupt(signum, frame):
+        print("\n>> Interrupted, stopping the running containers")
+        cancel_all()
+        raise KeyboardInterrupt()
+    signal.signal(signal.SIGINT, handle_interrupt)
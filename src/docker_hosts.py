@@ -0,0 +1,183 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+
+import os
+import shlex
+import threading
+from docker_image_inventory import get_image
+from docker_engine import run_command, capture_command
+
+# Name of the Docker daemon of the pookie container, whose containers mount the workspace directly
+LOCAL_HOST = 'local'
+
+_hosts = []
+_free_slots = {}
+_hosts_condition = threading.Condition()
+_synced_images = set()
+_image_locks = {}
+_image_locks_lock = threading.Lock()
+
+def parse_docker_host(spec):
+    """
+    Parse a Docker host given as ENDPOINT[=SLOTS], where ENDPOINT is 'local' (the Docker daemon of the
+    pookie container), a DOCKER_HOST URL (e.g. tcp://127.0.0.1:23751 or ssh://user@builder) or the name
+    of a Docker context.
+
+    Parameters:
+    - spec (str): The Docker host.
+
+    Returns:
+    - dict: The host, with the keys 'name', 'slots' and 'env' (the environment of the docker commands
+      run on it, None for the local host).
+    """
+    name, separator, slots = spec.rpartition('=')
+    if not separator or not slots.isdigit():
+        name, slots = spec, '1'
+    if not name or int(slots) < 1:
+        raise ValueError(f"Invalid Docker host {spec}, expected ENDPOINT[=SLOTS] with at least 1 slot")
+
+    if name == LOCAL_HOST:
+        env = None
+    elif '://' in name:
+        env = dict(os.environ, DOCKER_HOST=name)
+        env.pop('DOCKER_CONTEXT', None)
+    else:
+        env = dict(os.environ, DOCKER_CONTEXT=name)
+        env.pop('DOCKER_HOST', None)
+    return {'name': name, 'slots': int(slots), 'env': env}
+
+def set_docker_hosts(hosts):
+    """
+    Set the Docker hosts the jobs are distributed across, all their slots being free.
+
+    Parameters:
+    - hosts (list): The hosts returned by parse_docker_host.
+    """
+    global _hosts
+    with _hosts_condition:
+        _hosts = list(hosts)
+        _free_slots.clear()
+        _free_slots.update({host['name']: host['slots'] for host in _hosts})
+    with _image_locks_lock:
+        _synced_images.clear()
+        _image_locks.clear()
+
+def is_remote_host(host):
+    """
+    Check whether a Docker host is not the Docker daemon of the pookie container,
+    so that its containers cannot mount the workspace.
+
+    Parameters:
+    - host (dict): The host returned by parse_docker_host, or None.
+
+    Returns:
+    - bool: True if the host is remote.
+    """
+    return host is not None and host['name'] != LOCAL_HOST
+
+def acquire_docker_host(preferred=None):
+    """
+    Take a free slot on a Docker host, waiting for one when they are all taken.
+
+    Parameters:
+    - preferred (dict): The host to use when it has a free slot (e.g. the one that built the wheels to test), or None.
+
+    Returns:
+    - dict: The host, whose slot is given back with release_docker_host.
+    """
+    with _hosts_condition:
+        while True:
+            if preferred is not None and _free_slots.get(preferred['name'], 0) > 0:
+                host = preferred
+                break
+            free = [host for host in _hosts if _free_slots[host['name']] > 0]
+            if free:
+                # the host with the most free slots, the first given on a tie
+                host = max(free, key=lambda host: _free_slots[host['name']])
+                break
+            _hosts_condition.wait()
+        _free_slots[host['name']] -= 1
+        return host
+
+def release_docker_host(host):
+    """
+    Give back a slot taken with acquire_docker_host.
+
+    Parameters:
+    - host (dict): The host.
+    """
+    with _hosts_condition:
+        _free_slots[host['name']] += 1
+        _hosts_condition.notify()
+
+def get_remote_image_id(host, image_name):
+    """
+    Get the ID of an image on a Docker host.
+
+    Parameters:
+    - host (dict): The host returned by parse_docker_host.
+    - image_name (str): The name of the Docker image.
+
+    Returns:
+    - str: The ID of the image, or None if it does not exist on the host.
+    """
+    returncode, stdout, stderr = capture_command(['docker', 'image', 'inspect', '--format', '{{.Id}}', image_name], env=host['env'])
+    if returncode != 0:
+        return None
+    return stdout.strip()
+
+def sync_image(host, image_name, log_path):
+    """
+    Make sure a Docker host has the same image as the local Docker daemon, streaming it with
+    'docker save' into 'docker load' on the host when it is missing or differs. Only the first job
+    needing an image on a host transfers it, the others wait for it.
+
+    Parameters:
+    - host (dict): The host returned by parse_docker_host.
+    - image_name (str): The name of the Docker image.
+    - log_path (str): The path of the log file of the transfer.
+
+    Returns:
+    - bool: True if the image is on the host.
+    """
+    key = (host['name'], image_name)
+    with _image_locks_lock:
+        lock = _image_locks.setdefault(key, threading.Lock())
+
+    with lock:
+        if key in _synced_images:
+            return True
+        image = get_image(image_name)
+        if image is None:
+            print(f">> {image_name} does not exist locally, it cannot be sent to {host['name']}")
+            return False
+
+        # the inventory lists the short IDs
+        remote_id = get_remote_image_id(host, image_name)
+        if remote_id is None or not remote_id.split(':')[-1].startswith(image['id']):
+            print(f">> Sending {image_name} to {host['name']}")
+            returncode = run_command([
+                'bash', '-c',
+                f"set -o pipefail; env -u DOCKER_HOST -u DOCKER_CONTEXT docker save {shlex.quote(image_name)} | docker load"
+            ], log_path, env=host['env'])
+            if returncode != 0:
+                print(f">> Failed to send {image_name} to {host['name']}, see {log_path}")
+                return False
+        _synced_images.add(key)
+        return True
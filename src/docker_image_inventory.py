@@ -0,0 +1,210 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import calendar
+import re
+import threading
+import time
+from trace_events import trace_span
+from docker_engine import capture_command, use_engine_api, list_images, inspect_image
+
+INVENTORY_FORMAT = '{{.Repository}}:{{.Tag}}\t{{.ID}}\t{{.CreatedAt}}\t{{.Size}}'
+
+SIZE_UNITS = {
+    'B': 1,
+    'kB': 1000,
+    'KB': 1000,
+    'MB': 1000 ** 2,
+    'GB': 1000 ** 3,
+    'TB': 1000 ** 4
+}
+
+_inventory = None
+_inventory_lock = threading.Lock()
+
+def normalize_image_name(image_name):
+    """
+    Add the default 'latest' tag to an image name without tag.
+
+    Parameters:
+    - image_name (str): The name of the Docker image.
+
+    Returns:
+    - str: The image name with its tag (e.g., "manylinux-lvl1-base:latest").
+    """
+    if ':' in image_name.rsplit('/', 1)[-1]:
+        return image_name
+    return f"{image_name}:latest"
+
+def parse_size(size):
+    """
+    Convert a size printed by the docker CLI (e.g., "1.2GB") into bytes.
+
+    Parameters:
+    - size (str): The human readable size.
+
+    Returns:
+    - int: The size in bytes, or 0 if it cannot be parsed.
+    """
+    match = re.match(r'^\s*([\d.]+)\s*([kKMGT]?B)\s*$', size)
+    if not match:
+        return 0
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+def parse_image_inventory(output):
+    """
+    Parse the output of 'docker images' printed with INVENTORY_FORMAT.
+
+    Parameters:
+    - output (str): The output of the docker CLI.
+
+    Returns:
+    - dict: Mapping of image name (with tag) to a dictionary with the keys 'id', 'created' and 'size' (bytes).
+    """
+    inventory = {}
+    for line in output.splitlines():
+        fields = line.split('\t')
+        if len(fields) != 4:
+            continue
+        name, image_id, created, size = fields
+        if '<none>' in name:
+            continue
+        inventory[name] = {
+            'id': image_id,
+            'created': created,
+            'size': parse_size(size)
+        }
+    return inventory
+
+def format_created(created):
+    """
+    Convert the creation time of an image given by the Docker Engine API, in seconds since the epoch
+    or as an RFC 3339 date (e.g., "2025-01-01T10:00:00.123456789Z"), into the format printed by the docker CLI.
+
+    Parameters:
+    - created (int or str): The creation time.
+
+    Returns:
+    - str: The creation date (e.g., "2025-01-01 10:00:00 +0000 UTC").
+    """
+    if isinstance(created, str):
+        try:
+            created = calendar.timegm(time.strptime(created[:19], '%Y-%m-%dT%H:%M:%S'))
+        except ValueError:
+            created = 0
+    return time.strftime('%Y-%m-%d %H:%M:%S +0000 UTC', time.gmtime(created))
+
+def parse_api_images(images):
+    """
+    Convert the images listed or inspected through the Docker Engine API into inventory entries.
+
+    Parameters:
+    - images (list): The images (see docker_api.list_images_async).
+
+    Returns:
+    - dict: The image inventory (see parse_image_inventory), with the short image IDs the docker CLI prints.
+    """
+    inventory = {}
+    for image in images:
+        for name in image.get('RepoTags') or []:
+            if '<none>' in name:
+                continue
+            inventory[name] = {
+                'id': image['Id'].split(':')[-1][:12],
+                'created': format_created(image['Created']),
+                'size': image['Size']
+            }
+    return inventory
+
+def load_image_inventory(refresh=False):
+    """
+    List every local Docker image with a single 'docker images' call (or Docker Engine API request) and keep the result in memory.
+    Later calls return the cached inventory unless refresh is True.
+
+    Parameters:
+    - refresh (bool): Whether to list the images again.
+
+    Returns:
+    - dict: The image inventory (see parse_image_inventory).
+    """
+    global _inventory
+    with _inventory_lock:
+        if _inventory is None or refresh:
+            with trace_span('docker images'):
+                _inventory = None
+                if use_engine_api():
+                    try:
+                        _inventory = parse_api_images(list_images())
+                    except OSError as e:
+                        print(f"Failed to list the images through the Docker Engine API, using the docker CLI: {e}")
+                if _inventory is None:
+                    returncode, stdout, stderr = capture_command([
+                        'docker',
+                            'images',
+                            '--format',
+                                INVENTORY_FORMAT])
+                    _inventory = parse_image_inventory(stdout)
+        return _inventory
+
+def get_image(image_name):
+    """
+    Look up an image in the inventory.
+
+    Parameters:
+    - image_name (str): The name of the Docker image.
+
+    Returns:
+    - dict: The inventory entry of the image, or None if it does not exist.
+    """
+    return load_image_inventory().get(normalize_image_name(image_name))
+
+def add_image(image_name):
+    """
+    Add a freshly built image to the inventory.
+
+    Parameters:
+    - image_name (str): The name of the Docker image.
+    """
+    entries = None
+    if use_engine_api():
+        try:
+            image = inspect_image(image_name)
+            entries = parse_api_images([image] if image is not None else [])
+        except OSError:
+            pass
+    if entries is None:
+        returncode, stdout, stderr = capture_command([
+            'docker',
+                'images',
+                '--format',
+                    INVENTORY_FORMAT,
+                image_name])
+        entries = parse_image_inventory(stdout)
+    inventory = load_image_inventory()
+    with _inventory_lock:
+        inventory.update(entries)
+
+def remove_image(image_name):
+    """
+    Remove an image from the inventory.
+
+    Parameters:
+    - image_name (str): The name of the Docker image.
+    """
+    inventory = load_image_inventory()
+    with _inventory_lock:
+        inventory.pop(normalize_image_name(image_name), None)
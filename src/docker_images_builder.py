@@ -15,11 +15,62 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
-import subprocess
+import os
+import shutil
+from job_scheduler import run_job_graph
+from python_version_fetcher import get_cross_python_url
+from tarball_cache import DEFAULT_MAX_CACHE_BYTES, fetch_tarball, evict_tarballs, prepare_build_context
+from docker_image_inventory import load_image_inventory, get_image, add_image
+from log_streamer import LOGS_DIR
+from trace_events import trace_span
+from docker_engine import run_command, use_engine_api, build_image
+from non_native_modes import NON_NATIVE_TARGETS
+
+# Docker layer graph: tree, level 1 image and level 2 image of every target.
+# The level 1 image of win-macosx-pookie is the base of the pookie image itself,
+# so it is always present and is not part of the graph.
+TARGET_IMAGES = {
+    'manylinux_2_17_x86_64': ('manylinux', 'manylinux-lvl1-base', 'manylinux-lvl2-gnu-gcc-clang'),
+    'manylinux_2_17_aarch64': ('manylinux', 'manylinux-lvl1-base', 'manylinux-lvl2-gcc-aarch64-linux-gnu'),
+    'manylinux_2_17_armv7l': ('manylinux', 'manylinux-lvl1-base', 'manylinux-lvl2-gcc-arm-linux-gnueabihf'),
+    'manylinux_2_17_ppc64le': ('manylinux', 'manylinux-lvl1-base', 'manylinux-lvl2-gcc-powerpc64le-linux-gnu'),
+    'manylinux_2_17_s390x': ('manylinux', 'manylinux-lvl1-base', 'manylinux-lvl2-gcc-s390x-linux-gnu'),
+    'musllinux_1_2_x86_64': ('musllinux', 'musllinux-lvl1-base', 'musllinux-lvl2-musl-gcc-clang'),
+    'win_amd64': ('win-macosx-pookie', None, 'win-macosx-pookie-lvl2-msvc-mingw64'),
+    'macosx_11_0_x86_64': ('win-macosx-pookie', None, 'win-macosx-pookie-lvl2-osxcross'),
+    'macosx_11_0_arm64': ('win-macosx-pookie', None, 'win-macosx-pookie-lvl2-osxcross')
+}
+
+# Targets whose level 3 image also needs the x86_64 linux Python for cross-compilation
+CROSS_PYTHON_TARGETS = [
+    'manylinux_2_17_aarch64',
+    'manylinux_2_17_armv7l',
+    'manylinux_2_17_ppc64le',
+    'manylinux_2_17_s390x',
+    'win_amd64',
+    'macosx_11_0_x86_64',
+    'macosx_11_0_arm64'
+]
+
+# Targets whose level 3 image copies the x86_64 linux Python with crossenv from the image
+# shared by every non-native manylinux target of the same Python version
+SHARED_CROSS_PYTHON_TARGETS = NON_NATIVE_TARGETS
+
+def get_cross_python_image_name(py_version_nodot):
+    """
+    Get the name of the image with the x86_64 linux Python and crossenv of a Python version.
+
+    Parameters:
+    - py_version_nodot (str): The Python version without dot (e.g., "312").
+
+    Returns:
+    - str: The image name (e.g., "manylinux-lvl3-cp312-cross-python").
+    """
+    return f"manylinux-lvl3-cp{py_version_nodot}-cross-python"
 
 def image_exists(image_name):
     """
-    Checks if a Docker image already exists.
+    Checks if a Docker image already exists, using the in-memory image inventory.
 
     Parameters:
     - image_name (str): The name of the Docker image to check.
@@ -27,278 +78,283 @@ def image_exists(image_name):
     Returns:
     - bool: True if the image exists, False otherwise.
     """
-    result = subprocess.run([
-        'docker',
-            'images',
-            '-q',
-                image_name],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
-    )
-    return bool(result.stdout.strip())
+    with trace_span('image_exists', image_name):
+        return get_image(image_name) is not None
 
 def build_lvl1_or_lvl2_image(tree, image_name, logfile):
     """
-    Build a level 1 or level 2 Docker image.
+    Build a level 1 or level 2 Docker image, through the Docker Engine API when it is used (see docker_engine.use_engine_api).
 
     Parameters:
     - tree (str): The tree from the Docker layer graph.
     - image_name (str): The specific image name to build.
     - logfile (file object): File object to log the output of the build process.
+
+    Returns:
+    - bool: True if the image exists after the call, False if the build failed.
     """
-    if not image_exists(image_name):
-        subprocess.run([
-            'docker',
-                'build',
-                '-f',
-                    f'/images/{tree}/Dockerfile.{image_name}',
-                '-t',
-                    image_name,
-                '.'
-        ], stdout=logfile, stderr=logfile)
-
-def build_lvl3_image(tree, general_image_name, image_name, python_url, logfile):
+    if image_exists(image_name):
+        return True
+
+    with trace_span('docker build', image_name):
+        if use_engine_api():
+            # the level 1 and 2 Dockerfiles copy nothing from the build context
+            returncode = build_image(image_name, f'/images/{tree}/Dockerfile.{image_name}', logfile=logfile)
+        else:
+            returncode = run_command([
+                'docker',
+                    'build',
+                    '-f',
+                        f'/images/{tree}/Dockerfile.{image_name}',
+                    '-t',
+                        image_name,
+                    '.'
+            ], logfile=logfile)
+
+    if returncode != 0:
+        return False
+    add_image(image_name)
+    return True
+
+def build_lvl3_image(tree, general_image_name, image_name, python_url, logfile, context_dir='.', build_args=None):
     """
-    Build a level 3 CP3xx Docker image.
+    Build a level 3 CP3xx Docker image, through the Docker Engine API when it is used (see docker_engine.use_engine_api),
+    streaming the build context with the Python tarballs, which its Dockerfile extracts with ADD.
 
     Parameters:
     - tree (str): The tree from the Docker layer graph.
     - general_image_name (str): The image name.
     - image_name (str): The specific image name to build.
-    - python_file (str): The Python file downloaded quith python_url.
     - python_url (str): The URL for the Python source.
     - logfile (file object): File object to log the output of the build process.
+    - context_dir (str): The build context, which provides the python.tar.gz and python_cross.tar.gz files.
+    - build_args (dict): Other build arguments of the Dockerfile, or None.
+
+    Returns:
+    - bool: True if the image exists after the call, False if the build failed.
     """
-    if not image_exists(image_name):
-        subprocess.run([
-            'docker',
-                'build',
-                '-f',
-                    f'/images/{tree}/Dockerfile.{general_image_name}',
-                '-t',
-                    image_name,
-                '--build-arg',
-                    f'PYTHON_URL={python_url}',
-                '.'
-        ], stdout=logfile, stderr=logfile)
-
-def build_docker_images(targets, logfile, python_versions_dic):
+    if image_exists(image_name):
+        return True
+
+    with trace_span('docker build', image_name):
+        if use_engine_api():
+            returncode = build_image(image_name, f'/images/{tree}/Dockerfile.{general_image_name}', context_dir,
+                                     {'PYTHON_URL': python_url, **(build_args or {})}, logfile)
+        else:
+            returncode = run_command([
+                'docker',
+                    'build',
+                    '-f',
+                        f'/images/{tree}/Dockerfile.{general_image_name}',
+                    '-t',
+                        image_name,
+                    '--build-arg',
+                        f'PYTHON_URL={python_url}'
+            ] + [
+                arg
+                for name, value in (build_args or {}).items()
+                for arg in ('--build-arg', f'{name}={value}')
+            ] + [
+                context_dir
+            ], logfile=logfile)
+
+    if returncode != 0:
+        return False
+    add_image(image_name)
+    return True
+
+def build_lvl3_image_from_cache(image_name, image, logfile, cache_dir):
     """
-    Build Docker images for the specified targets.
+    Build a level 3 CP3xx Docker image feeding it the Python tarballs from the tarball cache.
 
     Parameters:
-    - targets (list): List of target architectures to build images for.
+    - image_name (str): The specific image name to build.
+    - image (dict): The node of the image in the Docker layer graph.
     - logfile (file object): File object to log the output of the build process.
-    - python_versions_dic (dict): Dictionary containing Python versions and their URLs.
-    """
-    for target in targets:
-
-        if target == 'manylinux_2_17_x86_64':
-            print(f">> Creating docker images for {target}")
-            tree = "manylinux"
-
-            # level 1
-            image_name = "manylinux-lvl1-base"
-            build_lvl1_or_lvl2_image(tree, image_name, logfile)
-
-            # level 2
-            image_name = "manylinux-lvl2-gnu-gcc-clang"
-            build_lvl1_or_lvl2_image(tree, image_name, logfile)
-
-            # level 3
-            for minor, target_data in python_versions_dic.items():
-
-                general_image_name = "manylinux-lvl3-cp3xx-manylinux_2_17_x86_64"
-
-                py_version_nodot = '3' + minor
-                image_name = f"manylinux-lvl3-cp{py_version_nodot}-manylinux_2_17_x86_64"
-
-                python_url = target_data[target]["url"]
-
-                build_lvl3_image(tree, general_image_name, image_name, python_url, logfile)
-
-        if target == 'manylinux_2_17_aarch64':
-            print(f">> Creating docker images for {target}")
-            tree = "manylinux"
-
-            # level 1
-            image_name = "manylinux-lvl1-base"
-            build_lvl1_or_lvl2_image(tree, image_name, logfile)
-
-            # level 2
-            image_name = "manylinux-lvl2-gcc-aarch64-linux-gnu"
-            build_lvl1_or_lvl2_image(tree, image_name, logfile)
-
-            # level 3
-            for minor, target_data in python_versions_dic.items():
-                general_image_name = "manylinux-lvl3-cp3xx-manylinux_2_17_aarch64"
-
-                py_version_nodot = '3' + minor
-                image_name = f"manylinux-lvl3-cp{py_version_nodot}-manylinux_2_17_aarch64"
-
-                python_url = target_data[target]["url"]
-
-                build_lvl3_image(tree, general_image_name, image_name, python_url, logfile)
-
-        if target == "manylinux_2_17_armv7l":
-            print(f">> Creating docker images for {target}")
-            tree = "manylinux"
-
-            # level 1
-            image_name = "manylinux-lvl1-base"
-            build_lvl1_or_lvl2_image(tree, image_name, logfile)
-
-            # level 2
-            image_name = "manylinux-lvl2-gcc-arm-linux-gnueabihf"
-            build_lvl1_or_lvl2_image(tree, image_name, logfile)
-
-            # level 3
-            for minor, target_data in python_versions_dic.items():
-                general_image_name = "manylinux-lvl3-cp3xx-manylinux_2_17_armv7l"
-
-                py_version_nodot = '3' + minor
-                image_name = f"manylinux-lvl3-cp{py_version_nodot}-manylinux_2_17_armv7l"
-
-                python_url = target_data[target]["url"]
-
-                build_lvl3_image(tree, general_image_name, image_name, python_url, logfile)
-
-        if target == "manylinux_2_17_ppc64le":
-            print(f">> Creating docker images for {target}")
-            tree = "manylinux"
-
-            # level 1
-            image_name = "manylinux-lvl1-base"
-            build_lvl1_or_lvl2_image(tree, image_name, logfile)
-
-            # level 2
-            image_name = "manylinux-lvl2-gcc-powerpc64le-linux-gnu"
-            build_lvl1_or_lvl2_image(tree, image_name, logfile)
-
-            # level 3
-            for minor, target_data in python_versions_dic.items():
-                general_image_name = "manylinux-lvl3-cp3xx-manylinux_2_17_ppc64le"
-
-                py_version_nodot = '3' + minor
-                image_name = f"manylinux-lvl3-cp{py_version_nodot}-manylinux_2_17_ppc64le"
-
-                python_url = target_data[target]["url"]
-
-                build_lvl3_image(tree, general_image_name, image_name, python_url, logfile)
-
-        if target == "manylinux_2_17_s390x":
-            print(f">> Creating docker images for {target}")
-            tree = "manylinux"
-
-            # level 1
-            image_name = "manylinux-lvl1-base"
-            build_lvl1_or_lvl2_image(tree, image_name, logfile)
-
-            # level 2
-            image_name = "manylinux-lvl2-gcc-s390x-linux-gnu"
-            build_lvl1_or_lvl2_image(tree, image_name, logfile)
-
-            # level 3
-            for minor, target_data in python_versions_dic.items():
-                general_image_name = "manylinux-lvl3-cp3xx-manylinux_2_17_s390x"
+    - cache_dir (str): The pookie cache directory.
 
-                py_version_nodot = '3' + minor
-                image_name = f"manylinux-lvl3-cp{py_version_nodot}-manylinux_2_17_s390x"
-
-                python_url = target_data[target]["url"]
-
-                build_lvl3_image(tree, general_image_name, image_name, python_url, logfile)
-
-        if target == 'musllinux_1_2_x86_64':
-            print(f">> Creating docker images for {target}")
-            tree = "musllinux"
-
-            # level 1
-            image_name = "musllinux-lvl1-base"
-            build_lvl1_or_lvl2_image(tree, image_name, logfile)
-
-            # level 2
-            image_name = "musllinux-lvl2-musl-gcc-clang"
-            build_lvl1_or_lvl2_image(tree, image_name, logfile)
-
-            # level 3
-            for minor, target_data in python_versions_dic.items():
-
-                general_image_name = "musllinux-lvl3-cp3xx-musllinux_1_2_x86_64"
-
-                py_version_nodot = '3' + minor
-                image_name = f"musllinux-lvl3-cp{py_version_nodot}-musllinux_1_2_x86_64"
-
-                python_url = target_data[target]["url"]
-
-                build_lvl3_image(tree, general_image_name, image_name, python_url, logfile)
-
-        if target == 'win_amd64':
-            print(f">> Creating docker images for {target}")
-            tree = "win-macosx-pookie"
-
-            # level 1
-            # (same base level as pookie so its created)
-
-            # level 2
-            image_name = "win-macosx-pookie-lvl2-msvc-mingw64"
-            build_lvl1_or_lvl2_image(tree, image_name, logfile)
-
-            # level 3
-            for minor, target_data in python_versions_dic.items():
-
-                general_image_name = "win-macosx-pookie-lvl3-cp3xx-win_amd64"
-
-                py_version_nodot = '3' + minor
-                image_name = f"win-macosx-pookie-lvl3-cp{py_version_nodot}-win_amd64"
-
-                python_url = target_data[target]["url"]
-
-                build_lvl3_image(tree, general_image_name, image_name, python_url, logfile)
-
-        if target == 'macosx_11_0_x86_64':
-            print(f">> Creating docker images for {target}")
-            tree = "win-macosx-pookie"
-
-            # level 1
-            # (same base level as pookie so its created)
-
-            # level 2
-            image_name = "win-macosx-pookie-lvl2-osxcross"
-            build_lvl1_or_lvl2_image(tree, image_name, logfile)
-
-            # level 3
-            for minor, target_data in python_versions_dic.items():
-
-                general_image_name = "win-macosx-pookie-lvl3-cp3xx-macosx_11_0_x86_64"
-
-                py_version_nodot = '3' + minor
-                image_name = f"win-macosx-pookie-lvl3-cp{py_version_nodot}-macosx_11_0_x86_64"
-
-                python_url = target_data[target]["url"]
-
-                build_lvl3_image(tree, general_image_name, image_name, python_url, logfile)
-
-        if target == 'macosx_11_0_arm64':
-            print(f">> Creating docker images for {target}")
-            tree = "win-macosx-pookie"
+    Returns:
+    - bool: True if the image exists after the call, False if the build failed.
+    """
+    if image_exists(image_name):
+        return True
+
+    with trace_span('tarball fetch', image_name):
+        files = {}
+        if 'python_url' in image:
+            files['python.tar.gz'] = fetch_tarball(image['python_url'], cache_dir, image['python_filename'], image['python_sha256'])
+        if 'python_cross_url' in image:
+            files['python_cross.tar.gz'] = fetch_tarball(image['python_cross_url'], cache_dir, image['python_cross_filename'], image['python_cross_sha256'])
+
+    build_args = {}
+    if 'cross_python_image' in image:
+        build_args['CROSS_PYTHON_IMAGE'] = image['cross_python_image']
+
+    context_dir = prepare_build_context(cache_dir, files)
+    try:
+        return build_lvl3_image(image['tree'], image['general_image_name'], image_name, image.get('python_url', image.get('python_cross_url')), logfile, context_dir, build_args)
+    finally:
+        shutil.rmtree(context_dir, ignore_errors=True)
+
+def get_image_graph(targets, python_versions_dic):
+    """
+    Generate the Docker layer graph (level 1 -> level 2 -> level 3) needed for the specified targets.
+    Images shared by several targets appear only once in the graph.
 
-            # level 1
-            # (same base level as pookie so its created)
+    Parameters:
+    - targets (list): List of target architectures to build images for.
+    - python_versions_dic (dict): Dictionary containing Python versions and their URLs.
 
-            # level 2
-            image_name = "win-macosx-pookie-lvl2-osxcross"
-            build_lvl1_or_lvl2_image(tree, image_name, logfile)
+    Returns:
+    - dict: Mapping of image name to a dictionary with the keys 'tree', 'level', 'parent'
+      (image name or None) and, only for level 3 images, 'general_image_name', 'python_url',
+      'python_filename', 'python_sha256' and, when cross-compilation needs the x86_64 linux
+      Python, 'python_cross_url', 'python_cross_filename' and 'python_cross_sha256'.
+      The non-native manylinux targets get the x86_64 linux Python from one image per Python version
+      (see get_cross_python_image_name), which only has the 'python_cross_*' keys, and name it
+      in 'cross_python_image' instead.
+    """
+    graph = {}
 
-            # level 3
-            for minor, target_data in python_versions_dic.items():
+    for target in targets:
+        tree, lvl1_image_name, lvl2_image_name = TARGET_IMAGES[target]
+
+        # level 1
+        if lvl1_image_name is not None:
+            graph[lvl1_image_name] = {
+                'tree': tree,
+                'level': 1,
+                'parent': None
+            }
+
+        # level 2
+        graph[lvl2_image_name] = {
+            'tree': tree,
+            'level': 2,
+            'parent': lvl1_image_name
+        }
+
+        # level 3
+        for minor, target_data in python_versions_dic.items():
+            py_version_nodot = '3' + minor
+            image = {
+                'tree': tree,
+                'level': 3,
+                'parent': lvl2_image_name,
+                'general_image_name': f"{tree}-lvl3-cp3xx-{target}",
+                'python_url': target_data[target]["url"],
+                'python_filename': target_data[target]["filename"],
+                'python_sha256': target_data[target].get("sha256")
+            }
+
+            if target in CROSS_PYTHON_TARGETS:
+                cross_image = {}
+                cross_image['python_cross_url'] = get_cross_python_url(target_data[target]["url"], target)
+                cross_image['python_cross_filename'] = get_cross_python_url(target_data[target]["filename"], target)
+                cross_data = target_data.get('manylinux_2_17_x86_64', {})
+                cross_image['python_cross_sha256'] = cross_data.get("sha256") if cross_data.get("filename") == cross_image['python_cross_filename'] else None
+
+                if target in SHARED_CROSS_PYTHON_TARGETS:
+                    cross_image_name = get_cross_python_image_name(py_version_nodot)
+                    graph.setdefault(cross_image_name, {
+                        'tree': tree,
+                        'level': 3,
+                        'parent': lvl1_image_name,
+                        'general_image_name': f"{tree}-lvl3-cp3xx-cross-python",
+                        **cross_image
+                    })
+                    image['cross_python_image'] = cross_image_name
+                else:
+                    image.update(cross_image)
+
+            graph[f"{tree}-lvl3-cp{py_version_nodot}-{target}"] = image
+
+    return graph
+
+def print_image_plan(targets, python_versions_dic):
+    """
+    Print which Docker images of the layer graph already exist and which would be built.
 
-                general_image_name = "win-macosx-pookie-lvl3-cp3xx-macosx_11_0_arm64"
+    Parameters:
+    - targets (list): List of target architectures.
+    - python_versions_dic (dict): Dictionary containing Python versions and their URLs.
 
-                py_version_nodot = '3' + minor
-                image_name = f"win-macosx-pookie-lvl3-cp{py_version_nodot}-macosx_11_0_arm64"
+    Returns:
+    - list: The names of the images that would be built.
+    """
+    graph = get_image_graph(targets, python_versions_dic)
+    load_image_inventory()
+    missing = [image_name for image_name in graph if get_image(image_name) is None]
+
+    print(f">> Plan: {len(graph) - len(missing)} of {len(graph)} docker images exist, {len(missing)} to build")
+    for image_name, image in graph.items():
+        deps = [dep for dep in (image['parent'], image.get('cross_python_image')) if dep is not None]
+        after = f" after {', '.join(deps)}" if deps and image_name in missing else ''
+        print(f"- {image_name}: {'build' if image_name in missing else 'exists'}{after}")
+    return missing
+
+def build_docker_images(targets, logfile, python_versions_dic, cache_dir, jobs=1, max_cache_bytes=DEFAULT_MAX_CACHE_BYTES):
+    """
+    Build Docker images for the specified targets.
+    Every image of the layer graph is built once, as soon as its parent image exists,
+    and sibling images are built in parallel when jobs is greater than 1.
 
-                python_url = target_data[target]["url"]
+    Parameters:
+    - targets (list): List of target architectures to build images for.
+    - logfile (file object): File object to log the output of the build process.
+    - python_versions_dic (dict): Dictionary containing Python versions and their URLs.
+    - cache_dir (str): The pookie cache directory, where Python tarballs are downloaded once.
+    - jobs (int): Maximum number of images built at the same time (default: 1).
+    - max_cache_bytes (int): Size cap of the Python tarball cache.
 
-                build_lvl3_image(tree, general_image_name, image_name, python_url, logfile)
\ No newline at end of file
+    Returns:
+    - dict: Mapping of image name to its status ('ok', 'failed' or 'skipped').
+    """
+    graph = get_image_graph(targets, python_versions_dic)
+
+    # list the local images once
+    load_image_inventory()
+
+    if jobs > 1:
+        os.makedirs(LOGS_DIR, exist_ok=True)
+
+    def make_build(image_name, image):
+        def build_image():
+            if jobs > 1:
+                image_logfile = open(os.path.join(LOGS_DIR, f"{image_name}.log"), 'a')
+            else:
+                image_logfile = logfile
+            try:
+                print(f">> Creating docker image {image_name}")
+                if image['level'] == 3:
+                    return build_lvl3_image_from_cache(image_name, image, image_logfile, cache_dir)
+                return build_lvl1_or_lvl2_image(image['tree'], image_name, image_logfile)
+            finally:
+                if jobs > 1:
+                    image_logfile.close()
+        return build_image
+
+    status = run_job_graph({
+        image_name: {
+            'func': make_build(image_name, image),
+            'deps': [
+                dep for dep in (image['parent'], image.get('cross_python_image'))
+                if dep is not None
+            ]
+        }
+        for image_name, image in graph.items()
+    }, jobs)
+
+    for image_name, image_status in status.items():
+        if image_status != 'ok':
+            print(f">> Docker image {image_name} was not created ({image_status})")
+
+    # keep the tarball cache under its size cap
+    evict_tarballs(cache_dir, max_cache_bytes, keep=[
+        image[key]
+        for image in graph.values()
+        for key in ('python_filename', 'python_cross_filename')
+        if key in image
+    ])
+
+    return status
@@ -15,7 +15,70 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
-import subprocess
+import fnmatch
+import glob
+import os
+import re
+import shutil
+import sqlite3
+import time
+import uuid
+import zipfile
+from job_scheduler import run_job_graph, get_critical_paths
+from docker_image_inventory import get_image
+from build_fingerprint import list_workspace_files, hash_workspace, compute_fingerprint, get_cached_wheels, record_wheels
+from trace_events import MARKS_FILE, trace_span, mark_phase, prepare_marks, collect_marks
+from log_streamer import LOGS_DIR, print_log, is_live_view_started
+from non_native_modes import NON_NATIVE_TARGETS, DEFAULT_MODE_TTL, MODES_FILE, select_modes, record_mode_results
+from wheel_retagger import retag_wheels
+from wheel_repair import repair_wheels
+from docker_engine import TIMEOUT_EXIT_CODE, run_command, capture_command, remove_container, use_engine_api, run_container, start_container, exec_container
+from job_costs import DURATIONS_FILE, load_job_durations, record_job_durations, estimate_job_costs, estimate_makespan
+from run_history import HISTORY_FILE, record_run
+from docker_hosts import set_docker_hosts, is_remote_host, acquire_docker_host, release_docker_host, sync_image
+
+POOKIE_DIR = '.pookie'
+JOBS_DIR = os.path.join(POOKIE_DIR, 'jobs')
+
+# Entries of the workspace root left out of the copied source files of the job workspaces
+# (bytecode caches are left out at every depth, the git directory is copied on its own)
+ROOT_IGNORE_PATTERNS = [os.path.basename(POOKIE_DIR), LOGS_DIR, 'pookie.log', 'dist', 'build', '*.egg-info', '.git']
+
+PIP_CACHE_DIR = 'pip'
+WHEELHOUSE_DIR = 'wheelhouse'
+WHEELHOUSE_MARKER = '.packages'
+PIP_CACHE_MOUNT = '/pookie-cache/pip'
+WHEELHOUSE_MOUNT = '/pookie-cache/wheelhouse'
+
+CCACHE_DIR = 'ccache'
+CCACHE_LOGS_DIR = 'logs'
+CCACHE_MOUNT = '/pookie-cache/ccache'
+CCACHE_BIN = '/tmp/pookie-ccache'
+
+# Compilers of every toolchain, wrapped with ccache by name (masquerade) so that
+# builds, cross environments and wrapper scripts resolve them through the cache
+CCACHE_COMPILERS = [
+    'cc', 'c++', 'gcc', 'g++', 'clang', 'clang++',
+    'aarch64-linux-gnu-gcc', 'aarch64-linux-gnu-g++',
+    'arm-linux-gnueabihf-gcc', 'arm-linux-gnueabihf-g++',
+    'powerpc64le-linux-gnu-gcc', 'powerpc64le-linux-gnu-g++',
+    's390x-linux-gnu-gcc', 's390x-linux-gnu-g++',
+    'x86_64-w64-mingw32-gcc', 'x86_64-w64-mingw32-g++',
+    'o64-clang', 'o64-clang++', 'oa64-clang', 'oa64-clang++'
+]
+
+# Targets whose tests run under QEMU or Wine, split into shards with --test-shards
+EMULATED_TEST_TARGETS = NON_NATIVE_TARGETS + ['win_amd64']
+
+# Keys of a level 3 job that depend on its non-native mode
+NON_NATIVE_MODE_KEYS = ['mode', 'build_command', 'repair', 'volumes', 'env', 'ccache_log', 'cache_commands']
+
+# Environment variables pointing the containers at the cache mounts (see add_pip_cache and add_compiler_cache)
+CACHE_ENV = ['PIP_CACHE_DIR', 'PIP_FIND_LINKS', 'CCACHE_DIR', 'CCACHE_LOGFILE', 'CCACHE_BASEDIR', 'CCACHE_NOHASHDIR', 'CCACHE_COMPILERCHECK']
+
+# Project files and settings that build the extension against the limited API (stable ABI)
+LIMITED_API_FILES = ['setup.py', 'setup.cfg', 'pyproject.toml', 'Cargo.toml']
+LIMITED_API_PATTERN = re.compile(r'py[_-]limited[_-]api["\']?\s*[=:]\s*["\']?cp3\d+|abi3-py3\d+')
 
 def wrapper(user_command, container_command):
     """
@@ -32,33 +95,53 @@ def wrapper(user_command, container_command):
     """
     return f'''mkdir -p /wrapper && echo -e "#!/bin/bash\n{container_command} "\\$@"" > /wrapper/{user_command} && chmod +x /wrapper/{user_command} && export PATH="/wrapper:$PATH" && '''
 
-def rename_dist(original_dist_target, new_dist_target):
+def install_dist(cp_version, dist_target, abi3=False):
     """
-    Generate the command to rename the built library files.
-    Place this command AFTER the build command.
+    Generate the command to install the built library.
+    Place this command BEFORE the test command.
 
     Parameters:
-    - original_target (str): The original target architecture.
-    - new_target (str): The new target architecture.
+    - cp_version (str): The CP version to use in the filename.
+    - target (str): The target architecture.
+    - abi3 (bool): Whether the library is a stable ABI wheel, built once for every Python version.
 
     Returns:
-    - str: The command to rename the built library files.
+    - str: The command to install the built library.
     """
-    return f''' && pip install auditwheel && python -m auditwheel repair dist/*-{original_dist_target}.whl --plat {new_dist_target} --only-plat -w dist && rm -f dist/*-{original_dist_target}.whl'''
+    if abi3:
+        return mark_phase('wheel install', f'''python3 -m pip install dist/*-abi3-{dist_target}.whl >> /dev/null 2>> /dev/null''') + ' && '
+    return mark_phase('wheel install', f'''python3 -m pip install dist/*-cp{cp_version}-cp{cp_version}*-{dist_target}.whl >> /dev/null 2>> /dev/null''') + ' && '
 
-def install_dist(cp_version, dist_target):
+def populate_wheelhouse(packages):
     """
-    Generate the command to install the built library.
-    Place this command BEFORE the test command.
+    Generate the command to build the wheels of the given packages into the wheelhouse.
+    Place this command BEFORE the build command.
 
     Parameters:
-    - cp_version (str): The CP version to use in the filename.
-    - target (str): The target architecture.
+    - packages (list): The packages to build wheels for (e.g., ["setuptools", "build", "wheel"]).
 
     Returns:
-    - str: The command to install the built library.
+    - str: The command to populate the wheelhouse.
+    """
+    packages_str = ' '.join(packages)
+    return f'''pip wheel --wheel-dir {WHEELHOUSE_MOUNT} {packages_str} && echo "{packages_str}" > {WHEELHOUSE_MOUNT}/{WHEELHOUSE_MARKER} && '''
+
+def enable_ccache():
+    """
+    Generate the command to put ccache in front of every compiler installed in the image.
+    Images built before ccache was added to them compile without cache.
+    Place this command BEFORE the build command.
+
+    Returns:
+    - str: The command to enable the compiler cache.
     """
-    return f'''python3 -m pip install dist/*-cp{cp_version}-cp{cp_version}*-{dist_target}.whl >> /dev/null 2>> /dev/null && '''
+    return f'''if command -v ccache >> /dev/null; then \
+            mkdir -p {CCACHE_BIN} && \
+            for compiler in {' '.join(CCACHE_COMPILERS)}; do if command -v $compiler >> /dev/null; then ln -sf "$(command -v ccache)" {CCACHE_BIN}/$compiler; fi; done && \
+            export PATH="{CCACHE_BIN}:$PATH"; \
+        else \
+            echo "ccache is not installed in this image, remove the pookie images to rebuild them with it"; \
+        fi && '''
 
 def prepare_environment_macosx_11_0_x86_64_and_macosx_11_0_arm64(cross_compiler, arquitecture, python_major_dot_minor_version):
     """
@@ -99,7 +182,7 @@ def prepare_environment_manylinux_2_17_x86_64_and_musllinux_1_2_x86_64(CC, CXX):
 
     return f'''export CC={CC} && export CXX={CXX} && '''
 
-def prepare_environment_win_amd64(py_version_nodot, python_major_dot_minor_version):
+def prepare_environment_win_amd64(py_version_nodot, python_major_dot_minor_version, abi3=False):
     """
     Generate the command to prepare the environment for win_amd64 builds.
     This includes setting up the compiler and linker flags.
@@ -108,21 +191,26 @@ def prepare_environment_win_amd64(py_version_nodot, python_major_dot_minor_versi
     Parameters:
     - py_version_nodot (str): The major and minor version of Python to use (e.g., "312").
     - python_major_dot_minor_version (str): The major and minor version of Python to use (e.g., "3.12").
+    - abi3 (bool): Whether to build for the stable ABI, linking python3.dll instead of the versioned DLL
+      and limiting the API to the given Python version.
 
     Returns:
     - str: The command to prepare the environment.
     """
+    abi_tag = 'abi3' if abi3 else f'cp{py_version_nodot}'
+    python_lib = 'python3' if abi3 else f'python{py_version_nodot}'
+    limited_api = f" -DPy_LIMITED_API=0x03{int(py_version_nodot[1:]):02X}0000" if abi3 else ''
 
     return f'''cat <<'EOF' > mingw-wrapper.sh
 #!/bin/bash
 
 # Detect if we're in the linking phase by checking for `-shared` flag
 if [[ "$@" == *"-shared"* ]]; then
-    # Reorder args: move `-lpython{py_version_nodot}` and enable auto-import to the end
+    # Reorder args: move `-l{python_lib}` and enable auto-import to the end
     args=()
     libs=()
     for arg in "$@"; do
-        if [[ "$arg" == "-lpython{py_version_nodot}" ]]; then
+        if [[ "$arg" == "-l{python_lib}" ]]; then
             libs+=("$arg")
         elif [[ "$arg" == "-Wl,--enable-auto-import" ]]; then
             libs+=("$arg")
@@ -157,7 +245,7 @@ try:
     import setuptools.command.bdist_wheel as bdist_wheel_mod
 
     def _patched_get_tag(self):
-        return f'cp{py_version_nodot}', f'cp{py_version_nodot}', 'win_amd64'
+        return f'cp{py_version_nodot}', '{abi_tag}', 'win_amd64'
 
     bdist_wheel_mod.bdist_wheel.get_tag = _patched_get_tag
 except ImportError:
@@ -169,48 +257,78 @@ EOF
     export PYTHONPATH=/python_cross/lib/python{python_major_dot_minor_version}/site-packages
     export CC="$(pwd)/mingw-wrapper.sh" && \
     export CXX="$CC" && \
-    export CFLAGS="-I/python/include -static-libgcc -static-libstdc++" && \
-    export LDFLAGS="-L/python/libs -lpython{py_version_nodot} -Wl,--enable-auto-import -Wl,--export-all-symbols -static-libgcc -static-libstdc++" \
+    export CFLAGS="-I/python/include{limited_api} -static-libgcc -static-libstdc++" && \
+    export LDFLAGS="-L/python/libs -l{python_lib} -Wl,--enable-auto-import -Wl,--export-all-symbols -static-libgcc -static-libstdc++" \
     &&
 '''
 
-def fix_Wheel_macosx_11_0_x86_64_and_macosx_11_0_arm64(py_version_nodot, new_dist_target):
+def get_mount_args(volumes, env):
     """
-    Generate the command to fix the wheel platform and tags for macosx_11_0_x86_64 and macosx_11_0_arm64 cross builds.
-    This is necessary to ensure that the built library can be imported correctly.
-    Place this command AFTER the build command.
+    Generate the docker run arguments for extra volumes and environment variables.
 
     Parameters:
-    - py_version_nodot (str): The CP version to use in the filename.
-    - new_dist_target (str): The new distribution target.
+    - volumes (dict): Mapping of host path to container path, or None.
+    - env (dict): Mapping of environment variable name to value, or None.
 
     Returns:
-    - str: The command to fix the EXT_SUFFIX.
+    - list: The docker run arguments.
     """
+    args = []
+    for host_path, container_path in (volumes or {}).items():
+        args += ['-v', f'{host_path}:{container_path}']
+    for name, value in (env or {}).items():
+        args += ['-e', f'{name}={value}']
+    return args
+
+def get_binds(volumes, host_workspace_path):
+    """
+    Generate the volumes of a container for the Docker Engine API: the extra volumes and the workspace.
+
+    Parameters:
+    - volumes (dict): Mapping of host path to container path, or None.
+    - host_workspace_path (str): The path to the host workspace, mounted on /workspace.
 
-    return f''' && cd dist && \
-        orig_whl=$(ls *-cp{py_version_nodot}-cp{py_version_nodot}-linux_x86_64.whl) && \
-        unzip -o *-cp{py_version_nodot}-cp{py_version_nodot}-linux_x86_64.whl -d tmp && cd tmp && \
-        sed -i 's/linux_x86_64/{new_dist_target}/g' *.dist-info/WHEEL && \
-        zip -r "../${{orig_whl/-linux_x86_64/-{new_dist_target}}}" * && \
-        cd .. && rm -rf *-cp{py_version_nodot}-cp{py_version_nodot}-linux_x86_64.whl tmp/ ../clang-wrapper.sh'''
+    Returns:
+    - list: The volumes, as "host path:container path".
+    """
+    return [f'{host_path}:{container_path}' for host_path, container_path in (volumes or {}).items()] + [f'{host_workspace_path}:/workspace']
 
-def run_lvl3_image(image_name, command, host_workspace_path, logfile):
+def run_lvl3_image(image_name, command, host_workspace_path, log_path, tty=False, volumes=None, env=None, prefix=None, extra_log=None, timeout=None):
     """
-    Run a level 3 CP3xx Docker image.
+    Run a level 3 CP3xx Docker image, through the Docker Engine API when it is used (see docker_engine.use_engine_api)
+    or with docker run otherwise.
 
     Parameters:
     - image_name (str): The specific image name to run.
     - command (str): The command to run inside the Docker container.
     - host_workspace_path (str): The path to the host workspace.
-    - logfile (file object): File object to log the output of the run process.
+    - log_path (str): The path of the log file of the container output.
+    - tty (bool): Whether to allocate a pseudo-terminal for the container.
+    - volumes (dict): Extra volumes to mount, mapping host path to container path.
+    - env (dict): Extra environment variables of the container.
+    - prefix (str): The name printed before the output lines in the live view (default: the image name).
+    - extra_log (file object): Text file where the output is also appended, or None.
+    - timeout (float): Seconds after which the container is stopped, or None.
+
+    Returns:
+    - int: The exit code of the container, or TIMEOUT_EXIT_CODE if it timed out.
     """
-    subprocess.run([
+    tty_args = ['-t'] if tty else []
+    container_name = f'pookie-{uuid.uuid4().hex[:12]}'
+
+    if use_engine_api():
+        return run_container(container_name, image_name, ['/bin/bash', '-c', command], log_path, extra_log, prefix or image_name,
+                             '/workspace', get_binds(volumes, host_workspace_path), env, tty, privileged=True, timeout=timeout)
+
+    return run_command([
         'docker',
             'run',
             '--privileged',
-            '-it',
+            *tty_args,
             '--rm',
+            '--name',
+                container_name,
+            *get_mount_args(volumes, env),
             '-v',
                 f'{host_workspace_path}:/workspace',
             '-w',
@@ -219,341 +337,1513 @@ def run_lvl3_image(image_name, command, host_workspace_path, logfile):
             '/bin/bash',
                 '-c',
                 command
-    ], stdout = logfile, stderr = logfile)
+    ], log_path, extra_log, prefix or image_name, timeout=timeout, container=container_name)
 
-def run_docker_images(targets, logfile, python_versions_dic, build, test, linux_x86_64_compiler, linux_non_native_mode, host_workspace_path):
+def run_remote_lvl3_image(host, image_name, command, workspace, log_path, tty=False, volumes=None, env=None, prefix=None, extra_log=None, timeout=None):
     """
-    Run Docker images for building and testing the library.
+    Run a level 3 CP3xx Docker image on a remote Docker host, which cannot mount the workspace:
+    the workspace is copied into the container before it starts, and its dist directory
+    (and the marks of its phases) copied back once it ends.
 
     Parameters:
-    - targets (list): List of target architectures.
-    - logfile (file object): File object to log the output of the run process.
-    - python_versions_dic (dict): Dictionary of Python versions.
-    - build (str): Command to build the library.
-    - test (str): Command to test the library.
-    - host_workspace_path (str): Path to the host workspace.
+    - host (dict): The Docker host (see docker_hosts.parse_docker_host).
+    - image_name (str): The specific image name to run.
+    - command (str): The command to run inside the Docker container.
+    - workspace (str): The local path of the workspace.
+    - log_path (str): The path of the log file of the container output.
+    - tty (bool): Whether to allocate a pseudo-terminal for the container.
+    - volumes (dict): Extra volumes to mount, mapping the path on the Docker host to the container path.
+      The cache directories of the local machine do not exist on the remote host, they are not mounted.
+    - env (dict): Extra environment variables of the container.
+    - prefix (str): The name printed before the output lines in the live view (default: the image name).
+    - extra_log (file object): Text file where the output is also appended, or None.
+    - timeout (float): Seconds after which the container is stopped, or None.
+
+    Returns:
+    - int: The exit code of the container, or TIMEOUT_EXIT_CODE if it timed out.
     """
+    tty_args = ['-t'] if tty else []
+    container_name = f'pookie-{uuid.uuid4().hex[:12]}'
 
-    # Run build and test commands
-    for target in targets:
-        for minor in python_versions_dic:
+    returncode, stdout, stderr = capture_command([
+        'docker',
+            'create',
+            '--privileged',
+            *tty_args,
+            '--name',
+                container_name,
+            *get_mount_args(volumes, env),
+            '-w',
+                f'/workspace',
+            image_name,
+            '/bin/bash',
+                '-c',
+                command
+    ], env=host['env'])
+    if returncode != 0:
+        print(f"Failed to create a container from {image_name} on {host['name']}: {stderr.strip()}")
+        return returncode
+
+    try:
+        returncode, stdout, stderr = capture_command(['docker', 'cp', f'{workspace}/.', f'{container_name}:/workspace'], env=host['env'])
+        if returncode != 0:
+            print(f"Failed to copy the workspace to {host['name']}: {stderr.strip()}")
+            return returncode
+
+        returncode = run_command(['docker', 'start', '-a', container_name], log_path, extra_log, prefix or image_name,
+                                 env=host['env'], timeout=timeout, container=container_name)
+
+        # there is no dist directory or marks file when the command did not create them
+        os.makedirs(os.path.join(workspace, 'dist'), exist_ok=True)
+        capture_command(['docker', 'cp', f'{container_name}:/workspace/dist/.', os.path.join(workspace, 'dist')], env=host['env'])
+        if os.path.isdir(os.path.join(workspace, os.path.dirname(MARKS_FILE))):
+            capture_command(['docker', 'cp', f'{container_name}:/workspace/{MARKS_FILE}', os.path.join(workspace, MARKS_FILE)], env=host['env'])
+        return returncode
+    finally:
+        remove_container(container_name, host['env'])
+
+def start_lvl3_container(image_name, host_workspace_path, volumes=None, env=None):
+    """
+    Start a long-lived level 3 CP3xx Docker container in the background, through the Docker Engine API when it is used.
+    Commands are run inside it with exec_lvl3_container and it is removed with stop_lvl3_container.
 
-            py_version_nodot = '3' + minor
-            python_major_dot_minor_version = '3.' + minor
+    Parameters:
+    - image_name (str): The specific image name to run.
+    - host_workspace_path (str): The path to the host workspace.
+    - volumes (dict): Extra volumes to mount, mapping host path to container path.
+    - env (dict): Extra environment variables of the container.
 
-            if target == 'manylinux_2_17_x86_64':
+    Returns:
+    - str: The container ID, or None if the container could not be started.
+    """
+    if use_engine_api():
+        try:
+            return start_container(None, image_name, ['sleep', 'infinity'], '/workspace', get_binds(volumes, host_workspace_path), env, privileged=True)
+        except OSError as e:
+            print(f"Failed to start a container from {image_name}: {e}")
+            return None
+
+    returncode, stdout, stderr = capture_command([
+        'docker',
+            'run',
+            '--privileged',
+            '-d',
+            '--rm',
+            *get_mount_args(volumes, env),
+            '-v',
+                f'{host_workspace_path}:/workspace',
+            '-w',
+                f'/workspace',
+            image_name,
+            'sleep',
+                'infinity'
+    ])
+    if returncode != 0:
+        print(f"Failed to start a container from {image_name}: {stderr.strip()}")
+        return None
+    return stdout.strip()
+
+def exec_lvl3_container(container_id, command, log_path, tty=False, prefix=None, extra_log=None, timeout=None):
+    """
+    Run a command inside a running level 3 CP3xx Docker container, through the Docker Engine API when it is used
+    (see docker_engine.use_engine_api) or with docker exec otherwise.
 
-                image_name = f"manylinux-lvl3-cp{py_version_nodot}-manylinux_2_17_x86_64"
-                original_dist_target = "linux_x86_64"
-                new_dist_target = "manylinux2014_x86_64.manylinux_2_17_x86_64"
+    Parameters:
+    - container_id (str): The ID of the container.
+    - command (str): The command to run inside the Docker container.
+    - log_path (str): The path of the log file of the command output.
+    - tty (bool): Whether to allocate a pseudo-terminal for the command.
+    - prefix (str): The name printed before the output lines in the live view (default: the container ID).
+    - extra_log (file object): Text file where the output is also appended, or None.
+    - timeout (float): Seconds after which the command is stopped and the container removed, or None.
 
-                if linux_x86_64_compiler == 'gcc':
-                    CC = "gcc"
-                    CXX = "g++"
-                else:
-                    CC = "clang"
-                    CXX = "clang++"
-
-                # build the library
-                if build != None:
-
-                    build_command = \
-                        prepare_environment_manylinux_2_17_x86_64_and_musllinux_1_2_x86_64(CC, CXX) + \
-                        build + \
-                        rename_dist(original_dist_target, target)
-
-                    print(f">> Building the library for cp{py_version_nodot}-{target}")
-                    run_lvl3_image(image_name, build_command, host_workspace_path, logfile)
-
-                # test the library
-                if test != None:
-
-                    test_command = \
-                        install_dist(py_version_nodot, new_dist_target) + \
-                        test
-
-                    print(f">> Testing the library for cp{py_version_nodot}-{target}")
-                    run_lvl3_image(image_name, test_command, host_workspace_path, None)
-
-            if target == 'manylinux_2_17_aarch64':
-
-                image_name = f"manylinux-lvl3-cp{py_version_nodot}-manylinux_2_17_aarch64"
-                original_dist_target = "linux_aarch64"
-                new_dist_target = "manylinux2014_aarch64.manylinux_2_17_aarch64"
-
-                python_aarch64 = "LD_LIBRARY_PATH=/usr/aarch64-linux-gnu/lib /python/bin/python3"
-                pip_aarch64 = "LD_LIBRARY_PATH=/usr/aarch64-linux-gnu/lib /python/bin/python3 -m pip"
-
-                # build the library
-                if build != None:
-
-                    if linux_non_native_mode == 'cross':
-                        build_command = \
-                            build + \
-                            rename_dist(original_dist_target, target)
-                    else:
-                        build_command = \
-                            wrapper('python3', python_aarch64) + \
-                            wrapper('python', python_aarch64) + \
-                            wrapper('pip3', pip_aarch64) + \
-                            wrapper('pip', pip_aarch64) + \
-                            build + \
-                            rename_dist(original_dist_target, target)
-
-                    print(f">> Building the library for cp{py_version_nodot}-{target}")
-                    run_lvl3_image(image_name, build_command, host_workspace_path, logfile)
-
-                # test the library
-                if test != None:
-
-                    test_command = \
-                        wrapper('python3', python_aarch64) + \
-                        wrapper('python', python_aarch64) + \
-                        wrapper('pip3', pip_aarch64) + \
-                        wrapper('pip', pip_aarch64) + \
-                        install_dist(py_version_nodot, new_dist_target) + \
-                        test
-
-                    print(f">> Testing the library for cp{py_version_nodot}-{target}")
-                    run_lvl3_image(image_name, test_command, host_workspace_path, None)
-
-            if target == "manylinux_2_17_armv7l":
-
-                image_name = f"manylinux-lvl3-cp{py_version_nodot}-manylinux_2_17_armv7l"
-                original_dist_target_cross = "linux_armv7"
-                original_dist_target_emulate = "linux_armv7l"
-                new_dist_target = "manylinux2014_armv7l.manylinux_2_17_armv7l"
-
-                python_armv7l = "LD_LIBRARY_PATH=/usr/arm-linux-gnueabihf/lib /python/bin/python3"
-                pip_armv7l = "LD_LIBRARY_PATH=/usr/arm-linux-gnueabihf/lib /python/bin/python3 -m pip"
-
-                # build the library
-                if build != None:
-
-                    if linux_non_native_mode == 'cross':
-                        build_command = \
-                            build + \
-                            rename_dist(original_dist_target_cross, target)
-                    else:
-                        build_command = \
-                            wrapper('python3', python_armv7l) + \
-                            wrapper('python', python_armv7l) + \
-                            wrapper('pip3', pip_armv7l) + \
-                            wrapper('pip', pip_armv7l) + \
-                            build + \
-                            rename_dist(original_dist_target_emulate, target)
-
-                    print(f">> Building the library for cp{py_version_nodot}-{target}")
-                    run_lvl3_image(image_name, build_command, host_workspace_path, logfile)
-
-                # test the library
-                if test != None:
-
-                    test_command = \
-                        wrapper('python3', python_armv7l) + \
-                        wrapper('python', python_armv7l) + \
-                        wrapper('pip3', pip_armv7l) + \
-                        wrapper('pip', pip_armv7l) + \
-                        install_dist(py_version_nodot, new_dist_target) + \
-                        test
-
-                    print(f">> Testing the library for cp{py_version_nodot}-{target}")
-                    run_lvl3_image(image_name, test_command, host_workspace_path, None)
-
-            if target == "manylinux_2_17_ppc64le":
-
-                image_name = f"manylinux-lvl3-cp{py_version_nodot}-manylinux_2_17_ppc64le"
-                original_dist_target = "linux_ppc64le"
-                new_dist_target = "manylinux2014_ppc64le.manylinux_2_17_ppc64le"
-
-                python_ppc64le = "LD_LIBRARY_PATH=/usr/powerpc64le-linux-gnu/lib /python/bin/python3"
-                pip_ppc64le = "LD_LIBRARY_PATH=/usr/powerpc64le-linux-gnu/lib /python/bin/python3 -m pip"
-
-                # build the library
-                if build != None:
-
-                    if linux_non_native_mode == 'cross':
-                        build_command = \
-                            build + \
-                            rename_dist(original_dist_target, target)
-                    else:
-                        build_command = \
-                            wrapper('python3', python_ppc64le) + \
-                            wrapper('python', python_ppc64le) + \
-                            wrapper('pip3', pip_ppc64le) + \
-                            wrapper('pip', pip_ppc64le) + \
-                            build + \
-                            rename_dist(original_dist_target, target)
-
-                    print(f">> Building the library for cp{py_version_nodot}-{target}")
-                    run_lvl3_image(image_name, build_command, host_workspace_path, logfile)
-
-                # test the library
-                if test != None:
-
-                    test_command = \
-                        wrapper('python3', python_ppc64le) + \
-                        wrapper('python', python_ppc64le) + \
-                        wrapper('pip3', pip_ppc64le) + \
-                        wrapper('pip', pip_ppc64le) + \
-                        install_dist(py_version_nodot, new_dist_target) + \
-                        test
-
-                    print(f">> Testing the library for cp{py_version_nodot}-{target}")
-                    run_lvl3_image(image_name, test_command, host_workspace_path, None)
-
-            if target == "manylinux_2_17_s390x":
-
-                image_name = f"manylinux-lvl3-cp{py_version_nodot}-manylinux_2_17_s390x"
-                original_dist_target = "linux_s390x"
-                new_dist_target = "manylinux2014_s390x.manylinux_2_17_s390x"
-
-                python_s390x = "LD_LIBRARY_PATH=/usr/s390x-linux-gnu/lib /python/bin/python3"
-                pip_s390x = "LD_LIBRARY_PATH=/usr/s390x-linux-gnu/lib /python/bin/python3 -m pip"
-
-                # build the library
-                if build != None:
-
-                    if linux_non_native_mode == 'cross':
-                        build_command = \
-                            build + \
-                            rename_dist(original_dist_target, target)
-                    else:
-                        build_command = \
-                            wrapper('python3', python_s390x) + \
-                            wrapper('python', python_s390x) + \
-                            wrapper('pip3', pip_s390x) + \
-                            wrapper('pip', pip_s390x) + \
-                            build + \
-                            rename_dist(original_dist_target, target)
-
-                    print(f">> Building the library for cp{py_version_nodot}-{target}")
-                    run_lvl3_image(image_name, build_command, host_workspace_path, logfile)
-
-                # test the library
-                if test != None:
-
-                    test_command = \
-                        wrapper('python3', python_s390x) + \
-                        wrapper('python', python_s390x) + \
-                        wrapper('pip3', pip_s390x) + \
-                        wrapper('pip', pip_s390x) + \
-                        install_dist(py_version_nodot, new_dist_target) + \
-                        test
-
-                    print(f">> Testing the library for cp{py_version_nodot}-{target}")
-                    run_lvl3_image(image_name, test_command, host_workspace_path, None)
-
-            if target == 'musllinux_1_2_x86_64':
-
-                image_name = f"musllinux-lvl3-cp{py_version_nodot}-musllinux_1_2_x86_64"
-                original_dist_target = "linux_x86_64"
-                new_dist_target = "musllinux_1_2_x86_64"
-
-                if linux_x86_64_compiler == 'gcc':
-                    CC = "gcc"
-                    CXX = "g++"
-                else:
-                    CC = "clang"
-                    CXX = "clang++"
+    Returns:
+    - int: The exit code of the command, or TIMEOUT_EXIT_CODE if it timed out.
+    """
+    tty_args = ['-t'] if tty else []
 
-                # build the library
-                if build != None:
+    if use_engine_api():
+        return exec_container(container_id, ['/bin/bash', '-c', command], log_path, extra_log, prefix or container_id, tty, timeout)
 
-                    build_command = \
-                        prepare_environment_manylinux_2_17_x86_64_and_musllinux_1_2_x86_64(CC, CXX) + \
-                        build + \
-                        rename_dist(original_dist_target, target)
+    return run_command([
+        'docker',
+            'exec',
+            *tty_args,
+            container_id,
+            '/bin/bash',
+                '-c',
+                command
+    ], log_path, extra_log, prefix or container_id, timeout=timeout, container=container_id)
 
-                    print(f">> Building the library for cp{py_version_nodot}-{target}")
-                    run_lvl3_image(image_name, build_command, host_workspace_path, logfile)
+def stop_lvl3_container(container_id):
+    """
+    Stop and remove a level 3 CP3xx Docker container.
 
-                # test the library
-                if test != None:
+    Parameters:
+    - container_id (str): The ID of the container.
+    """
+    remove_container(container_id)
 
-                    test_command = \
-                        install_dist(py_version_nodot, new_dist_target) + \
-                        test
+def strip_job_caches(lvl3_job, command):
+    """
+    Remove the pip, wheelhouse and compiler caches from a command of a level 3 job run on a remote Docker host,
+    whose daemon cannot mount the cache directories of the local machine: the command is stripped of the
+    wheelhouse population and ccache setup prefixed to it, and the environment of the cache variables.
 
-                    print(f">> Testing the library for cp{py_version_nodot}-{target}")
-                    run_lvl3_image(image_name, test_command, host_workspace_path, None)
+    Parameters:
+    - lvl3_job (dict): The job returned by get_lvl3_job.
+    - command (str): The command of the job.
 
-            if target == 'win_amd64':
+    Returns:
+    - tuple: The command and the environment of the container without the caches.
+    """
+    stripped = True
+    while stripped:
+        stripped = False
+        for prefix in lvl3_job.get('cache_commands', []):
+            if command.startswith(prefix):
+                command = command[len(prefix):]
+                stripped = True
+    env = {name: value for name, value in lvl3_job.get('env', {}).items() if name not in CACHE_ENV}
+    return command, env
+
+def run_lvl3_job_command(lvl3_job, command, host_workspace_path, log_path, tty=False, containers=None, extra_log=None, timeout=None, workspace='.'):
+    """
+    Run a command of a level 3 job in a fresh container or, when containers is given,
+    in the warm container of the job (started on first use).
+    The jobs given a remote Docker host in their 'docker_host' always run in a fresh container on it,
+    once their image was sent to it (see docker_hosts.sync_image), and without the caches, which are not
+    synced to the remote hosts (see strip_job_caches).
 
-                image_name = f"win-macosx-pookie-lvl3-cp{py_version_nodot}-win_amd64"
-                new_dist_target = "win_amd64"
+    Parameters:
+    - lvl3_job (dict): The job returned by get_lvl3_job.
+    - command (str): The command to run inside the Docker container.
+    - host_workspace_path (str): The path to the host workspace.
+    - log_path (str): The path of the log file of the command output.
+    - tty (bool): Whether to allocate a pseudo-terminal.
+    - containers (dict): Mapping of job name to warm container ID, or None to use a fresh container.
+      The container of a command that timed out is removed with it, and dropped from the mapping.
+    - extra_log (file object): Text file where the output is also appended, or None.
+    - timeout (float): Seconds after which the command is stopped, or None.
+    - workspace (str): The local path of the workspace mounted on /workspace.
 
-                # build the library
-                if build != None:
+    Returns:
+    - int: The exit code of the command.
+    """
+    host = lvl3_job.get('docker_host')
+    if is_remote_host(host):
+        if not sync_image(host, lvl3_job['image_name'], os.path.join(LOGS_DIR, f"{lvl3_job['name']}-sync.log")):
+            return 1
+        command, env = strip_job_caches(lvl3_job, command)
+        return run_remote_lvl3_image(host, lvl3_job['image_name'], command, workspace, log_path, tty, None, env, lvl3_job['name'], extra_log, timeout)
+
+    if containers is None:
+        return run_lvl3_image(lvl3_job['image_name'], command, host_workspace_path, log_path, tty, lvl3_job.get('volumes'), lvl3_job.get('env'), lvl3_job['name'], extra_log, timeout)
+
+    if lvl3_job['name'] not in containers:
+        with trace_span('container start', lvl3_job['name']):
+            containers[lvl3_job['name']] = start_lvl3_container(lvl3_job['image_name'], host_workspace_path, lvl3_job.get('volumes'), lvl3_job.get('env'))
+    if containers[lvl3_job['name']] is None:
+        return 1
+    returncode = exec_lvl3_container(containers[lvl3_job['name']], command, log_path, tty, lvl3_job['name'], extra_log, timeout)
+
+    # the container was removed with the timed out command, the next phase starts a new one
+    if returncode == TIMEOUT_EXIT_CODE:
+        containers.pop(lvl3_job['name'])
+    return returncode
+
+def get_job_log_path(lvl3_job, phase):
+    """
+    Get the path of the log file of a phase of a level 3 job.
 
-                    build_command = \
-                        prepare_environment_win_amd64(py_version_nodot, python_major_dot_minor_version) + \
-                        build
+    Parameters:
+    - lvl3_job (dict): The job returned by get_lvl3_job.
+    - phase (str): The phase of the job ('build' or 'test').
 
-                    print(f">> Building the library for cp{py_version_nodot}-{target}")
-                    run_lvl3_image(image_name, build_command, host_workspace_path, logfile)
+    Returns:
+    - str: The path of the log file in the logs directory.
+    """
+    return os.path.join(LOGS_DIR, f"{lvl3_job['name']}-{phase}.log")
 
-                # test the library
-                if test != None:
+def run_lvl3_job_phase(lvl3_job, phase, command, host_workspace_path, workspace, tty=False, containers=None, extra_log=None, timeout=None):
+    """
+    Run the build or test command of a level 3 job, writing its output to the log file of the phase,
+    and record its timing, and the timing of the phases marked inside the container, on the track of the job.
+    Unless the live view shows it already, the output of the test is printed once it finishes.
 
-                    python_win_amd64 = "wine /python/python.exe"
-                    pip_win_amd64 = "wine /python/python.exe -m pip"
+    Parameters:
+    - lvl3_job (dict): The job returned by get_lvl3_job.
+    - phase (str): The phase of the job ('build' or 'test').
+    - command (str): The command to run inside the Docker container.
+    - host_workspace_path (str): The path to the host workspace.
+    - workspace (str): The local path of the workspace mounted on /workspace.
+    - tty (bool): Whether to allocate a pseudo-terminal.
+    - containers (dict): Mapping of job name to warm container ID, or None to use a fresh container.
+    - extra_log (file object): Text file where the output is also appended, or None.
+    - timeout (float): Seconds after which the command is stopped, or None.
 
-                    test_command = \
-                        wrapper('python3', python_win_amd64) + \
-                        wrapper('python', python_win_amd64) + \
-                        wrapper('pip3', pip_win_amd64) + \
-                        wrapper('pip', pip_win_amd64) + \
-                        install_dist(py_version_nodot, new_dist_target) + \
-                        test
+    Returns:
+    - int: The exit code of the command.
+    """
+    os.makedirs(LOGS_DIR, exist_ok=True)
+    log_path = get_job_log_path(lvl3_job, phase)
 
-                    print(f">> Testing the library for cp-{py_version_nodot}-{target}")
-                    run_lvl3_image(image_name, test_command, host_workspace_path, None)
+    prepare_marks(workspace)
+    started = time.time()
+    with trace_span(phase, lvl3_job['name']):
+        returncode = run_lvl3_job_command(lvl3_job, command, host_workspace_path, log_path, tty, containers, extra_log, timeout, workspace)
+    collect_marks(lvl3_job['name'], workspace, started if containers is None or is_remote_host(lvl3_job.get('docker_host')) else None)
 
-            if target == 'macosx_11_0_x86_64':
+    if phase == 'test' and not is_live_view_started():
+        print_log(lvl3_job['name'], log_path)
+    return returncode
 
-                image_name = f"win-macosx-pookie-lvl3-cp{py_version_nodot}-macosx_11_0_x86_64"
-                new_dist_target = "macosx_11_0_x86_64"
-                cross_compiler = "o64-clang"
-                arquitecture = "x86_64"
+def add_non_native_fallback(lvl3_job, fallback_job):
+    """
+    Attach to a level 3 job the build of the same target and Python version in the other non-native mode,
+    run by run_lvl3_job_build when the build of the job fails.
 
-                # build the library
-                if build != None:
+    Parameters:
+    - lvl3_job (dict): The job returned by get_lvl3_job, updated in place.
+    - fallback_job (dict): The job of the other non-native mode, with its 'mode' key.
+    """
+    if lvl3_job['build_command'] is not None:
+        lvl3_job['fallback'] = {key: fallback_job[key] for key in NON_NATIVE_MODE_KEYS if key in fallback_job}
 
-                    build_command = \
-                        prepare_environment_macosx_11_0_x86_64_and_macosx_11_0_arm64(cross_compiler, arquitecture, python_major_dot_minor_version) + \
-                        build + \
-                        fix_Wheel_macosx_11_0_x86_64_and_macosx_11_0_arm64(py_version_nodot, new_dist_target)
+def repair_job_wheels(lvl3_job, workspace):
+    """
+    Repair the wheels built by a level 3 job for the manylinux or musllinux platform of its target
+    with the auditwheel of the pookie image, as soon as the build ends (see wheel_repair).
+    The output of auditwheel is written to <name>-repair.log, or <name>-repair-<i>.log for each wheel
+    when the build produced several of them.
 
-                    print(f">> Building the library for cp{py_version_nodot}-{target}")
-                    run_lvl3_image(image_name, build_command, host_workspace_path, logfile)
+    Parameters:
+    - lvl3_job (dict): The job returned by get_lvl3_job.
+    - workspace (str): The local path of the workspace mounted on /workspace.
 
-                # test the library
-                if test != None:
+    Returns:
+    - int: 0 if the wheels were repaired (or there is nothing to repair), 1 otherwise.
+    """
+    repair = lvl3_job.get('repair')
+    if repair is None:
+        return 0
+
+    paths = sorted(glob.glob(os.path.join(workspace, 'dist', repair['pattern'])))
+    if not paths:
+        print(f">> No wheel matching {repair['pattern']} to repair for {lvl3_job['name']}")
+        return 1
+
+    os.makedirs(LOGS_DIR, exist_ok=True)
+    if len(paths) == 1:
+        log_paths = [get_job_log_path(lvl3_job, 'repair')]
+    else:
+        log_paths = [get_job_log_path(lvl3_job, f"repair-{i}") for i in range(len(paths))]
+    prefix = lvl3_job['name'] if is_live_view_started() else None
+    with trace_span('auditwheel repair', lvl3_job['name']):
+        returncodes = repair_wheels(paths, repair['platform'], log_paths, prefix)
+
+    failed = False
+    for path, log_path in zip(paths, log_paths):
+        if returncodes[path] == 0:
+            print(f">> Repaired {os.path.basename(path)} for {repair['platform']}")
+        else:
+            print(f">> Failed to repair {os.path.basename(path)} for {repair['platform']}, see {log_path}")
+            failed = True
+    return 1 if failed else 0
+
+def retag_job_wheels(lvl3_job, workspace):
+    """
+    Retag the wheels built by a level 3 job for the platform of its target, for the targets whose
+    build tags the wheels for the build machine (see wheel_retagger).
 
-                    print(f">> Testing the library for cp{py_version_nodot}-{target}")
-                    print("Not supported yet :(")
+    Parameters:
+    - lvl3_job (dict): The job returned by get_lvl3_job.
+    - workspace (str): The local path of the workspace mounted on /workspace.
 
-            if target == 'macosx_11_0_arm64':
+    Returns:
+    - int: 0 if the wheels were retagged (or there is nothing to retag), 1 otherwise.
+    """
+    retag = lvl3_job.get('retag')
+    if retag is None:
+        return 0
+
+    paths = sorted(glob.glob(os.path.join(workspace, 'dist', retag['pattern'])))
+    if not paths:
+        print(f">> No wheel matching {retag['pattern']} to retag for {lvl3_job['name']}")
+        return 1
+    try:
+        with trace_span('wheel retag', lvl3_job['name']):
+            new_paths = retag_wheels(paths, retag['platform'])
+    except (OSError, ValueError, zipfile.BadZipFile) as e:
+        print(f">> Failed to retag the wheels of {lvl3_job['name']}: {e}")
+        return 1
+    for path, new_path in zip(paths, new_paths):
+        print(f">> Retagged {os.path.basename(path)} as {os.path.basename(new_path)}")
+    return 0
+
+def run_lvl3_job_build(lvl3_job, host_workspace_path, workspace, tty=False, containers=None, extra_log=None, timeout=None):
+    """
+    Run the build command of a level 3 job. When it fails and the job has a fallback
+    (the other non-native mode, see add_non_native_fallback), the build is run again with it
+    and the log of the failed build is kept as <name>-build-<mode>.log.
+    Once built, the wheels of the targets that need it are repaired (see repair_job_wheels)
+    or retagged (see retag_job_wheels).
+    The time and outcome of the builds of the jobs with a non-native mode are appended to their 'mode_results',
+    the exit code and time of the whole build are stored in its 'results'.
 
-                image_name = f"win-macosx-pookie-lvl3-cp{py_version_nodot}-macosx_11_0_arm64"
-                new_dist_target = "macosx_11_0_arm64"
-                cross_compiler = "oa64-clang"
-                arquitecture = "arm64"
+    Parameters:
+    - lvl3_job (dict): The job returned by get_lvl3_job, updated in place when the fallback is used.
+    - host_workspace_path (str): The path to the host workspace.
+    - workspace (str): The local path of the workspace mounted on /workspace.
+    - tty (bool): Whether to allocate a pseudo-terminal.
+    - containers (dict): Mapping of job name to warm container ID, or None to use a fresh container.
+    - extra_log (file object): Text file where the output is also appended, or None.
+    - timeout (float): Seconds after which the build is stopped, or None.
 
-                # build the library
-                if build != None:
+    Returns:
+    - int: The exit code of the last build.
+    """
+    build_started = time.time()
+    while True:
+        started = time.time()
+        returncode = run_lvl3_job_phase(lvl3_job, 'build', lvl3_job['build_command'], host_workspace_path, workspace, tty, containers, extra_log, timeout)
+        if 'mode' in lvl3_job:
+            lvl3_job.setdefault('mode_results', []).append((lvl3_job['mode'], returncode == 0, time.time() - started))
+
+        fallback = lvl3_job.pop('fallback', None)
+        if returncode == 0:
+            returncode = repair_job_wheels(lvl3_job, workspace) or retag_job_wheels(lvl3_job, workspace)
+            if returncode == 0:
+                lvl3_job.setdefault('durations', {})['build'] = time.time() - build_started
+            fallback = None
+        if fallback is None:
+            lvl3_job.setdefault('results', {})['build'] = (returncode, time.time() - build_started)
+            return returncode
+
+        print(f">> The build for {lvl3_job['name']} failed in {lvl3_job['mode']} mode, building it in {fallback['mode']} mode")
+        os.replace(get_job_log_path(lvl3_job, 'build'), get_job_log_path(lvl3_job, f"build-{lvl3_job['mode']}"))
+        stop_lvl3_job_container(lvl3_job, containers)
+        # the objects compiled in the other mode target the same platform directory
+        shutil.rmtree(os.path.join(workspace, 'build'), ignore_errors=True)
+        lvl3_job.update(fallback)
+        lvl3_job.pop('fingerprint', None)
+
+def get_test_shards(lvl3_job, test_shards):
+    """
+    Split the test of a level 3 job into shards, each one run in its own container from the same image
+    with POOKIE_SHARD_INDEX (from 0) and POOKIE_SHARD_COUNT in its environment so that test runners
+    supporting sharding can split the suite. Only the tests of the emulated targets are split.
+
+    Parameters:
+    - lvl3_job (dict): The job returned by get_lvl3_job.
+    - test_shards (int): The number of shards.
 
-                    build_command = \
-                        prepare_environment_macosx_11_0_x86_64_and_macosx_11_0_arm64(cross_compiler, arquitecture, python_major_dot_minor_version) + \
-                        build + \
-                        fix_Wheel_macosx_11_0_x86_64_and_macosx_11_0_arm64(py_version_nodot, new_dist_target)
+    Returns:
+    - list: Copies of the job named <name>-shard<index>, or the job alone when its test is not split.
+    """
+    if test_shards <= 1 or lvl3_job['target'] not in EMULATED_TEST_TARGETS:
+        return [lvl3_job]
+    return [
+        dict(lvl3_job, name=f"{lvl3_job['name']}-shard{index}", env={
+            **lvl3_job.get('env', {}),
+            'POOKIE_SHARD_INDEX': str(index),
+            'POOKIE_SHARD_COUNT': str(test_shards)
+        })
+        for index in range(test_shards)
+    ]
+
+def merge_shard_results(job_name, shard_results):
+    """
+    Merge the exit codes and timings of the shards of a test into one result and print it.
 
-                    print(f">> Building the library for cp{py_version_nodot}-{target}")
-                    run_lvl3_image(image_name, build_command, host_workspace_path, logfile)
+    Parameters:
+    - job_name (str): The name of the job.
+    - shard_results (dict): Mapping of shard name to its exit code and its time in seconds.
 
-                # test the library
-                if test != None:
+    Returns:
+    - int: 0 if every shard passed, otherwise the exit code of the first failed shard.
+    """
+    failed = [(name, returncode) for name, (returncode, _) in sorted(shard_results.items()) if returncode != 0]
+    seconds = [shard_seconds for _, shard_seconds in shard_results.values()]
+    print(f">> Test for {job_name}: {len(shard_results) - len(failed)}/{len(shard_results)} shards passed "
+          f"in {max(seconds, default=0):.1f}s ({sum(seconds):.1f}s of containers)")
+    for name, returncode in failed:
+        print(f"- {name}: exit code {returncode}")
+    return failed[0][1] if failed else 0
+
+def run_lvl3_job_test(lvl3_job, host_workspace_path, workspace, tty=False, containers=None, timeout=None, test_shards=1):
+    """
+    Run the test command of a level 3 job, split into shards running at the same time in their own
+    containers for the emulated targets (see get_test_shards). Its exit code and time are stored in its 'results'.
+
+    Parameters:
+    - lvl3_job (dict): The job returned by get_lvl3_job.
+    - host_workspace_path (str): The path to the host workspace.
+    - workspace (str): The local path of the workspace mounted on /workspace.
+    - tty (bool): Whether to allocate a pseudo-terminal.
+    - containers (dict): Mapping of job name to warm container ID, or None to use a fresh container.
+      Shards always run in fresh containers.
+    - timeout (float): Seconds after which the test (or each shard) is stopped, or None.
+    - test_shards (int): The number of shards.
+
+    Returns:
+    - int: The exit code of the test, merged over the shards.
+    """
+    started = time.time()
+    shards = get_test_shards(lvl3_job, test_shards)
+    if len(shards) == 1:
+        returncode = run_lvl3_job_phase(lvl3_job, 'test', lvl3_job['test_command'], host_workspace_path, workspace, tty, containers, timeout=timeout)
+    else:
+        returncode = run_lvl3_job_shards(lvl3_job, shards, host_workspace_path, workspace, tty, containers, timeout)
+    if returncode == 0:
+        lvl3_job.setdefault('durations', {})['test'] = time.time() - started
+    lvl3_job.setdefault('results', {})['test'] = (returncode, time.time() - started)
+    return returncode
+
+def run_lvl3_job_shards(lvl3_job, shards, host_workspace_path, workspace, tty=False, containers=None, timeout=None):
+    """
+    Run the shards of the test of a level 3 job at the same time, each one in a fresh container.
+
+    Parameters:
+    - lvl3_job (dict): The job returned by get_lvl3_job.
+    - shards (list): The shards of the job (see get_test_shards).
+    - host_workspace_path (str): The path to the host workspace.
+    - workspace (str): The local path of the workspace mounted on /workspace.
+    - tty (bool): Whether to allocate a pseudo-terminal.
+    - containers (dict): Mapping of job name to warm container ID, whose container is stopped, or None.
+    - timeout (float): Seconds after which each shard is stopped, or None.
+
+    Returns:
+    - int: The exit code of the test, merged over the shards.
+    """
+    stop_lvl3_job_container(lvl3_job, containers)
+    shard_results = {}
+
+    def make_shard(shard_job):
+        def run_shard():
+            started = time.time()
+            returncode = run_lvl3_job_phase(shard_job, 'test', shard_job['test_command'], host_workspace_path, workspace, tty, timeout=timeout)
+            shard_results[shard_job['name']] = (returncode, time.time() - started)
+            return returncode == 0
+        return run_shard
+
+    with trace_span('test', lvl3_job['name'], shards=len(shards)):
+        run_job_graph({
+            shard_job['name']: {'func': make_shard(shard_job), 'deps': []}
+            for shard_job in shards
+        }, len(shards))
+    return merge_shard_results(lvl3_job['name'], shard_results)
+
+def stop_lvl3_job_container(lvl3_job, containers):
+    """
+    Tear down the warm container of a level 3 job, if any.
+
+    Parameters:
+    - lvl3_job (dict): The job returned by get_lvl3_job.
+    - containers (dict): Mapping of job name to warm container ID, or None.
+    """
+    if containers is None:
+        return
+    container_id = containers.pop(lvl3_job['name'], None)
+    if container_id is not None:
+        stop_lvl3_container(container_id)
+
+def add_pip_cache(lvl3_job, cache_dir, host_cache_path, wheelhouse_packages=None):
+    """
+    Mount the shared pip cache and the wheelhouse of the job interpreter into the containers of a level 3 job,
+    so that pip installs repeated across jobs and runs are served locally.
+    When wheelhouse packages are given and the wheelhouse does not contain them yet, the build command
+    is prefixed with the command to populate it.
+
+    Parameters:
+    - lvl3_job (dict): The job returned by get_lvl3_job, updated in place.
+    - cache_dir (str): The pookie cache directory.
+    - host_cache_path (str): The path of the pookie cache directory on the host.
+    - wheelhouse_packages (list): Packages to pre-build into the wheelhouse, or None.
+    """
+    wheelhouse = os.path.join(WHEELHOUSE_DIR, lvl3_job['name'])
+    os.makedirs(os.path.join(cache_dir, PIP_CACHE_DIR), exist_ok=True)
+    os.makedirs(os.path.join(cache_dir, wheelhouse), exist_ok=True)
+
+    lvl3_job.setdefault('volumes', {}).update({
+        f"{host_cache_path}/{PIP_CACHE_DIR}": PIP_CACHE_MOUNT,
+        f"{host_cache_path}/{wheelhouse}": WHEELHOUSE_MOUNT
+    })
+    lvl3_job.setdefault('env', {}).update({
+        'PIP_CACHE_DIR': PIP_CACHE_MOUNT,
+        'PIP_FIND_LINKS': WHEELHOUSE_MOUNT
+    })
+
+    if wheelhouse_packages and lvl3_job['build_command'] is not None:
+        try:
+            with open(os.path.join(cache_dir, wheelhouse, WHEELHOUSE_MARKER)) as f:
+                populated = f.read().split()
+        except OSError:
+            populated = []
+        if sorted(populated) != sorted(wheelhouse_packages):
+            lvl3_job.setdefault('cache_commands', []).append(populate_wheelhouse(wheelhouse_packages))
+            lvl3_job['build_command'] = populate_wheelhouse(wheelhouse_packages) + lvl3_job['build_command']
+
+def get_ccache_toolchain(target, linux_x86_64_compiler, linux_non_native_mode):
+    """
+    Get the name of the toolchain used to build a target, which owns a compiler cache directory.
+
+    Parameters:
+    - target (str): The target architecture.
+    - linux_x86_64_compiler (str): Compiler to use for linux x86_64 targets.
+    - linux_non_native_mode (str): Compilation mode for non-native linux targets.
+
+    Returns:
+    - str: The toolchain name (e.g., "manylinux_2_17_x86_64-clang").
+    """
+    if target in ('manylinux_2_17_x86_64', 'musllinux_1_2_x86_64'):
+        return f"{target}-{linux_x86_64_compiler}"
+    if target.startswith('manylinux_2_17_'):
+        return f"{target}-{linux_non_native_mode}"
+    return target
+
+def add_compiler_cache(lvl3_job, cache_dir, host_cache_path, toolchain):
+    """
+    Mount the compiler cache of the toolchain into the containers of a level 3 job and
+    prefix its build command with the command to enable ccache.
+    Every compilation is logged so that the hits and misses of the job can be reported.
+
+    Parameters:
+    - lvl3_job (dict): The job returned by get_lvl3_job, updated in place.
+    - cache_dir (str): The pookie cache directory.
+    - host_cache_path (str): The path of the pookie cache directory on the host.
+    - toolchain (str): The toolchain name (see get_ccache_toolchain).
+    """
+    if lvl3_job['build_command'] is None:
+        return
+
+    os.makedirs(os.path.join(cache_dir, CCACHE_DIR, toolchain), exist_ok=True)
+    os.makedirs(os.path.join(cache_dir, CCACHE_DIR, CCACHE_LOGS_DIR), exist_ok=True)
+    lvl3_job['ccache_log'] = os.path.join(cache_dir, CCACHE_DIR, CCACHE_LOGS_DIR, f"{lvl3_job['name']}.log")
+    if os.path.exists(lvl3_job['ccache_log']):
+        os.remove(lvl3_job['ccache_log'])
+
+    lvl3_job.setdefault('volumes', {})[f"{host_cache_path}/{CCACHE_DIR}"] = CCACHE_MOUNT
+    lvl3_job.setdefault('env', {}).update({
+        'CCACHE_DIR': f"{CCACHE_MOUNT}/{toolchain}",
+        'CCACHE_LOGFILE': f"{CCACHE_MOUNT}/{CCACHE_LOGS_DIR}/{lvl3_job['name']}.log",
+        # job workspaces are all mounted on /workspace, hash paths relative to it
+        'CCACHE_BASEDIR': '/workspace',
+        'CCACHE_NOHASHDIR': '1',
+        'CCACHE_COMPILERCHECK': 'content'
+    })
+    lvl3_job.setdefault('cache_commands', []).append(enable_ccache())
+    lvl3_job['build_command'] = enable_ccache() + lvl3_job['build_command']
+
+def read_ccache_stats(log_path):
+    """
+    Count the cache hits and misses in a ccache log and remove it.
+
+    Parameters:
+    - log_path (str): The path of the ccache log of the job.
+
+    Returns:
+    - tuple: The number of hits and misses, or None if nothing was compiled.
+    """
+    hits = 0
+    misses = 0
+    try:
+        with open(log_path, errors='replace') as f:
+            for line in f:
+                _, found, result = line.partition('Result: ')
+                if not found:
+                    continue
+                if 'hit' in result:
+                    hits += 1
+                elif 'miss' in result:
+                    misses += 1
+        os.remove(log_path)
+    except OSError:
+        return None
+    if hits + misses == 0:
+        return None
+    return hits, misses
+
+def print_ccache_stats(lvl3_jobs):
+    """
+    Print the compiler cache hits and misses of every level 3 job that was built with ccache on the local host.
+
+    Parameters:
+    - lvl3_jobs (list): List of jobs returned by get_lvl3_job.
+    """
+    lines = []
+    for lvl3_job in lvl3_jobs:
+        if 'ccache_log' not in lvl3_job or is_remote_host(lvl3_job.get('docker_host')):
+            continue
+        stats = read_ccache_stats(lvl3_job['ccache_log'])
+        if stats is None:
+            lines.append(f"- {lvl3_job['name']}: no cacheable compilations")
+        else:
+            hits, misses = stats
+            lines.append(f"- {lvl3_job['name']}: {hits} hits, {misses} misses ({100 * hits / (hits + misses):.1f}% hit rate)")
+
+    if lines:
+        print(">> Compiler cache summary")
+        for line in lines:
+            print(line)
+
+def get_lvl3_job(target, minor, build, test, linux_x86_64_compiler, linux_non_native_mode, abi3=False):
+    """
+    Generate the level 3 image name and the build and test commands for a target and a Python minor version.
+
+    Parameters:
+    - target (str): The target architecture.
+    - minor (str): The Python minor version (e.g., "12").
+    - build (str): Command to build the library.
+    - test (str): Command to test the library.
+    - linux_x86_64_compiler (str): Compiler to use for linux x86_64 targets.
+    - linux_non_native_mode (str): Compilation mode for non-native linux targets.
+    - abi3 (bool): Whether the library is built as a stable ABI wheel.
+
+    Returns:
+    - dict: Dictionary with the keys 'target', 'minor', 'name', 'image_name', 'build_command',
+      'test_command', 'repair', 'retag', 'user_build_command' and 'abi3'. Commands are None when there is nothing to run,
+      and 'test_command' is also None when testing is not supported for the target. 'user_build_command' is the
+      build command given by the user, before it is wrapped for tracing and the target. 'repair' gives the pattern of the wheels
+      to repair with auditwheel and their platform (see repair_job_wheels), or is None. 'retag' gives the
+      pattern of the wheels tagged for the build machine and their platform (see retag_job_wheels), or is None.
+    """
+    py_version_nodot = '3' + minor
+    python_major_dot_minor_version = '3.' + minor
+
+    abi_tag = 'abi3' if abi3 else f'cp{py_version_nodot}'
+
+    build_command = None
+    test_command = None
+    repair = None
+    retag = None
+
+    user_build_command = build
+
+    # time the user commands when tracing
+    if build != None:
+        build = mark_phase('user build', build)
+    if test != None:
+        test = mark_phase('test', test)
+
+    if target == 'manylinux_2_17_x86_64':
+
+        image_name = f"manylinux-lvl3-cp{py_version_nodot}-manylinux_2_17_x86_64"
+        original_dist_target = "linux_x86_64"
+        new_dist_target = "manylinux2014_x86_64.manylinux_2_17_x86_64"
+
+        if linux_x86_64_compiler == 'gcc':
+            CC = "gcc"
+            CXX = "g++"
+        else:
+            CC = "clang"
+            CXX = "clang++"
+
+        # build the library
+        if build != None:
+
+            build_command = \
+                prepare_environment_manylinux_2_17_x86_64_and_musllinux_1_2_x86_64(CC, CXX) + \
+                build
+            repair = {'pattern': f"*-{original_dist_target}.whl", 'platform': target}
+
+        # test the library
+        if test != None:
+
+            test_command = \
+                install_dist(py_version_nodot, new_dist_target, abi3) + \
+                test
+
+    if target == 'manylinux_2_17_aarch64':
+
+        image_name = f"manylinux-lvl3-cp{py_version_nodot}-manylinux_2_17_aarch64"
+        original_dist_target = "linux_aarch64"
+        new_dist_target = "manylinux2014_aarch64.manylinux_2_17_aarch64"
+
+        python_aarch64 = "LD_LIBRARY_PATH=/usr/aarch64-linux-gnu/lib /python/bin/python3"
+        pip_aarch64 = "LD_LIBRARY_PATH=/usr/aarch64-linux-gnu/lib /python/bin/python3 -m pip"
+
+        # build the library
+        if build != None:
+
+            if linux_non_native_mode == 'cross':
+                build_command = build
+                repair = {'pattern': f"*-{original_dist_target}.whl", 'platform': target}
+            else:
+                build_command = \
+                    wrapper('python3', python_aarch64) + \
+                    wrapper('python', python_aarch64) + \
+                    wrapper('pip3', pip_aarch64) + \
+                    wrapper('pip', pip_aarch64) + \
+                    build
+                repair = {'pattern': f"*-{original_dist_target}.whl", 'platform': target}
+
+        # test the library
+        if test != None:
+
+            test_command = \
+                wrapper('python3', python_aarch64) + \
+                wrapper('python', python_aarch64) + \
+                wrapper('pip3', pip_aarch64) + \
+                wrapper('pip', pip_aarch64) + \
+                install_dist(py_version_nodot, new_dist_target, abi3) + \
+                test
+
+    if target == "manylinux_2_17_armv7l":
+
+        image_name = f"manylinux-lvl3-cp{py_version_nodot}-manylinux_2_17_armv7l"
+        original_dist_target_cross = "linux_armv7"
+        original_dist_target_emulate = "linux_armv7l"
+        new_dist_target = "manylinux2014_armv7l.manylinux_2_17_armv7l"
+
+        python_armv7l = "LD_LIBRARY_PATH=/usr/arm-linux-gnueabihf/lib /python/bin/python3"
+        pip_armv7l = "LD_LIBRARY_PATH=/usr/arm-linux-gnueabihf/lib /python/bin/python3 -m pip"
+
+        # build the library
+        if build != None:
+
+            if linux_non_native_mode == 'cross':
+                build_command = build
+                repair = {'pattern': f"*-{original_dist_target_cross}.whl", 'platform': target}
+            else:
+                build_command = \
+                    wrapper('python3', python_armv7l) + \
+                    wrapper('python', python_armv7l) + \
+                    wrapper('pip3', pip_armv7l) + \
+                    wrapper('pip', pip_armv7l) + \
+                    build
+                repair = {'pattern': f"*-{original_dist_target_emulate}.whl", 'platform': target}
+
+        # test the library
+        if test != None:
+
+            test_command = \
+                wrapper('python3', python_armv7l) + \
+                wrapper('python', python_armv7l) + \
+                wrapper('pip3', pip_armv7l) + \
+                wrapper('pip', pip_armv7l) + \
+                install_dist(py_version_nodot, new_dist_target, abi3) + \
+                test
+
+    if target == "manylinux_2_17_ppc64le":
+
+        image_name = f"manylinux-lvl3-cp{py_version_nodot}-manylinux_2_17_ppc64le"
+        original_dist_target = "linux_ppc64le"
+        new_dist_target = "manylinux2014_ppc64le.manylinux_2_17_ppc64le"
+
+        python_ppc64le = "LD_LIBRARY_PATH=/usr/powerpc64le-linux-gnu/lib /python/bin/python3"
+        pip_ppc64le = "LD_LIBRARY_PATH=/usr/powerpc64le-linux-gnu/lib /python/bin/python3 -m pip"
+
+        # build the library
+        if build != None:
+
+            if linux_non_native_mode == 'cross':
+                build_command = build
+                repair = {'pattern': f"*-{original_dist_target}.whl", 'platform': target}
+            else:
+                build_command = \
+                    wrapper('python3', python_ppc64le) + \
+                    wrapper('python', python_ppc64le) + \
+                    wrapper('pip3', pip_ppc64le) + \
+                    wrapper('pip', pip_ppc64le) + \
+                    build
+                repair = {'pattern': f"*-{original_dist_target}.whl", 'platform': target}
+
+        # test the library
+        if test != None:
+
+            test_command = \
+                wrapper('python3', python_ppc64le) + \
+                wrapper('python', python_ppc64le) + \
+                wrapper('pip3', pip_ppc64le) + \
+                wrapper('pip', pip_ppc64le) + \
+                install_dist(py_version_nodot, new_dist_target, abi3) + \
+                test
+
+    if target == "manylinux_2_17_s390x":
+
+        image_name = f"manylinux-lvl3-cp{py_version_nodot}-manylinux_2_17_s390x"
+        original_dist_target = "linux_s390x"
+        new_dist_target = "manylinux2014_s390x.manylinux_2_17_s390x"
+
+        python_s390x = "LD_LIBRARY_PATH=/usr/s390x-linux-gnu/lib /python/bin/python3"
+        pip_s390x = "LD_LIBRARY_PATH=/usr/s390x-linux-gnu/lib /python/bin/python3 -m pip"
+
+        # build the library
+        if build != None:
+
+            if linux_non_native_mode == 'cross':
+                build_command = build
+                repair = {'pattern': f"*-{original_dist_target}.whl", 'platform': target}
+            else:
+                build_command = \
+                    wrapper('python3', python_s390x) + \
+                    wrapper('python', python_s390x) + \
+                    wrapper('pip3', pip_s390x) + \
+                    wrapper('pip', pip_s390x) + \
+                    build
+                repair = {'pattern': f"*-{original_dist_target}.whl", 'platform': target}
+
+        # test the library
+        if test != None:
+
+            test_command = \
+                wrapper('python3', python_s390x) + \
+                wrapper('python', python_s390x) + \
+                wrapper('pip3', pip_s390x) + \
+                wrapper('pip', pip_s390x) + \
+                install_dist(py_version_nodot, new_dist_target, abi3) + \
+                test
+
+    if target == 'musllinux_1_2_x86_64':
+
+        image_name = f"musllinux-lvl3-cp{py_version_nodot}-musllinux_1_2_x86_64"
+        original_dist_target = "linux_x86_64"
+        new_dist_target = "musllinux_1_2_x86_64"
+
+        if linux_x86_64_compiler == 'gcc':
+            CC = "gcc"
+            CXX = "g++"
+        else:
+            CC = "clang"
+            CXX = "clang++"
+
+        # build the library
+        if build != None:
+
+            build_command = \
+                prepare_environment_manylinux_2_17_x86_64_and_musllinux_1_2_x86_64(CC, CXX) + \
+                build
+            repair = {'pattern': f"*-{original_dist_target}.whl", 'platform': target}
+
+        # test the library
+        if test != None:
+
+            test_command = \
+                install_dist(py_version_nodot, new_dist_target, abi3) + \
+                test
+
+    if target == 'win_amd64':
+
+        image_name = f"win-macosx-pookie-lvl3-cp{py_version_nodot}-win_amd64"
+        new_dist_target = "win_amd64"
+
+        # build the library
+        if build != None:
+
+            build_command = \
+                prepare_environment_win_amd64(py_version_nodot, python_major_dot_minor_version, abi3) + \
+                build
+
+        # test the library
+        if test != None:
+
+            python_win_amd64 = "wine /python/python.exe"
+            pip_win_amd64 = "wine /python/python.exe -m pip"
+
+            test_command = \
+                wrapper('python3', python_win_amd64) + \
+                wrapper('python', python_win_amd64) + \
+                wrapper('pip3', pip_win_amd64) + \
+                wrapper('pip', pip_win_amd64) + \
+                install_dist(py_version_nodot, new_dist_target, abi3) + \
+                test
+
+    if target == 'macosx_11_0_x86_64':
+
+        image_name = f"win-macosx-pookie-lvl3-cp{py_version_nodot}-macosx_11_0_x86_64"
+        new_dist_target = "macosx_11_0_x86_64"
+        cross_compiler = "o64-clang"
+        arquitecture = "x86_64"
+
+        # build the library
+        if build != None:
+
+            build_command = \
+                prepare_environment_macosx_11_0_x86_64_and_macosx_11_0_arm64(cross_compiler, arquitecture, python_major_dot_minor_version) + \
+                build
+            retag = {'pattern': f"*-cp{py_version_nodot}-{abi_tag}-linux_x86_64.whl", 'platform': new_dist_target}
+
+        # test the library
+        # (not supported yet)
+
+    if target == 'macosx_11_0_arm64':
+
+        image_name = f"win-macosx-pookie-lvl3-cp{py_version_nodot}-macosx_11_0_arm64"
+        new_dist_target = "macosx_11_0_arm64"
+        cross_compiler = "oa64-clang"
+        arquitecture = "arm64"
+
+        # build the library
+        if build != None:
+
+            build_command = \
+                prepare_environment_macosx_11_0_x86_64_and_macosx_11_0_arm64(cross_compiler, arquitecture, python_major_dot_minor_version) + \
+                build
+            retag = {'pattern': f"*-cp{py_version_nodot}-{abi_tag}-linux_x86_64.whl", 'platform': new_dist_target}
+
+        # test the library
+        # (not supported yet)
+
+    return {
+        'target': target,
+        'minor': minor,
+        'name': f"cp{py_version_nodot}-{target}",
+        'image_name': image_name,
+        'build_command': build_command,
+        'test_command': test_command,
+        'repair': repair,
+        'retag': retag,
+        'user_build_command': user_build_command,
+        'abi3': abi3
+    }
+
+def uses_limited_api(workspace='.'):
+    """
+    Check if the project builds its extension against the limited API, producing abi3 wheels.
+
+    Parameters:
+    - workspace (str): The path to the workspace.
+
+    Returns:
+    - bool: True if one of LIMITED_API_FILES enables the limited API.
+    """
+    for filename in LIMITED_API_FILES:
+        try:
+            with open(os.path.join(workspace, filename)) as f:
+                if LIMITED_API_PATTERN.search(f.read()):
+                    return True
+        except OSError:
+            continue
+    return False
+
+def is_abi3_wheel(wheel):
+    """
+    Check if a wheel is built for the stable ABI.
+
+    Parameters:
+    - wheel (str): The filename of the wheel.
+
+    Returns:
+    - bool: True if the ABI tag of the wheel is abi3.
+    """
+    return '-abi3-' in os.path.basename(wheel)
+
+def share_abi3_builds(lvl3_jobs):
+    """
+    Build the abi3 wheel of every target only once, with the oldest Python version, and
+    test it with every Python version. The other jobs of the target keep only their test
+    and reference the job that builds the wheel in 'abi3_provider'.
+
+    Parameters:
+    - lvl3_jobs (list): List of jobs returned by get_lvl3_job with abi3=True, updated in place.
+    """
+    providers = {}
+    for lvl3_job in sorted(lvl3_jobs, key=lambda job: int(job['minor'])):
+        if lvl3_job['build_command'] is None:
+            continue
+        provider = providers.setdefault(lvl3_job['target'], lvl3_job)
+        if provider is lvl3_job:
+            print(f">> Building the abi3 wheel for {lvl3_job['target']} once with Python 3.{lvl3_job['minor']}")
+        else:
+            lvl3_job['build_command'] = None
+            lvl3_job['abi3_provider'] = provider
+
+def copy_test_wheels(lvl3_job, job_workspace):
+    """
+    Copy the wheels to test into the workspace of a job that does not build them itself.
+
+    Parameters:
+    - lvl3_job (dict): The job returned by get_lvl3_job.
+    - job_workspace (str): The path of the job workspace.
+    """
+    provider = lvl3_job.get('abi3_provider')
+    if provider is not None:
+        wheels = provider.get('wheels', provider.get('cached_wheels'))
+    else:
+        wheels = lvl3_job.get('cached_wheels')
+
+    job_dist = os.path.join(job_workspace, 'dist')
+    os.makedirs(job_dist, exist_ok=True)
+    if wheels is not None:
+        # test the wheels of the build job or the up to date wheels of a previous run
+        for wheel in wheels:
+            shutil.copy2(os.path.join('dist', wheel), job_dist)
+    elif os.path.isdir('dist'):
+        # test the wheels already present in the workspace
+        shutil.copytree('dist', job_dist, dirs_exist_ok=True)
+
+def is_root_output(path):
+    """
+    Check if a workspace path is left out of the job workspaces: a pookie file or a build output
+    at the root of the workspace (see ROOT_IGNORE_PATTERNS), or a bytecode cache at any depth.
+
+    Parameters:
+    - path (str): The path relative to the workspace.
+
+    Returns:
+    - bool: True if the path is left out of the job workspaces.
+    """
+    parts = path.split('/')
+    return any(fnmatch.fnmatch(parts[0], pattern) for pattern in ROOT_IGNORE_PATTERNS) or '__pycache__' in parts
+
+def link_or_copy(src, dst):
+    """
+    Hard link a file, or copy it when it cannot be linked (e.g., across file systems).
+
+    Parameters:
+    - src (str): The path of the file.
+    - dst (str): The path of the link or copy.
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def prepare_job_workspace(job_name):
+    """
+    Create a private copy of the workspace for a job so that parallel jobs do not
+    share the dist, build and wrapper files of the workspace.
+    Only the source files are copied (see build_fingerprint.list_workspace_files, respecting .gitignore in
+    git repositories), less the pookie files and build outputs at the root of the workspace (see is_root_output).
+    The git directory is kept for the builds versioned from git (e.g., setuptools-scm), its objects,
+    which git never modifies, being hard linked rather than copied.
+
+    Parameters:
+    - job_name (str): The name of the job.
+
+    Returns:
+    - str: The path of the job workspace relative to the workspace.
+    """
+    job_workspace = os.path.join(JOBS_DIR, job_name)
+    shutil.rmtree(job_workspace, ignore_errors=True)
+    os.makedirs(job_workspace)
+
+    for path in list_workspace_files('.', is_root_output):
+        os.makedirs(os.path.join(job_workspace, os.path.dirname(path)), exist_ok=True)
+        shutil.copy2(path, os.path.join(job_workspace, path), follow_symlinks=False)
+
+    if os.path.isdir('.git'):
+        def copy_git_file(src, dst):
+            if os.path.relpath(src, '.git').split(os.sep)[0] == 'objects':
+                link_or_copy(src, dst)
+            else:
+                shutil.copy2(src, dst)
+        shutil.copytree('.git', os.path.join(job_workspace, '.git'), symlinks=True, copy_function=copy_git_file)
+    elif os.path.isfile('.git'):
+        shutil.copy2('.git', os.path.join(job_workspace, '.git'))
+    return job_workspace
+
+def collect_job_dist(job_workspace):
+    """
+    Copy the wheels built in a job workspace into the dist directory of the workspace.
+
+    Parameters:
+    - job_workspace (str): The path of the job workspace.
+
+    Returns:
+    - list: The filenames of the copied wheels.
+    """
+    os.makedirs('dist', exist_ok=True)
+    wheels = []
+    for wheel in glob.glob(os.path.join(job_workspace, 'dist', '*.whl')):
+        shutil.copy2(wheel, 'dist')
+        wheels.append(os.path.basename(wheel))
+    return wheels
+
+def list_dist_wheels(dist_dir='dist'):
+    """
+    List the wheels of a dist directory with their modification times.
+
+    Parameters:
+    - dist_dir (str): The dist directory.
+
+    Returns:
+    - dict: Mapping of wheel filename to modification time.
+    """
+    return {
+        os.path.basename(wheel): os.path.getmtime(wheel)
+        for wheel in glob.glob(os.path.join(dist_dir, '*.whl'))
+    }
+
+def skip_up_to_date_builds(lvl3_jobs, flags):
+    """
+    Fingerprint the build of every level 3 job and drop the builds whose wheels,
+    produced by a previous run with the same fingerprint, are still in the dist directory.
+    The fingerprint covers the workspace source tree, the user build command, the target,
+    the Python version, the non-native mode chosen for the job, whether it builds an abi3 wheel,
+    the given flags and the level 3 image ID.
+
+    Parameters:
+    - lvl3_jobs (list): List of jobs returned by get_lvl3_job, updated in place.
+    - flags (list): Other options that change the build (e.g., compiler and non-native mode).
+    """
+    tree_hash = hash_workspace('.')
+
+    for lvl3_job in lvl3_jobs:
+        if lvl3_job['build_command'] is None:
+            continue
+
+        image = get_image(lvl3_job['image_name'])
+        # the user command rather than the wrapped one, which changes with --trace
+        lvl3_job['fingerprint'] = compute_fingerprint(tree_hash, [
+            lvl3_job['user_build_command'],
+            lvl3_job['target'],
+            lvl3_job['minor'],
+            lvl3_job.get('mode'),
+            lvl3_job['abi3'],
+            *flags,
+            image['id'] if image else None
+        ])
+
+        wheels = get_cached_wheels(lvl3_job['fingerprint'])
+        if wheels is not None:
+            print(f">> Skipping the build for {lvl3_job['name']}, {', '.join(wheels)} is up to date")
+            lvl3_job['build_command'] = None
+            lvl3_job['cached_wheels'] = wheels
+
+def get_phase_graph(lvl3_jobs):
+    """
+    Get the graph of the build and test phases of the level 3 jobs.
+    The test of a target and Python version depends on its build, or, for abi3 wheels,
+    on the build of the oldest Python version of the target.
+
+    Parameters:
+    - lvl3_jobs (list): List of jobs returned by get_lvl3_job, with their 'costs' when estimated (see job_costs).
+
+    Returns:
+    - dict: Mapping of phase name (e.g., "cp312-manylinux_2_17_s390x-build") to a dictionary with the keys
+      'job', 'phase', 'deps' (list of phase names) and 'cost' (estimated seconds, 0 when not estimated).
+    """
+    graph = {}
+    for lvl3_job in lvl3_jobs:
+        costs = lvl3_job.get('costs', {})
+        build_deps = []
+        if lvl3_job['build_command'] is not None:
+            graph[f"{lvl3_job['name']}-build"] = {
+                'job': lvl3_job,
+                'phase': 'build',
+                'deps': [],
+                'cost': costs.get('build', (0,))[0]
+            }
+            build_deps = [f"{lvl3_job['name']}-build"]
+        provider = lvl3_job.get('abi3_provider')
+        if provider is not None and provider['build_command'] is not None:
+            # the abi3 wheel is built by the job of the oldest Python version
+            build_deps = [f"{provider['name']}-build"]
+        if lvl3_job['test_command'] is not None:
+            graph[f"{lvl3_job['name']}-test"] = {
+                'job': lvl3_job,
+                'phase': 'test',
+                'deps': build_deps,
+                'cost': costs.get('test', (0,))[0]
+            }
+    return graph
+
+def print_plan(lvl3_jobs, jobs):
+    """
+    Print the build and test phases that would run, in the order they would start, with their estimated
+    duration and the length of the longest path starting at them, and the estimated duration of the run.
+
+    Parameters:
+    - lvl3_jobs (list): List of jobs returned by get_lvl3_job, with their 'costs' (see job_costs).
+    - jobs (int): Maximum number of containers running at the same time.
+    """
+    graph = get_phase_graph(lvl3_jobs)
+    critical_paths = get_critical_paths(graph)
+    skipped = [lvl3_job['name'] for lvl3_job in lvl3_jobs if lvl3_job['build_command'] is None and lvl3_job.get('cached_wheels')]
+
+    print(f">> Plan: {len(graph)} build and test phases on {jobs} worker(s), longest path first")
+    for phase_name in sorted(graph, key=lambda phase_name: -critical_paths[phase_name]):
+        phase_job = graph[phase_name]
+        seconds, source, kind = phase_job['job']['costs'][phase_job['phase']]
+        deps = f" after {', '.join(phase_job['deps'])}" if phase_job['deps'] else ''
+        print(f"- {phase_name} [{kind}]: ~{seconds:.0f}s ({source}), path ~{critical_paths[phase_name]:.0f}s{deps}")
+    for name in skipped:
+        print(f"- {name}-build: up to date, skipped")
+
+    total = sum(phase_job['cost'] for phase_job in graph.values())
+    makespan = estimate_makespan(graph, jobs)
+    print(f">> Estimated duration: ~{makespan:.0f}s with {jobs} worker(s) (~{total:.0f}s of work)")
+
+def run_docker_images_in_parallel(lvl3_jobs, host_workspace_path, jobs, warm_containers=False, tty=False, job_timeout=None, test_shards=1, docker_hosts=None):
+    """
+    Run the build and test commands of the level 3 jobs on a pool of workers.
+    Each job runs in its own copy of the workspace and logs to its own file in the logs directory.
+    The test of a target and Python version only starts after its build succeeded
+    (or, for abi3 wheels, after the build of the oldest Python version of the target succeeded).
+    When Docker hosts are given, every phase takes a slot on one of them, preferably the host
+    that built the job for its test, and there are as many workers as slots.
+
+    Parameters:
+    - lvl3_jobs (list): List of jobs returned by get_lvl3_job.
+    - host_workspace_path (str): Path to the host workspace.
+    - jobs (int): Maximum number of containers running at the same time.
+    - warm_containers (bool): Whether to run the build and test of a job in the same container.
+    - tty (bool): Whether to allocate a pseudo-terminal for the containers.
+    - job_timeout (float): Seconds after which the build or test of a job is stopped, or None.
+    - test_shards (int): The number of shards the tests of the emulated targets are split into.
+    - docker_hosts (list): The Docker hosts (see docker_hosts.parse_docker_host), or None to run every job on the local Docker daemon.
+
+    Returns:
+    - dict: Mapping of job name to its status ('ok', 'failed' or 'skipped').
+    """
+    containers = {} if warm_containers else None
+    workspaces = {}
+    if docker_hosts:
+        set_docker_hosts(docker_hosts)
+        jobs = sum(host['slots'] for host in docker_hosts)
+
+    def make_phase(lvl3_job, phase, job_workspace):
+        def run_phase():
+            if not docker_hosts:
+                return run_phase_on_host()
+            host = acquire_docker_host(lvl3_job.get('docker_host'))
+            lvl3_job['docker_host'] = host
+            try:
+                return run_phase_on_host()
+            finally:
+                release_docker_host(host)
+
+        def run_phase_on_host():
+            log_jobs = get_test_shards(lvl3_job, test_shards) if phase == 'test' else [lvl3_job]
+            on_host = f" on {lvl3_job['docker_host']['name']}" if docker_hosts else ''
+            print(f">> Started {phase} for {lvl3_job['name']}{on_host} (log: {', '.join(get_job_log_path(log_job, phase) for log_job in log_jobs)})")
+            if phase == 'test' and lvl3_job['build_command'] is None:
+                copy_test_wheels(lvl3_job, job_workspace)
+            if phase == 'build':
+                returncode = run_lvl3_job_build(
+                    lvl3_job,
+                    f"{host_workspace_path}/{job_workspace}",
+                    job_workspace,
+                    tty=tty,
+                    containers=containers,
+                    timeout=job_timeout)
+            else:
+                returncode = run_lvl3_job_test(
+                    lvl3_job,
+                    f"{host_workspace_path}/{job_workspace}",
+                    job_workspace,
+                    tty=tty,
+                    containers=containers,
+                    timeout=job_timeout,
+                    test_shards=test_shards)
+            if phase == 'test' or lvl3_job['test_command'] is None or returncode != 0:
+                stop_lvl3_job_container(lvl3_job, containers)
+            if phase == 'build' and returncode == 0:
+                wheels = collect_job_dist(job_workspace)
+                lvl3_job['wheels'] = wheels
+                if 'fingerprint' in lvl3_job:
+                    record_wheels(lvl3_job['fingerprint'], lvl3_job['name'], wheels)
+            print(f">> Finished {phase} for {lvl3_job['name']} (exit code {returncode})")
+            return returncode == 0
+        return run_phase
+
+    graph = {}
+    for phase_name, phase_job in get_phase_graph(lvl3_jobs).items():
+        lvl3_job = phase_job['job']
+        if lvl3_job['name'] not in workspaces:
+            workspaces[lvl3_job['name']] = prepare_job_workspace(lvl3_job['name'])
+        graph[phase_name] = {
+            'func': make_phase(lvl3_job, phase_job['phase'], workspaces[lvl3_job['name']]),
+            'deps': phase_job['deps'],
+            'cost': phase_job['cost']
+        }
+
+    try:
+        status = run_job_graph(graph, jobs)
+    finally:
+        for lvl3_job in lvl3_jobs:
+            stop_lvl3_job_container(lvl3_job, containers)
+        shutil.rmtree(JOBS_DIR, ignore_errors=True)
+
+    print(">> Jobs summary")
+    for name, job_status in status.items():
+        print(f"- {name}: {job_status}")
+
+    return status
+
+def run_docker_images(targets, logfile, python_versions_dic, build, test, linux_x86_64_compiler, linux_non_native_mode, host_workspace_path, jobs=1, warm_containers=False, cache_dir=None, host_cache_path=None, wheelhouse_packages=None, incremental=False, abi3=False, ccache=False, tty=False, job_timeout=None, non_native_mode_ttl=DEFAULT_MODE_TTL, test_shards=1, plan=False, docker_hosts=None):
+    """
+    Run Docker images for building and testing the library.
+    The duration of every phase is estimated from the previous runs of the project (see job_costs),
+    so that the parallel runs start the longest jobs first, and recorded once it ran.
+    Every run is also recorded in the run history of the cache directory (see run_history).
+
+    Parameters:
+    - targets (list): List of target architectures.
+    - logfile (file object): File object where the output of the builds is also appended when jobs is 1.
+    - python_versions_dic (dict): Dictionary of Python versions.
+    - build (str): Command to build the library.
+    - test (str): Command to test the library.
+    - host_workspace_path (str): Path to the host workspace.
+    - jobs (int): Maximum number of containers running at the same time (default: 1).
+    - warm_containers (bool): Whether to keep one container per level 3 image for the build and the test (default: False).
+    - cache_dir (str): The pookie cache directory, or None to run without the shared pip cache.
+    - host_cache_path (str): The path of the pookie cache directory on the host.
+    - wheelhouse_packages (list): Packages to pre-build once per image into its wheelhouse.
+    - incremental (bool): Whether to skip the builds whose inputs did not change since the wheels in dist were built (default: False).
+    - abi3 (bool): Whether the library is built as a stable ABI wheel, built once per target and tested with every Python version (default: False).
+    - ccache (bool): Whether to compile through a persistent compiler cache per toolchain, requires cache_dir (default: False).
+    - tty (bool): Whether to allocate a pseudo-terminal for the containers (default: False).
+    - job_timeout (float): Seconds after which the build or test of a job is stopped, or None for no limit.
+    - non_native_mode_ttl (int): With the 'auto' non-native mode, seconds after which the time and outcome of a mode are measured again.
+    - test_shards (int): The number of containers the tests of the emulated targets are split into (default: 1).
+    - plan (bool): Whether to only print the phases that would run and their estimated duration (default: False).
+    - docker_hosts (list): The Docker hosts the jobs are distributed across (see docker_hosts.parse_docker_host),
+      replacing jobs by their total number of slots, or None to run every job on the local Docker daemon.
+    """
+
+    if not abi3 and build != None and uses_limited_api('.'):
+        print(">> The project uses the limited API, building abi3 wheels")
+        abi3 = True
+
+    # oldest Python version first, it builds the abi3 wheels
+    minors = sorted(python_versions_dic, key=int)
+
+    # choose the non-native mode of every target from the previous builds of the project
+    non_native_modes = {}
+    if linux_non_native_mode == 'auto' and build != None:
+        modes_path = os.path.join(cache_dir or POOKIE_DIR, MODES_FILE)
+        tree_hash = hash_workspace('.')
+        non_native_modes = select_modes(modes_path, host_workspace_path, targets, tree_hash, non_native_mode_ttl)
+        for target, (mode, fallback_mode) in non_native_modes.items():
+            print(f">> Building {target} in {mode} mode (falling back to {fallback_mode} mode)")
+
+    def get_mode_lvl3_job(target, minor, mode):
+        lvl3_job = get_lvl3_job(target, minor, build, test, linux_x86_64_compiler, mode, abi3)
+        if target in non_native_modes:
+            lvl3_job['mode'] = mode
+        return lvl3_job
+
+    def add_caches(lvl3_job, mode):
+        add_pip_cache(lvl3_job, cache_dir, host_cache_path, wheelhouse_packages)
+        if ccache:
+            toolchain = get_ccache_toolchain(lvl3_job['target'], linux_x86_64_compiler, mode)
+            add_compiler_cache(lvl3_job, cache_dir, host_cache_path, toolchain)
+
+    default_mode = 'cross' if linux_non_native_mode == 'auto' else linux_non_native_mode
+    lvl3_jobs = [
+        get_mode_lvl3_job(target, minor, non_native_modes.get(target, (default_mode,))[0])
+        for target in targets
+        for minor in minors
+    ]
+
+    if abi3:
+        share_abi3_builds(lvl3_jobs)
+
+    if incremental:
+        skip_up_to_date_builds(lvl3_jobs, [linux_x86_64_compiler, linux_non_native_mode, ccache, sorted(wheelhouse_packages or [])])
+
+    # estimate the duration of every phase from the previous runs of the project
+    durations_path = os.path.join(cache_dir or POOKIE_DIR, DURATIONS_FILE)
+    estimate_job_costs(lvl3_jobs, load_job_durations(durations_path).get(host_workspace_path, {}), linux_non_native_mode, test_shards)
+
+    if docker_hosts:
+        jobs = sum(host['slots'] for host in docker_hosts)
+
+    # the plan leaves the caches untouched
+    if plan:
+        print_plan(lvl3_jobs, jobs)
+        return
+
+    if cache_dir is not None:
+        for lvl3_job in lvl3_jobs:
+            add_caches(lvl3_job, lvl3_job.get('mode', default_mode))
+
+    for lvl3_job in lvl3_jobs:
+        if lvl3_job['target'] in non_native_modes and lvl3_job['build_command'] is not None:
+            fallback_mode = non_native_modes[lvl3_job['target']][1]
+            fallback_job = get_mode_lvl3_job(lvl3_job['target'], lvl3_job['minor'], fallback_mode)
+            if cache_dir is not None:
+                add_caches(fallback_job, fallback_mode)
+            add_non_native_fallback(lvl3_job, fallback_job)
+
+    started = time.time()
+    if jobs > 1 or docker_hosts:
+        run_docker_images_in_parallel(lvl3_jobs, host_workspace_path, jobs, warm_containers, tty, job_timeout, test_shards, docker_hosts)
+    else:
+        run_docker_images_sequentially(lvl3_jobs, logfile, build, test, linux_x86_64_compiler, linux_non_native_mode, host_workspace_path, abi3, warm_containers, tty, job_timeout, test_shards)
+
+    print_ccache_stats(lvl3_jobs)
+    record_job_durations(durations_path, host_workspace_path, lvl3_jobs, linux_non_native_mode)
+    try:
+        record_run(os.path.join(cache_dir or POOKIE_DIR, HISTORY_FILE), host_workspace_path, lvl3_jobs, started, {
+            'targets': targets,
+            'minors': minors,
+            'jobs': jobs,
+            'linux_non_native_mode': linux_non_native_mode,
+            'linux_x86_64_compiler': linux_x86_64_compiler,
+            'abi3': abi3,
+            'incremental': incremental,
+            'test_shards': test_shards
+        })
+    except sqlite3.Error as e:
+        print(f">> Failed to record the run in the run history: {e}")
+
+    if non_native_modes:
+        record_mode_results(modes_path, host_workspace_path, tree_hash, [
+            (lvl3_job['target'], *result)
+            for lvl3_job in lvl3_jobs
+            for result in lvl3_job.get('mode_results', [])
+        ])
+
+def run_docker_images_sequentially(lvl3_jobs, logfile, build, test, linux_x86_64_compiler, linux_non_native_mode, host_workspace_path, abi3=False, warm_containers=False, tty=False, job_timeout=None, test_shards=1):
+    """
+    Run the build and test commands of the level 3 jobs one after the other in the workspace.
+
+    Parameters:
+    - lvl3_jobs (list): List of jobs returned by get_lvl3_job.
+    - logfile (file object): File object where the output of the builds is also appended.
+    - build (str): Command to build the library.
+    - test (str): Command to test the library.
+    - linux_x86_64_compiler (str): Compiler to use for linux x86_64 targets.
+    - linux_non_native_mode (str): Compilation mode for non-native linux targets.
+    - host_workspace_path (str): Path to the host workspace.
+    - abi3 (bool): Whether the library is built as a stable ABI wheel.
+    - warm_containers (bool): Whether to run the build and test of a job in the same container.
+    - tty (bool): Whether to allocate a pseudo-terminal for the containers.
+    - job_timeout (float): Seconds after which the build or test of a job is stopped, or None.
+    - test_shards (int): The number of shards the tests of the emulated targets are split into.
+    """
+    containers = {} if warm_containers else None
+
+    # Run build and test commands
+    for lvl3_job in lvl3_jobs:
+        try:
+            returncode = 0
+
+            # build the library
+            if lvl3_job['build_command'] != None:
+                print(f">> Building the library for {lvl3_job['name']}")
+                dist_before = list_dist_wheels()
+                returncode = run_lvl3_job_build(lvl3_job, host_workspace_path, '.', tty, containers, logfile, job_timeout)
+                wheels = [
+                    wheel for wheel, mtime in list_dist_wheels().items()
+                    if dist_before.get(wheel) != mtime
+                ]
+                if returncode == 0:
+                    lvl3_job['wheels'] = wheels
+                if returncode == 0 and 'fingerprint' in lvl3_job:
+                    record_wheels(lvl3_job['fingerprint'], lvl3_job['name'], wheels)
+
+                # abi3 wheels built without the flag are tested with the next Python versions instead of rebuilt
+                if returncode == 0 and not abi3 and any(is_abi3_wheel(wheel) for wheel in wheels):
+                    for next_job in lvl3_jobs[lvl3_jobs.index(lvl3_job) + 1:]:
+                        if next_job['target'] == lvl3_job['target'] and next_job['build_command'] != None:
+                            print(f">> {lvl3_job['name']} built an abi3 wheel, skipping the build for {next_job['name']} (use --abi3 to plan it ahead)")
+                            next_job['build_command'] = None
+                            next_job['test_command'] = get_lvl3_job(next_job['target'], next_job['minor'], build, test, linux_x86_64_compiler, next_job.get('mode', linux_non_native_mode), True)['test_command']
+
+            # test the library
+            if test != None and returncode != 0:
+                print(f">> The build for {lvl3_job['name']} failed, skipping its test")
+            elif test != None:
+                print(f">> Testing the library for {lvl3_job['name']}")
+                if lvl3_job['test_command'] != None:
+                    run_lvl3_job_test(lvl3_job, host_workspace_path, '.', tty, containers, job_timeout, test_shards)
+                else:
+                    print("Not supported yet :(")
 
-                    print(f">> Testing the library for cp{py_version_nodot}-{target}")
-                    print("Not supported yet :(")
\ No newline at end of file
+        finally:
+            stop_lvl3_job_container(lvl3_job, containers)
@@ -0,0 +1,166 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import shlex
+import shutil
+from docker_images_builder import TARGET_IMAGES, get_image_graph
+from docker_image_inventory import load_image_inventory, get_image
+from trace_events import trace_span
+from docker_engine import run_command, capture_command
+
+# Compressors of the image archives by file extension, the first one installed is used.
+# 'docker load' detects the compression by itself.
+COMPRESSORS = {
+    '.tar': [],
+    '.gz': [['pigz', '-c'], ['gzip', '-c']],
+    '.tgz': [['pigz', '-c'], ['gzip', '-c']],
+    '.zst': [['zstd', '-T0', '-q', '-c']],
+    '.xz': [['xz', '-T0', '-c']]
+}
+
+LOADED_IMAGE_PREFIX = 'Loaded image: '
+
+def get_compressor(path):
+    """
+    Get the compressor of an image archive from its file extension.
+
+    Parameters:
+    - path (str): The path of the archive (e.g., "pookie-images.tar.zst").
+
+    Returns:
+    - list: The command line of the compressor, or an empty list for a plain tar file.
+
+    Raises:
+    - ValueError: If the extension is not supported or its compressor is not installed.
+    """
+    extension = os.path.splitext(path)[1]
+    if extension not in COMPRESSORS:
+        raise ValueError(f"Unsupported image archive extension '{extension}' (use one of {', '.join(COMPRESSORS)})")
+    if not COMPRESSORS[extension]:
+        return []
+    for compressor in COMPRESSORS[extension]:
+        if shutil.which(compressor[0]):
+            return compressor
+    raise ValueError(f"No compressor installed for '{extension}' archives ({', '.join(c[0] for c in COMPRESSORS[extension])})")
+
+def get_bundle_images(targets, python_versions_dic):
+    """
+    List the level 1, 2 and 3 images of the selected targets and Python versions, parents first.
+    The level 1 image of win-macosx-pookie, left out of the layer graph because the pookie image
+    is built on it, is included so that a node provisioned from the archive has every image.
+
+    Parameters:
+    - targets (list): List of target architectures.
+    - python_versions_dic (dict): Dictionary containing Python versions and their URLs.
+
+    Returns:
+    - list: The image names.
+    """
+    graph = get_image_graph(targets, python_versions_dic)
+    images = []
+    if any(TARGET_IMAGES[target][1] is None for target in targets):
+        images.append('win-macosx-pookie-lvl1-base')
+    for level in (1, 2, 3):
+        images += [image_name for image_name, image in graph.items() if image['level'] == level]
+    return images
+
+def export_images(path, targets, python_versions_dic, logfile):
+    """
+    Save the images of the selected targets and Python versions into a single archive with
+    'docker save', which stores the layers shared by several images only once, compressing it
+    on the fly according to its extension (see COMPRESSORS). The archive is replaced atomically.
+
+    Parameters:
+    - path (str): The path of the archive.
+    - targets (list): List of target architectures.
+    - python_versions_dic (dict): Dictionary containing Python versions and their URLs.
+    - logfile (file object): File object to log the output of docker.
+
+    Returns:
+    - int: 0 if the archive was written, 1 otherwise.
+    """
+    try:
+        compressor = get_compressor(path)
+    except ValueError as e:
+        print(f">> Cannot export the images: {e}")
+        return 1
+
+    load_image_inventory()
+    images = []
+    for image_name in get_bundle_images(targets, python_versions_dic):
+        if get_image(image_name) is None:
+            print(f">> Docker image {image_name} does not exist, it is not exported")
+        else:
+            images.append(image_name)
+    if not images:
+        print(">> No docker image to export")
+        return 1
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    command = shlex.join(['docker', 'save'] + images)
+    if compressor:
+        command += ' | ' + shlex.join(compressor)
+    command = f"set -o pipefail; {command} > {shlex.quote(tmp_path)}"
+
+    print(f">> Exporting {len(images)} docker images to {path}")
+    with trace_span('docker save'):
+        returncode = run_command(['bash', '-c', command], logfile=logfile)
+    if returncode != 0:
+        print(f">> Failed to export the docker images to {path}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return 1
+    os.replace(tmp_path, path)
+    print(f">> Exported {len(images)} docker images to {path} ({os.path.getsize(path) / 1000 ** 3:.2f} GB)")
+    return 0
+
+def import_images(path, logfile):
+    """
+    Load the images of an archive written by export_images with 'docker load' and refresh the image inventory.
+
+    Parameters:
+    - path (str): The path of the archive.
+    - logfile (file object): File object to log the output of docker.
+
+    Returns:
+    - int: 0 if the images were loaded, 1 otherwise.
+    """
+    if not os.path.isfile(path):
+        print(f">> Image archive {path} does not exist")
+        return 1
+
+    print(f">> Importing docker images from {path}")
+    with trace_span('docker load'):
+        returncode, stdout, stderr = capture_command([
+            'docker',
+                'load',
+                '-i',
+                    path])
+    logfile.write(stdout + stderr)
+    logfile.flush()
+    if returncode != 0:
+        print(f">> Failed to import the docker images from {path}")
+        return 1
+
+    loaded = [line[len(LOADED_IMAGE_PREFIX):] for line in stdout.splitlines() if line.startswith(LOADED_IMAGE_PREFIX)]
+    load_image_inventory(refresh=True)
+    print(f">> Imported {len(loaded)} docker images from {path}")
+    return 0
@@ -0,0 +1,224 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+from docker_images_builder import TARGET_IMAGES
+from docker_image_inventory import load_image_inventory, normalize_image_name, remove_image
+from docker_engine import capture_command
+
+USAGE_FILE = 'images.json'
+DEFAULT_MAX_IMAGE_BYTES = 200 * 1000 ** 3
+
+# Images never removed: the pookie image and the level 1 bases
+PROTECTED_IMAGES = ['win-macosx-pookie-lvl1-base', 'win-macosx-pookie-lvl2-pookie']
+
+_usage_lock = threading.Lock()
+
+def load_image_usage(cache_dir):
+    """
+    Load the last time every image was used by pookie.
+
+    Parameters:
+    - cache_dir (str): The pookie cache directory.
+
+    Returns:
+    - dict: Mapping of image name (without tag) to the last time it was used, in seconds since the epoch.
+    """
+    try:
+        with open(os.path.join(cache_dir, USAGE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_image_usage(cache_dir, usage):
+    """
+    Atomically write the last time every image was used.
+
+    Parameters:
+    - cache_dir (str): The pookie cache directory.
+    - usage (dict): The usage to write (see load_image_usage).
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(usage, f, indent=2)
+    os.replace(tmp_path, os.path.join(cache_dir, USAGE_FILE))
+
+def record_image_use(cache_dir, image_names, now=None):
+    """
+    Record that images were used by the current run.
+
+    Parameters:
+    - cache_dir (str): The pookie cache directory.
+    - image_names (iterable): The names of the images.
+    - now (float): The current time, in seconds since the epoch (default: time.time()).
+    """
+    now = time.time() if now is None else now
+    with _usage_lock:
+        usage = load_image_usage(cache_dir)
+        for image_name in image_names:
+            usage[image_name] = now
+        save_image_usage(cache_dir, usage)
+
+def get_image_level(image_name):
+    """
+    Get the level of a pookie image in the Docker layer graph from its name.
+
+    Parameters:
+    - image_name (str): The name of the image, without tag (e.g., "manylinux-lvl3-cp312-manylinux_2_17_x86_64").
+
+    Returns:
+    - int: The level (1, 2 or 3), or None if it is not a pookie image.
+    """
+    for tree in set(tree for tree, _, _ in TARGET_IMAGES.values()):
+        for level in (1, 2, 3):
+            if image_name.startswith(f"{tree}-lvl{level}-"):
+                return level
+    return None
+
+def get_image_parent(image_name):
+    """
+    Get the parent of a pookie image in the Docker layer graph from its name.
+
+    Parameters:
+    - image_name (str): The name of the image, without tag.
+
+    Returns:
+    - str: The name of the parent image, or None if it is a level 1 image or not a pookie image.
+    """
+    level = get_image_level(image_name)
+    if level == 3 and image_name.startswith('manylinux-lvl3-cp') and image_name.endswith('-cross-python'):
+        return 'manylinux-lvl1-base'
+    for target, (tree, lvl1_image_name, lvl2_image_name) in TARGET_IMAGES.items():
+        if level == 3 and image_name.endswith(f"-{target}") and image_name.startswith(f"{tree}-lvl3-cp"):
+            return lvl2_image_name
+        if level == 2 and image_name == lvl2_image_name:
+            return lvl1_image_name or 'win-macosx-pookie-lvl1-base'
+    return None
+
+def get_created_time(created):
+    """
+    Convert the creation date printed by the docker CLI (e.g., "2025-01-01 10:00:00 +0000 UTC") into seconds since the epoch.
+
+    Parameters:
+    - created (str): The creation date.
+
+    Returns:
+    - float: The creation time, or 0 if it cannot be parsed.
+    """
+    try:
+        return datetime.datetime.strptime(created[:25], '%Y-%m-%d %H:%M:%S %z').timestamp()
+    except ValueError:
+        return 0
+
+def get_pookie_images(inventory):
+    """
+    Select the pookie images of the image inventory and estimate the disk space of each one.
+    The size listed by docker includes the layers of the parent image, so the size of the parent
+    is subtracted to count every shared layer once.
+
+    Parameters:
+    - inventory (dict): The image inventory (see docker_image_inventory.parse_image_inventory).
+
+    Returns:
+    - dict: Mapping of image name (without tag) to a dictionary with the keys 'level', 'parent',
+      'created' (seconds since the epoch) and 'size' (bytes of its own layers).
+    """
+    images = {}
+    for name, entry in inventory.items():
+        if not name.endswith(':latest'):
+            continue
+        image_name = name[:-len(':latest')]
+        level = get_image_level(image_name)
+        if level is None:
+            continue
+        images[image_name] = {
+            'level': level,
+            'parent': get_image_parent(image_name),
+            'created': get_created_time(entry['created']),
+            'size': entry['size']
+        }
+
+    for image in images.values():
+        parent = images.get(image['parent'])
+        image['own_size'] = max(image['size'] - parent['size'], 0) if parent is not None else image['size']
+    for image in images.values():
+        image['size'] = image.pop('own_size')
+    return images
+
+def collect_images(cache_dir, max_bytes, keep=()):
+    """
+    Remove the least recently used level 3 images, then the level 2 images left without any
+    level 3 image, until the pookie images take at most max_bytes. The images are listed and
+    sized with a single 'docker images' call. Images never used by pookie since they were
+    recorded count as used when they were created.
+
+    Parameters:
+    - cache_dir (str): The pookie cache directory.
+    - max_bytes (int): The maximum disk space of the pookie images.
+    - keep (iterable): Image names that must not be removed (e.g. those of the current matrix).
+
+    Returns:
+    - list: The names of the removed images.
+    """
+    images = get_pookie_images(load_image_inventory(refresh=True))
+    usage = load_image_usage(cache_dir)
+    keep = set(keep) | set(PROTECTED_IMAGES)
+
+    total = sum(image['size'] for image in images.values())
+    print(f">> Docker images of pookie take {total / 1000 ** 3:.2f} GB (budget: {max_bytes / 1000 ** 3:.2f} GB)")
+
+    def last_used(image_name):
+        return usage.get(image_name, images[image_name]['created'])
+
+    removed = []
+    for level in (3, 2):
+        if total <= max_bytes:
+            break
+        for image_name in sorted((name for name, image in images.items() if image['level'] == level), key=last_used):
+            if total <= max_bytes:
+                break
+            if image_name in keep:
+                continue
+            # a level 2 image is only removed once its level 3 images are gone
+            if any(image['parent'] == image_name for name, image in images.items() if name not in removed):
+                continue
+
+            returncode, stdout, stderr = capture_command(['docker', 'rmi', image_name])
+            if returncode != 0:
+                print(f">> Failed to remove docker image {image_name}: {stderr.strip()}")
+                continue
+            print(f">> Removed docker image {image_name} ({images[image_name]['size'] / 1000 ** 3:.2f} GB)")
+            remove_image(normalize_image_name(image_name))
+            total -= images[image_name]['size']
+            removed.append(image_name)
+
+    with _usage_lock:
+        usage = load_image_usage(cache_dir)
+        for image_name in removed:
+            usage.pop(image_name, None)
+        save_image_usage(cache_dir, usage)
+
+    if total > max_bytes:
+        print(f">> Docker images of pookie still take {total / 1000 ** 3:.2f} GB, the remaining images are in use by the current matrix")
+    return removed
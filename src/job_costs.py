@@ -0,0 +1,197 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import json
+import os
+import tempfile
+import threading
+from job_scheduler import get_critical_paths
+from non_native_modes import NON_NATIVE_TARGETS
+
+DURATIONS_FILE = 'job_durations.json'
+
+# Seconds of a native build and test when the project was never run
+DEFAULT_PHASE_SECONDS = {'build': 60, 'test': 30}
+
+# Relative cost of a phase by the way it runs: natively, cross-compiled, under QEMU or under Wine
+PHASE_WEIGHTS = {'native': 1, 'cross': 2, 'emulate': 8, 'wine': 4}
+
+NATIVE_TARGETS = ['manylinux_2_17_x86_64', 'musllinux_1_2_x86_64']
+
+_durations_lock = threading.Lock()
+
+def get_phase_kind(lvl3_job, phase, non_native_mode):
+    """
+    Get the way a phase of a level 3 job runs, which weights its cost.
+
+    Parameters:
+    - lvl3_job (dict): The job returned by get_lvl3_job.
+    - phase (str): The phase of the job ('build' or 'test').
+    - non_native_mode (str): The --linux-non-native-mode option ('cross', 'emulate' or 'auto').
+
+    Returns:
+    - str: 'native', 'cross', 'emulate' or 'wine' (see PHASE_WEIGHTS).
+    """
+    target = lvl3_job['target']
+    if target in NATIVE_TARGETS:
+        return 'native'
+    if target in NON_NATIVE_TARGETS:
+        if phase == 'test':
+            return 'emulate'
+        return lvl3_job.get('mode', 'cross' if non_native_mode == 'auto' else non_native_mode)
+    if target == 'win_amd64' and phase == 'test':
+        return 'wine'
+    return 'cross'
+
+def load_job_durations(path):
+    """
+    Load the durations of the jobs of the previous runs.
+
+    Parameters:
+    - path (str): The path of the durations file.
+
+    Returns:
+    - dict: Mapping of project to a mapping of job name to a mapping of phase to a dictionary
+      with the keys 'seconds' and 'kind' (see get_phase_kind).
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def record_job_durations(path, project, lvl3_jobs, non_native_mode):
+    """
+    Record the durations of the phases of the level 3 jobs that succeeded, found in their 'durations' key.
+
+    Parameters:
+    - path (str): The path of the durations file.
+    - project (str): The project, identified by the path of its workspace on the host.
+    - lvl3_jobs (list): The jobs of the run.
+    - non_native_mode (str): The --linux-non-native-mode option.
+    """
+    measured = [lvl3_job for lvl3_job in lvl3_jobs if lvl3_job.get('durations')]
+    if not measured:
+        return
+
+    with _durations_lock:
+        records = load_job_durations(path)
+        project_records = records.setdefault(project, {})
+        for lvl3_job in measured:
+            for phase, seconds in lvl3_job['durations'].items():
+                project_records.setdefault(lvl3_job['name'], {})[phase] = {
+                    'seconds': seconds,
+                    'kind': get_phase_kind(lvl3_job, phase, non_native_mode)
+                }
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(records, f, indent=2)
+        os.replace(tmp_path, path)
+
+def estimate_phase_cost(lvl3_job, phase, kind, project_records):
+    """
+    Estimate the duration of a phase of a level 3 job. In order of preference, it is the duration
+    of the same job in the previous run, the mean duration of the other Python versions of the target,
+    the weight of the phase (see PHASE_WEIGHTS) times the mean native duration of the previous runs,
+    or the weight times DEFAULT_PHASE_SECONDS.
+
+    Parameters:
+    - lvl3_job (dict): The job returned by get_lvl3_job.
+    - phase (str): The phase of the job ('build' or 'test').
+    - kind (str): The way the phase runs (see get_phase_kind).
+    - project_records (dict): The durations of the project (see load_job_durations).
+
+    Returns:
+    - tuple: The estimated seconds and where they come from.
+    """
+    record = project_records.get(lvl3_job['name'], {}).get(phase)
+    if record is not None and record['kind'] == kind:
+        return record['seconds'], 'previous run'
+
+    target_seconds = [
+        records[phase]['seconds']
+        for name, records in project_records.items()
+        if name.endswith(f"-{lvl3_job['target']}") and phase in records and records[phase]['kind'] == kind
+    ]
+    if target_seconds:
+        return sum(target_seconds) / len(target_seconds), 'other Python versions'
+
+    native_seconds = [
+        records[phase]['seconds'] / PHASE_WEIGHTS[records[phase]['kind']]
+        for records in project_records.values()
+        if phase in records
+    ]
+    if native_seconds:
+        return PHASE_WEIGHTS[kind] * sum(native_seconds) / len(native_seconds), f"{kind} weight, previous runs"
+    return PHASE_WEIGHTS[kind] * DEFAULT_PHASE_SECONDS[phase], f"{kind} weight"
+
+def estimate_job_costs(lvl3_jobs, project_records, non_native_mode, test_shards=1):
+    """
+    Estimate the duration of the build and test of every level 3 job into its 'costs' key,
+    a mapping of phase to a tuple of the seconds, where they come from and the kind of the phase.
+
+    Parameters:
+    - lvl3_jobs (list): The jobs of the run, updated in place.
+    - project_records (dict): The durations of the project (see load_job_durations).
+    - non_native_mode (str): The --linux-non-native-mode option.
+    - test_shards (int): The number of shards the emulated tests are split into, which divides
+      their estimated duration when it is not measured.
+    """
+    for lvl3_job in lvl3_jobs:
+        lvl3_job['costs'] = {}
+        for phase in ('build', 'test'):
+            if lvl3_job[f'{phase}_command'] is None:
+                continue
+            kind = get_phase_kind(lvl3_job, phase, non_native_mode)
+            seconds, source = estimate_phase_cost(lvl3_job, phase, kind, project_records)
+            if phase == 'test' and kind in ('emulate', 'wine') and 'weight' in source:
+                seconds /= test_shards
+            lvl3_job['costs'][phase] = (seconds, source, kind)
+
+def estimate_makespan(jobs, workers):
+    """
+    Estimate the duration of a graph of jobs run by run_job_graph, starting the jobs on the
+    longest remaining path first whenever a worker is free.
+
+    Parameters:
+    - jobs (dict): Mapping of job name to a dictionary with the keys 'deps' and 'cost' (seconds).
+    - workers (int): The maximum number of jobs running at the same time.
+
+    Returns:
+    - float: The estimated seconds until the last job ends.
+    """
+    critical_paths = get_critical_paths(jobs)
+    finished = {}
+    running = {}
+    now = 0
+    while len(finished) < len(jobs):
+        ready = sorted(
+            (name for name, job in jobs.items()
+             if name not in finished and name not in running and all(dep in finished for dep in job['deps'])),
+            key=lambda name: -critical_paths[name])
+        for name in ready[:max(workers - len(running), 0)]:
+            running[name] = now + jobs[name]['cost']
+        if not running:
+            break
+        name = min(running, key=running.get)
+        now = running.pop(name)
+        finished[name] = now
+    return now
@@ -0,0 +1,123 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import concurrent.futures
+
+def get_critical_paths(jobs):
+    """
+    Compute the length of the longest chain of jobs starting at every job of a graph,
+    which is the least time the run needs once the job starts.
+
+    Parameters:
+    - jobs (dict): Mapping of job name to a dictionary with the keys 'deps' (list of job names)
+      and, optionally, 'cost' (estimated duration, 0 by default).
+
+    Returns:
+    - dict: Mapping of job name to the cost of the job plus the longest path of its dependents.
+    """
+    dependents = {name: [] for name in jobs}
+    for name, job in jobs.items():
+        for dep in job.get('deps', []):
+            if dep in dependents:
+                dependents[dep].append(name)
+
+    lengths = {}
+    def get_length(name, visiting=()):
+        if name not in lengths:
+            if name in visiting:
+                # dependency cycle, its jobs are skipped anyway
+                return 0
+            lengths[name] = jobs[name].get('cost', 0) + max(
+                (get_length(dependent, visiting + (name,)) for dependent in dependents[name]),
+                default=0)
+        return lengths[name]
+
+    for name in jobs:
+        get_length(name)
+    return lengths
+
+def run_job_graph(jobs, max_workers):
+    """
+    Run a graph of jobs on a pool of worker threads.
+    A job starts as soon as every job it depends on has finished successfully.
+    Jobs whose dependencies failed or were skipped are skipped too.
+    When more jobs are ready than workers are free, the jobs on the longest remaining path
+    (see get_critical_paths) start first, so that the longest jobs do not end the run.
+
+    Parameters:
+    - jobs (dict): Mapping of job name to a dictionary with the keys 'func' (callable
+      with no arguments returning True on success), 'deps' (list of job names) and,
+      optionally, 'cost' (estimated duration, 0 by default).
+    - max_workers (int): Maximum number of jobs running at the same time.
+
+    Returns:
+    - dict: Mapping of job name to its status ('ok', 'failed' or 'skipped').
+    """
+    for name, job in jobs.items():
+        for dep in job.get('deps', []):
+            if dep not in jobs:
+                raise ValueError(f"Job {name} depends on unknown job {dep}")
+
+    critical_paths = get_critical_paths(jobs)
+    status = {}
+    pending = dict(jobs)
+    running = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+
+            # skip the jobs whose dependencies failed
+            changed = True
+            while changed:
+                changed = False
+                for name, job in list(pending.items()):
+                    if any(status.get(dep) in ('failed', 'skipped') for dep in job.get('deps', [])):
+                        status[name] = 'skipped'
+                        del pending[name]
+                        changed = True
+
+            # submit the jobs whose dependencies are resolved to the free workers, longest path first
+            ready = [
+                name for name, job in pending.items()
+                if all(status.get(dep) == 'ok' for dep in job.get('deps', []))
+            ]
+            ready.sort(key=lambda name: -critical_paths[name])
+            for name in ready[:max(max_workers - len(running), 0)]:
+                running[executor.submit(pending.pop(name)['func'])] = name
+
+            if not running:
+                # only reachable with a dependency cycle
+                for name in pending:
+                    status[name] = 'skipped'
+                break
+
+            try:
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            except KeyboardInterrupt:
+                # jobs not started yet are dropped, the running ones are stopped by their commands
+                for future in running:
+                    future.cancel()
+                raise
+            for future in done:
+                name = running.pop(future)
+                try:
+                    status[name] = 'ok' if future.result() else 'failed'
+                except Exception as e:
+                    print(f"Job {name} raised an exception: {e}")
+                    status[name] = 'failed'
+
+    return status
@@ -0,0 +1,118 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import queue
+import sys
+import threading
+
+# Directory of the logs of every image build and job phase, next to pookie.log
+LOGS_DIR = 'pookie_logs'
+
+READ_CHUNK_BYTES = 64 * 1024
+
+# Bounds of the live view: lines waiting to be printed and length of a single line.
+# When the terminal cannot keep up, lines are dropped from the live view (never from the log files)
+# so that a chatty build cannot stall the jobs.
+LIVE_QUEUE_LINES = 10000
+MAX_LINE_BYTES = 16 * 1024
+
+_live_queue = None
+_live_thread = None
+_dropped_lines = 0
+_dropped_lock = threading.Lock()
+
+def _print_live_lines():
+    """
+    Print the lines of the live view until the end marker (None) is received.
+    """
+    while True:
+        line = _live_queue.get()
+        if line is None:
+            break
+        sys.stdout.write(line)
+        if _live_queue.empty():
+            sys.stdout.flush()
+    sys.stdout.flush()
+
+def start_live_view():
+    """
+    Start printing the output of every container to the terminal, each line prefixed with its job name.
+    """
+    global _live_queue, _live_thread
+    if _live_thread is not None:
+        return
+    _live_queue = queue.Queue(maxsize=LIVE_QUEUE_LINES)
+    _live_thread = threading.Thread(target=_print_live_lines, daemon=True)
+    _live_thread.start()
+
+def stop_live_view():
+    """
+    Print the remaining lines of the live view and stop it.
+    """
+    global _live_queue, _live_thread, _dropped_lines
+    if _live_thread is None:
+        return
+    _live_queue.put(None)
+    _live_thread.join()
+    _live_queue = None
+    _live_thread = None
+    if _dropped_lines:
+        print(f">> {_dropped_lines} lines were not shown in the live view to keep up with the jobs, see the log files")
+        _dropped_lines = 0
+
+def is_live_view_started():
+    """
+    Check if the output of the containers is printed to the terminal.
+
+    Returns:
+    - bool: True if start_live_view was called.
+    """
+    return _live_thread is not None
+
+def show_line(prefix, line):
+    """
+    Send a line to the live view without waiting, dropping it if the live view is full.
+
+    Parameters:
+    - prefix (str): The job name printed before the line.
+    - line (bytes): The line, without its end of line.
+    """
+    global _dropped_lines
+    live_queue = _live_queue
+    if live_queue is None:
+        return
+    try:
+        live_queue.put_nowait(f"[{prefix}] {line.decode(errors='replace')}\n")
+    except queue.Full:
+        with _dropped_lock:
+            _dropped_lines += 1
+
+def print_log(prefix, log_path):
+    """
+    Print a log file to the terminal at once, each line prefixed with its job name.
+
+    Parameters:
+    - prefix (str): The job name.
+    - log_path (str): The path of the log file.
+    """
+    try:
+        with open(log_path, errors='replace') as f:
+            text = ''.join(f"[{prefix}] {line.rstrip()}\n" for line in f)
+    except OSError:
+        return
+    sys.stdout.write(text)
+    sys.stdout.flush()
@@ -0,0 +1,180 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+MODES_FILE = 'non_native_modes.json'
+
+# Non-native targets built either by cross-compilation or under QEMU emulation
+NON_NATIVE_TARGETS = [
+    'manylinux_2_17_aarch64',
+    'manylinux_2_17_armv7l',
+    'manylinux_2_17_ppc64le',
+    'manylinux_2_17_s390x'
+]
+
+# Modes in the order they are tried when nothing is known about them
+NON_NATIVE_MODES = ['cross', 'emulate']
+
+# Seconds after which the time and outcome of a mode are measured again
+DEFAULT_MODE_TTL = 7 * 24 * 3600
+
+_modes_lock = threading.Lock()
+
+def load_mode_records(path):
+    """
+    Load the recorded build times and outcomes of the non-native modes.
+
+    Parameters:
+    - path (str): The path of the modes file.
+
+    Returns:
+    - dict: Mapping of project to a mapping of target to a dictionary with the keys 'tree_hash'
+      (the workspace source tree of the last build) and 'modes' (mapping of mode to a dictionary
+      with the keys 'ok', 'seconds' and 'measured').
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def get_other_mode(mode):
+    """
+    Get the non-native mode to fall back to when a build fails.
+
+    Parameters:
+    - mode (str): The non-native mode ('cross' or 'emulate').
+
+    Returns:
+    - str: The other mode.
+    """
+    return 'emulate' if mode == 'cross' else 'cross'
+
+def get_known_modes(record, tree_hash):
+    """
+    Get the modes of a target whose outcome still holds for the workspace source tree.
+    When the sources changed, failed modes are forgotten since they may work now.
+
+    Parameters:
+    - record (dict): The record of the target, or None.
+    - tree_hash (str): The hash of the workspace source tree.
+
+    Returns:
+    - dict: Mapping of mode to its measure.
+    """
+    if record is None:
+        return {}
+    if record['tree_hash'] != tree_hash:
+        return {mode: measure for mode, measure in record['modes'].items() if measure['ok']}
+    return dict(record['modes'])
+
+def choose_mode(record, tree_hash, ttl=DEFAULT_MODE_TTL, now=None):
+    """
+    Choose the non-native mode of a target: the modes that were never measured, or not since ttl,
+    are tried first (cross before emulate), then the fastest mode that worked is used.
+
+    Parameters:
+    - record (dict): The record of the target (see load_mode_records), or None.
+    - tree_hash (str): The hash of the workspace source tree.
+    - ttl (int): Seconds during which a measure is trusted.
+    - now (float): The current time, in seconds since the epoch (default: now).
+
+    Returns:
+    - tuple: The mode to build with and the mode to fall back to if the build fails.
+    """
+    now = time.time() if now is None else now
+    modes = {
+        mode: measure for mode, measure in get_known_modes(record, tree_hash).items()
+        if now - measure['measured'] < ttl
+    }
+
+    for mode in NON_NATIVE_MODES:
+        if mode not in modes:
+            return mode, get_other_mode(mode)
+
+    working = [mode for mode in NON_NATIVE_MODES if modes[mode]['ok']]
+    if not working:
+        return NON_NATIVE_MODES[0], get_other_mode(NON_NATIVE_MODES[0])
+    best = min(working, key=lambda mode: modes[mode]['seconds'])
+    return best, get_other_mode(best)
+
+def select_modes(path, project, targets, tree_hash, ttl=DEFAULT_MODE_TTL):
+    """
+    Choose the non-native mode of every non-native target of a project.
+
+    Parameters:
+    - path (str): The path of the modes file.
+    - project (str): The project, identified by the path of its workspace on the host.
+    - targets (list): The target architectures.
+    - tree_hash (str): The hash of the workspace source tree.
+    - ttl (int): Seconds during which a measure is trusted.
+
+    Returns:
+    - dict: Mapping of non-native target to the mode to build with and the mode to fall back to.
+    """
+    records = load_mode_records(path).get(project, {})
+    return {
+        target: choose_mode(records.get(target), tree_hash, ttl)
+        for target in targets
+        if target in NON_NATIVE_TARGETS
+    }
+
+def record_mode_results(path, project, tree_hash, results):
+    """
+    Record the time and outcome of the builds of the non-native targets of a project.
+    A mode works for a target when all its builds succeeded, and its time is the mean build time.
+
+    Parameters:
+    - path (str): The path of the modes file.
+    - project (str): The project, identified by the path of its workspace on the host.
+    - tree_hash (str): The hash of the workspace source tree.
+    - results (list): Tuples of target, mode, success (bool) and build time in seconds.
+    """
+    if not results:
+        return
+
+    builds = {}
+    for target, mode, ok, seconds in results:
+        builds.setdefault(target, {}).setdefault(mode, []).append((ok, seconds))
+
+    now = time.time()
+    with _modes_lock:
+        records = load_mode_records(path)
+        project_records = records.setdefault(project, {})
+        for target, modes in builds.items():
+            known = get_known_modes(project_records.get(target), tree_hash)
+            for mode, mode_builds in modes.items():
+                ok = all(build_ok for build_ok, _ in mode_builds)
+                known[mode] = {
+                    'ok': ok,
+                    'seconds': sum(seconds for _, seconds in mode_builds) / len(mode_builds) if ok else None,
+                    'measured': now
+                }
+            project_records[target] = {'tree_hash': tree_hash, 'modes': known}
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(records, f, indent=2)
+        os.replace(tmp_path, path)
@@ -20,9 +20,18 @@ import glob
 import os
 import subprocess
 import sys
-from python_version_fetcher import get_latest_release_urls
-from docker_images_builder import build_docker_images
+from python_version_fetcher import DEFAULT_RELEASE_CACHE_TTL, get_latest_release_urls
+from docker_images_builder import build_docker_images, get_image_graph, print_image_plan
 from docker_images_runner import run_docker_images
+from non_native_modes import DEFAULT_MODE_TTL
+from tarball_cache import DEFAULT_MAX_CACHE_BYTES
+from trace_events import enable_tracing, trace_span, write_trace
+from log_streamer import start_live_view, stop_live_view
+from docker_engine import set_max_processes, set_engine_api, install_interrupt_handler, close_api_connections
+from image_bundle import export_images, import_images
+from image_gc import DEFAULT_MAX_IMAGE_BYTES, record_image_use, collect_images
+from docker_hosts import parse_docker_host
+from run_history import HISTORY_FILE, DEFAULT_BASELINE_RUNS, DEFAULT_REGRESSION_THRESHOLD, print_report
 
 def main():
     parser = argparse.ArgumentParser(description='Tool for Automating the Build and Testing Process of Native Python Libraries Using Cross-Compilation and Emulation Technologies')
@@ -34,6 +43,59 @@ def main():
         action='store_true',
         help='Remove all build artifacts, log files and other residual files and end the script execution'
         )
+    parser.add_argument(
+        '--bake',
+        action='store_true',
+        help='Build every Docker image of the selected targets and Python versions and end the script execution, to provision a build node'
+        )
+    parser.add_argument(
+        '--export-images',
+        type=str,
+        metavar='FILE',
+        help='Once the Docker images are built, save every level 1, 2 and 3 image of the selected targets and Python versions into FILE, storing the layers shared by several images once (compressed according to the extension: .tar, .tar.gz, .tar.zst or .tar.xz)'
+        )
+    parser.add_argument(
+        '--import-images',
+        type=str,
+        metavar='FILE',
+        help='Load the Docker images saved with --export-images from FILE before building the missing ones'
+        )
+    parser.add_argument(
+        '--gc',
+        action='store_true',
+        help='Remove the least recently used level 3 Docker images, then the level 2 images left without level 3 images, until the images of pookie take at most --max-image-bytes, keeping every image of the selected targets and Python versions, and end the script execution'
+        )
+    parser.add_argument(
+        '--max-image-bytes',
+        type=int,
+        default=DEFAULT_MAX_IMAGE_BYTES,
+        metavar='N',
+        help=f'Disk budget of the Docker images of pookie for --gc (default: {DEFAULT_MAX_IMAGE_BYTES})'
+        )
+    parser.add_argument(
+        '--plan',
+        action='store_true',
+        help='Print the Docker images that exist and those that would be built, and the build and test jobs that would run in the order they would start with their estimated duration (from the previous runs of the project when there are any), and end the script execution'
+        )
+    parser.add_argument(
+        '--report',
+        action='store_true',
+        help='Compare the build and test time of every target and Python version of the latest run of the project to the median of the previous runs recorded in the run history of the cache directory, flag the phases that regressed by more than --regression-threshold, and end the script execution (exit code 1 when a phase regressed)'
+        )
+    parser.add_argument(
+        '--baseline-runs',
+        type=int,
+        default=DEFAULT_BASELINE_RUNS,
+        metavar='N',
+        help=f'Number of previous runs the latest run is compared to with --report (default: {DEFAULT_BASELINE_RUNS})'
+        )
+    parser.add_argument(
+        '--regression-threshold',
+        type=float,
+        default=DEFAULT_REGRESSION_THRESHOLD,
+        metavar='FRACTION',
+        help=f'Fraction of its baseline time above which a build or test is reported as a regression by --report (default: {DEFAULT_REGRESSION_THRESHOLD})'
+        )
     parser.add_argument(
         '--build',
         type = str,
@@ -68,12 +130,118 @@ def main():
     parser.add_argument(
         '--linux-non-native-mode',
         type=str,
-        choices=['cross', 'emulate'],
+        choices=['cross', 'emulate', 'auto'],
         default='cross',
-        help='Compilation mode for non-native manylinux_2_17 targets (e.g. aarch64, armv7, ppc64le, s390x): "cross" for cross-compilation or "emulate" for QEMU-based emulation (default: cross)'
+        help='Compilation mode for non-native manylinux_2_17 targets (e.g. aarch64, armv7, ppc64le, s390x): "cross" for cross-compilation, "emulate" for QEMU-based emulation or "auto" to use the fastest mode that worked in the previous builds of the project, falling back to the other mode when a build fails (default: cross)'
+        )
+    parser.add_argument(
+        '--non-native-mode-ttl',
+        type=int,
+        default=DEFAULT_MODE_TTL,
+        help=f'With --linux-non-native-mode auto, seconds after which the build time and outcome of both modes are measured again (default: {DEFAULT_MODE_TTL})'
+        )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=1,
+        help='Number of Docker images to build and of build and test containers to run in parallel, each one logging to its own file in pookie_logs (default: 1)'
+        )
+    parser.add_argument(
+        '--docker-host',
+        type=str,
+        nargs='+',
+        metavar='ENDPOINT[=SLOTS]',
+        help='Docker hosts to distribute the build and test jobs across, each running up to SLOTS containers at the same time (default: 1): "local" for the Docker daemon of the pookie container, a DOCKER_HOST URL (e.g. tcp://127.0.0.1:23751 or ssh://user@builder) or a Docker context name (e.g. local=4 ssh://user@builder=8). The level 3 images are sent to the hosts that miss them and, on the hosts other than local, the workspace of every job is copied into its containers and the wheels copied back. Replaces --jobs for the build and test jobs'
+        )
+    parser.add_argument(
+        '--offline',
+        action='store_true',
+        help='Resolve the Python versions and targets only from the cached release metadata, without querying GitHub'
+        )
+    parser.add_argument(
+        '--release-cache-ttl',
+        type=int,
+        default=DEFAULT_RELEASE_CACHE_TTL,
+        help=f'Seconds during which the cached release metadata is used before revalidating it with GitHub (default: {DEFAULT_RELEASE_CACHE_TTL})'
+        )
+    parser.add_argument(
+        '--max-tarball-cache-bytes',
+        type=int,
+        default=DEFAULT_MAX_CACHE_BYTES,
+        help=f'Size cap of the cache of downloaded Python tarballs, least recently used tarballs are removed first (default: {DEFAULT_MAX_CACHE_BYTES})'
+        )
+    parser.add_argument(
+        '--wheelhouse-packages',
+        type=str,
+        nargs='+',
+        help='Package(s) to pre-build once per level 3 image into its wheelhouse, which is offered to pip with --find-links (e.g. setuptools build wheel auditwheel)'
+        )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Skip the build of a target and Python version when its wheel in dist was built from the same sources, command, options and image'
+        )
+    parser.add_argument(
+        '--abi3',
+        action='store_true',
+        help='Build one stable ABI (abi3) wheel per target with the oldest Python version and test it with every Python version (enabled automatically when the project sets py_limited_api or an abi3-py3X feature)'
+        )
+    parser.add_argument(
+        '--ccache',
+        action='store_true',
+        help='Compile through ccache with a persistent cache per toolchain in the pookie cache directory and report the hits and misses of every job'
+        )
+    parser.add_argument(
+        '--trace',
+        type=str,
+        metavar='FILE',
+        help='Write the timing of every phase of the run (release fetch, image probes and builds, container start, build, auditwheel repair, wheel install and test) to FILE as a trace-event JSON file with one track per job, to be opened with Perfetto or chrome://tracing'
+        )
+    parser.add_argument(
+        '--live',
+        action='store_true',
+        help='Print the build and test output of every container as it is produced, each line prefixed with its job name (e.g. [cp312-manylinux_2_17_aarch64]); the output of every job is always written to its own log file in pookie_logs'
+        )
+    parser.add_argument(
+        '--tty',
+        action='store_true',
+        help='Allocate a pseudo-terminal for the build and test containers, for tools that need one (slower with chatty builds)'
+        )
+    parser.add_argument(
+        '--warm-containers',
+        action='store_true',
+        help='Start one long-lived container per level 3 image and run the build and test commands in it with docker exec'
+        )
+    parser.add_argument(
+        '--test-shards',
+        type=int,
+        default=1,
+        metavar='N',
+        help='Split the test of every emulated target (non-native manylinux targets and win_amd64) into N containers started at the same time from the same image, with POOKIE_SHARD_INDEX (0 to N-1) and POOKIE_SHARD_COUNT exported for test runners that support sharding (default: 1)'
+        )
+    parser.add_argument(
+        '--job-timeout',
+        type=float,
+        metavar='SECONDS',
+        help='Stop the build or test of a job that runs longer than SECONDS, removing its container; the phase fails with exit code 124'
+        )
+    parser.add_argument(
+        '--docker-cli',
+        action='store_true',
+        help='Run the containers and their commands, list the images and build the images with the docker CLI instead of the Docker Engine API on /var/run/docker.sock (the CLI is also used when the socket does not answer)'
+        )
+    parser.add_argument(
+        '--max-docker-processes',
+        type=int,
+        metavar='N',
+        help='Maximum number of docker commands (builds, runs, execs and image listings) running at the same time (default: no limit besides --jobs)'
         )
 
     args = parser.parse_args()
+    try:
+        docker_hosts = [parse_docker_host(spec) for spec in args.docker_host or []]
+    except ValueError as e:
+        parser.error(str(e))
 
     # check args
     print(">> Configuration")
@@ -90,6 +258,8 @@ def main():
                 'dist',
                 'build',
                 'pookie.log',
+                'pookie_logs',
+                '.pookie',
                 'clang-wrapper.sh',
                 'mingw-wrapper.sh'
         ]
@@ -97,9 +267,43 @@ def main():
         print(">> See you soon")
         sys.exit()
 
+    # Ctrl-C stops the running containers
+    install_interrupt_handler()
+    set_max_processes(args.max_docker_processes)
+    if args.docker_cli:
+        set_engine_api(False)
+
+    # cache directory shared between runs
+    cache_dir = os.environ.get('CACHE_DIR', '/cache')
+
+    # workspace and cache directory for docker in docker
+    host_workspace_path = os.environ.get('WORKSPACE_PWD', '/workspace')
+    host_cache_path = os.environ.get('CACHE_PWD', cache_dir)
+
+    # compare the latest run to the previous ones
+    if args.report:
+        regressed = print_report(os.path.join(cache_dir, HISTORY_FILE), host_workspace_path, args.baseline_runs, args.regression_threshold)
+        if regressed:
+            sys.exit(1)
+        print(">> See you soon")
+        return
+
+    # record the timing of the run
+    if args.trace:
+        enable_tracing()
+
+    # log file
+    logfile = open("pookie.log", "a")
+
+    # load the images of a provisioning archive
+    if args.import_images:
+        if import_images(args.import_images, logfile) != 0:
+            sys.exit(1)
+
     # Fetch python-versions
     print(">> Fetching python versions")
-    python_versions_dic = get_latest_release_urls(args.python_version, args.target)
+    with trace_span('release fetch'):
+        python_versions_dic = get_latest_release_urls(args.python_version, args.target, cache_dir, args.release_cache_ttl, args.offline)
     if not python_versions_dic:
         print("No matching assets found in latest release.")
         return
@@ -113,17 +317,53 @@ def main():
             print(f"    Download URL: {info['url']}")
     print()
 
-    # log file
-    logfile = open("pookie.log", "a")
+    # remove the least recently used images, keeping those of the current matrix
+    if args.gc:
+        removed = collect_images(cache_dir, args.max_image_bytes, keep=get_image_graph(args.target, python_versions_dic))
+        print(f">> {len(removed)} docker images removed")
+        print(">> See you soon")
+        return
+
+    # show what the run would do
+    if args.plan:
+        print_image_plan(args.target, python_versions_dic)
+        run_docker_images(args.target, logfile, python_versions_dic, args.build, args.test, args.linux_x86_64_compiler, args.linux_non_native_mode, host_workspace_path, args.jobs, args.warm_containers, cache_dir, host_cache_path, args.wheelhouse_packages, args.incremental, args.abi3, args.ccache, args.tty, args.job_timeout, args.non_native_mode_ttl, args.test_shards, plan=True, docker_hosts=docker_hosts)
+        print(">> See you soon")
+        return
 
     # build docker images
-    build_docker_images(args.target, logfile, python_versions_dic)
+    with trace_span('build docker images'):
+        images_status = build_docker_images(args.target, logfile, python_versions_dic, cache_dir, args.jobs, args.max_tarball_cache_bytes)
+    record_image_use(cache_dir, [image_name for image_name, status in images_status.items() if status == 'ok'])
 
-    # workspace for docker in docker
-    host_workspace_path = os.environ.get('WORKSPACE_PWD', '/workspace')
+    # save the images into a provisioning archive
+    if args.export_images:
+        if export_images(args.export_images, args.target, python_versions_dic, logfile) != 0:
+            sys.exit(1)
+
+    if args.bake:
+        if args.trace:
+            write_trace(args.trace)
+            print(f">> Trace written to {args.trace}")
+        failed = [image_name for image_name, status in images_status.items() if status != 'ok']
+        if failed:
+            print(f">> {len(failed)} of {len(images_status)} docker images were not created, see pookie.log")
+            sys.exit(1)
+        print(f">> {len(images_status)} docker images ready")
+        print(">> See you soon")
+        return
 
     # run build and test commands
-    run_docker_images(args.target, logfile, python_versions_dic, args.build, args.test, args.linux_x86_64_compiler, args.linux_non_native_mode, host_workspace_path)
+    if args.live:
+        start_live_view()
+    with trace_span('run docker images'):
+        run_docker_images(args.target, logfile, python_versions_dic, args.build, args.test, args.linux_x86_64_compiler, args.linux_non_native_mode, host_workspace_path, args.jobs, args.warm_containers, cache_dir, host_cache_path, args.wheelhouse_packages, args.incremental, args.abi3, args.ccache, args.tty, args.job_timeout, args.non_native_mode_ttl, args.test_shards, docker_hosts=docker_hosts)
+    stop_live_view()
+
+    # write the timing of the run
+    if args.trace:
+        write_trace(args.trace)
+        print(f">> Trace written to {args.trace}")
 
     # Delete residual files
     subprocess.run([
@@ -137,4 +377,11 @@ def main():
     print(">> See you soon")
 
 if __name__ == '__main__':
-    main()
+    try:
+        main()
+    except KeyboardInterrupt:
+        stop_live_view()
+        print(">> Interrupted, the running containers were stopped")
+        sys.exit(130)
+    finally:
+        close_api_connections()
@@ -15,10 +15,17 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
+import json
+import os
 import requests
 import re
+import tempfile
+import time
 from collections import defaultdict
 
+RELEASE_CACHE_FILE = 'release_metadata.json'
+DEFAULT_RELEASE_CACHE_TTL = 3600
+
 TARGET_MAPPING = {
     "manylinux_2_17_x86_64": "x86_64-unknown-linux-gnu",
     "manylinux_2_17_aarch64": "aarch64-unknown-linux-gnu",
@@ -31,33 +38,27 @@ TARGET_MAPPING = {
     "macosx_11_0_arm64": "aarch64-apple-darwin"
 }
 
-def get_latest_release_urls(minors, targets):
+def parse_release(release):
     """
-    Fetches the latest release URLs for specified Python minor versions and targets.
+    Parse the assets of a python-build-standalone release for every known target.
 
     Parameters:
-    - minors: List of minor versions to fetch (e.g., ['10', '12']).
-    - targets: List of target platforms to fetch (e.g., ['manylinux_2_17_x86_64', 'win_amd64']).
+    - release (dict): The release returned by the GitHub releases API.
 
     Returns:
-    - A dictionary with minor versions as keys and dictionaries of target URLs as values.
-      Each target dictionary contains the filename, download URL, and release tag.
+    - A dictionary with minor versions as keys and dictionaries of target assets as values.
+      Each target dictionary contains the filename, download URL, and release tag,
+      and the SHA-256 checksum when the release publishes it.
     """
-    url = "https://api.github.com/repos/astral-sh/python-build-standalone/releases/latest"
-    response = requests.get(url)
-    if response.status_code != 200:
-        raise Exception(f"Failed to fetch latest release: {response.status_code}")
-
-    release = response.json()
     tag = release["tag_name"]
     assets = release.get("assets", [])
 
-    platforms_regex = '|'.join(re.escape(TARGET_MAPPING[t]) for t in targets if t in TARGET_MAPPING)
+    platforms_regex = '|'.join(re.escape(platform) for platform in TARGET_MAPPING.values())
     pattern = re.compile(
         rf"^cpython-3\.(\d+)\.\d+\+\d+-({platforms_regex})-install_only\.tar\.gz$"
     )
 
-    platform_lookup = {v: k for k, v in TARGET_MAPPING.items() if k in targets}
+    platform_lookup = {v: k for k, v in TARGET_MAPPING.items()}
     temp_results = defaultdict(dict)
 
     for asset in assets:
@@ -76,6 +77,127 @@ def get_latest_release_urls(minors, targets):
                 "url": asset["browser_download_url"],
                 "tag": tag
             }
+            digest = asset.get("digest") or ""
+            if digest.startswith("sha256:"):
+                temp_results[minor][target]["sha256"] = digest[len("sha256:"):]
+
+    return dict(temp_results)
+
+def load_release_cache(cache_dir):
+    """
+    Load the cached release metadata.
+
+    Parameters:
+    - cache_dir: The pookie cache directory.
+
+    Returns:
+    - A dictionary with the keys 'etag', 'fetched_at' and 'assets' (see parse_release), or None if there is no cache.
+    """
+    try:
+        with open(os.path.join(cache_dir, RELEASE_CACHE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_release_cache(cache_dir, release_cache):
+    """
+    Atomically write the cached release metadata.
+
+    Parameters:
+    - cache_dir: The pookie cache directory.
+    - release_cache: The dictionary to write (see load_release_cache).
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(release_cache, f)
+    os.replace(tmp_path, os.path.join(cache_dir, RELEASE_CACHE_FILE))
+
+def fetch_release_assets(cache_dir=None, ttl=DEFAULT_RELEASE_CACHE_TTL, offline=False):
+    """
+    Get the parsed assets of the latest python-build-standalone release.
+    With a cache directory, the parsed assets are reused while they are younger than ttl,
+    then revalidated with the ETag of the cached release. The stale cache is used when the
+    GitHub API cannot be reached.
+
+    Parameters:
+    - cache_dir: The pookie cache directory, or None to always query the GitHub API.
+    - ttl: Seconds during which the cached release is used without revalidation.
+    - offline: Whether to resolve the release only from the cache.
+
+    Returns:
+    - The parsed assets of the release (see parse_release).
+    """
+    release_cache = load_release_cache(cache_dir) if cache_dir is not None else None
+
+    if offline:
+        if release_cache is None:
+            raise Exception("No cached release metadata available for offline mode")
+        return release_cache["assets"]
+
+    if release_cache is not None and time.time() - release_cache["fetched_at"] < ttl:
+        return release_cache["assets"]
+
+    headers = {"Accept": "application/vnd.github+json"}
+    if os.environ.get("GITHUB_TOKEN"):
+        headers["Authorization"] = f"Bearer {os.environ['GITHUB_TOKEN']}"
+    if release_cache is not None and release_cache.get("etag"):
+        headers["If-None-Match"] = release_cache["etag"]
+
+    url = "https://api.github.com/repos/astral-sh/python-build-standalone/releases/latest"
+    try:
+        response = requests.get(url, headers=headers, timeout=30)
+    except requests.RequestException as e:
+        if release_cache is None:
+            raise
+        print(f"Failed to fetch latest release ({e}), using cached release metadata")
+        return release_cache["assets"]
+
+    if response.status_code == 304 and release_cache is not None:
+        release_cache["fetched_at"] = time.time()
+        save_release_cache(cache_dir, release_cache)
+        return release_cache["assets"]
+
+    if response.status_code != 200:
+        if release_cache is None:
+            raise Exception(f"Failed to fetch latest release: {response.status_code}")
+        print(f"Failed to fetch latest release ({response.status_code}), using cached release metadata")
+        return release_cache["assets"]
+
+    assets = parse_release(response.json())
+
+    if cache_dir is not None:
+        save_release_cache(cache_dir, {
+            "etag": response.headers.get("ETag"),
+            "fetched_at": time.time(),
+            "assets": assets
+        })
+
+    return assets
+
+def get_latest_release_urls(minors, targets, cache_dir=None, ttl=DEFAULT_RELEASE_CACHE_TTL, offline=False):
+    """
+    Fetches the latest release URLs for specified Python minor versions and targets.
+
+    Parameters:
+    - minors: List of minor versions to fetch (e.g., ['10', '12']).
+    - targets: List of target platforms to fetch (e.g., ['manylinux_2_17_x86_64', 'win_amd64']).
+    - cache_dir: The pookie cache directory for the release metadata, or None to disable the cache.
+    - ttl: Seconds during which the cached release metadata is used without revalidation.
+    - offline: Whether to resolve the versions only from the cached release metadata.
+
+    Returns:
+    - A dictionary with minor versions as keys and dictionaries of target URLs as values.
+      Each target dictionary contains the filename, download URL, and release tag,
+      and the SHA-256 checksum when the release publishes it.
+    """
+    assets = fetch_release_assets(cache_dir, ttl, offline)
+
+    temp_results = defaultdict(dict)
+    for minor, target_data in assets.items():
+        for target, info in target_data.items():
+            if target in targets:
+                temp_results[minor][target] = info
 
     if minors is None:
         sorted_minors = sorted(temp_results.keys(), key=lambda x: int(x))
@@ -87,6 +209,20 @@ def get_latest_release_urls(minors, targets):
 
     return results
 
+def get_cross_python_url(url, target):
+    """
+    Get the URL of the x86_64 linux Python used to cross-compile for a target, which
+    belongs to the same release and Python version as the target Python.
+
+    Parameters:
+    - url (str): The download URL of the target Python.
+    - target (str): The target platform (e.g., 'manylinux_2_17_aarch64').
+
+    Returns:
+    - str: The download URL of the x86_64 linux Python.
+    """
+    return url.replace(TARGET_MAPPING[target], TARGET_MAPPING["manylinux_2_17_x86_64"])
+
 def main():
     minors = ['10', '12']
     targets = [
@@ -0,0 +1,276 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+
+import hashlib
+import json
+import os
+import sqlite3
+import statistics
+import time
+from docker_image_inventory import get_image
+
+HISTORY_FILE = 'run_history.sqlite'
+
+# Number of previous runs the latest run is compared to
+DEFAULT_BASELINE_RUNS = 5
+
+# Fraction of the baseline above which a phase is reported as a regression
+DEFAULT_REGRESSION_THRESHOLD = 0.25
+
+# Seconds below which a slowdown is noise rather than a regression
+MIN_REGRESSION_SECONDS = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    project TEXT NOT NULL,
+    started REAL NOT NULL,
+    finished REAL NOT NULL,
+    pookie_version TEXT NOT NULL,
+    options TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS images (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    image_name TEXT NOT NULL,
+    image_id TEXT,
+    PRIMARY KEY (run_id, image_name)
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    target TEXT NOT NULL,
+    minor TEXT NOT NULL,
+    phase TEXT NOT NULL,
+    image_name TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    exit_code INTEGER NOT NULL,
+    wheel_bytes INTEGER,
+    PRIMARY KEY (run_id, target, minor, phase)
+);
+CREATE INDEX IF NOT EXISTS runs_project ON runs (project, id);
+"""
+
+_pookie_version = None
+
+def get_pookie_version():
+    """
+    Get the version of pookie, the hash of its sources, so that the runs made with different
+    sources can be told apart even inside the container where there is no git checkout.
+
+    Returns:
+    - str: The first 12 hexadecimal digits of the SHA-256 of the pookie modules.
+    """
+    global _pookie_version
+    if _pookie_version is None:
+        directory = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.sha256()
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith('.py') and not filename.startswith('test_'):
+                digest.update(filename.encode())
+                with open(os.path.join(directory, filename), 'rb') as f:
+                    digest.update(f.read())
+        _pookie_version = digest.hexdigest()[:12]
+    return _pookie_version
+
+def open_history(path):
+    """
+    Open the run history database, creating it when needed.
+
+    Parameters:
+    - path (str): The path of the database.
+
+    Returns:
+    - sqlite3.Connection: The connection to the database, whose rows can be indexed by column name.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    return connection
+
+def get_wheel_bytes(lvl3_job, dist_dir='dist'):
+    """
+    Get the size of the wheels built by a level 3 job, found in its 'wheels' key.
+
+    Parameters:
+    - lvl3_job (dict): The job returned by get_lvl3_job.
+    - dist_dir (str): The dist directory.
+
+    Returns:
+    - int: The size of the wheels in bytes, or None when the job built no wheel.
+    """
+    sizes = []
+    for wheel in lvl3_job.get('wheels', []):
+        try:
+            sizes.append(os.path.getsize(os.path.join(dist_dir, wheel)))
+        except OSError:
+            pass
+    return sum(sizes) if sizes else None
+
+def record_run(path, project, lvl3_jobs, started, options, dist_dir='dist'):
+    """
+    Record a run in the history: the version of pookie, the ID of every level 3 image and, for every phase
+    that ran (found in the 'results' key of the jobs), its time, exit code and the size of the wheels it built.
+
+    Parameters:
+    - path (str): The path of the database.
+    - project (str): The project, identified by the path of its workspace on the host.
+    - lvl3_jobs (list): The jobs of the run.
+    - started (float): The time the run started, in seconds since the epoch.
+    - options (dict): The options of the run, stored as JSON.
+    - dist_dir (str): The dist directory.
+
+    Returns:
+    - int: The ID of the run, or None when no phase ran.
+    """
+    ran = [lvl3_job for lvl3_job in lvl3_jobs if lvl3_job.get('results')]
+    if not ran:
+        return None
+
+    connection = open_history(path)
+    try:
+        with connection:
+            run_id = connection.execute(
+                "INSERT INTO runs (project, started, finished, pookie_version, options) VALUES (?, ?, ?, ?, ?)",
+                (project, started, time.time(), get_pookie_version(), json.dumps(options, sort_keys=True))
+            ).lastrowid
+            for image_name in sorted({lvl3_job['image_name'] for lvl3_job in ran}):
+                image = get_image(image_name)
+                connection.execute(
+                    "INSERT INTO images (run_id, image_name, image_id) VALUES (?, ?, ?)",
+                    (run_id, image_name, image['id'] if image else None)
+                )
+            for lvl3_job in ran:
+                for phase, (returncode, seconds) in lvl3_job['results'].items():
+                    connection.execute(
+                        "INSERT OR REPLACE INTO jobs (run_id, target, minor, phase, image_name, seconds, exit_code, wheel_bytes) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (run_id, lvl3_job['target'], str(lvl3_job['minor']), phase, lvl3_job['image_name'], seconds, returncode,
+                         get_wheel_bytes(lvl3_job, dist_dir) if phase == 'build' else None)
+                    )
+    finally:
+        connection.close()
+    return run_id
+
+def compare_latest_run(path, project, baseline_runs=DEFAULT_BASELINE_RUNS, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    """
+    Compare every phase of the latest run of a project to its baseline, the median time of the same
+    target, Python version and phase over the successful runs among the previous baseline_runs runs.
+    A phase regressed when it took more than threshold times its baseline longer, and at least
+    MIN_REGRESSION_SECONDS more.
+
+    Parameters:
+    - path (str): The path of the database.
+    - project (str): The project, identified by the path of its workspace on the host.
+    - baseline_runs (int): The number of previous runs of the baseline.
+    - threshold (float): The fraction of the baseline above which a phase regressed.
+
+    Returns:
+    - tuple: The latest run (dict with the columns of the runs table) and the list of its phases, dictionaries
+      with the columns of the jobs table and the keys 'baseline' (seconds, or None without previous successful
+      run), 'image_changed' (bool, whether the image differs from the one of the previous run) and 'status'
+      ('ok', 'regressed', 'failed' or 'new'), or None when the project has no run.
+    """
+    if not os.path.exists(path):
+        return None
+    connection = open_history(path)
+    try:
+        run_ids = [row['id'] for row in connection.execute(
+            "SELECT id FROM runs WHERE project = ? ORDER BY id DESC LIMIT ?", (project, baseline_runs + 1))]
+        if not run_ids:
+            return None
+        latest_id, previous_ids = run_ids[0], run_ids[1:]
+        run = dict(connection.execute("SELECT * FROM runs WHERE id = ?", (latest_id,)).fetchone())
+
+        placeholders = ', '.join('?' * len(previous_ids))
+        baselines = {}
+        for row in connection.execute(
+                f"SELECT target, minor, phase, seconds FROM jobs WHERE exit_code = 0 AND run_id IN ({placeholders})", previous_ids):
+            baselines.setdefault((row['target'], row['minor'], row['phase']), []).append(row['seconds'])
+
+        previous_images = {}
+        if previous_ids:
+            previous_images = {
+                row['image_name']: row['image_id']
+                for row in connection.execute("SELECT image_name, image_id FROM images WHERE run_id = ?", (previous_ids[0],))
+            }
+        images = {
+            row['image_name']: row['image_id']
+            for row in connection.execute("SELECT image_name, image_id FROM images WHERE run_id = ?", (latest_id,))
+        }
+
+        phases = []
+        for row in connection.execute("SELECT * FROM jobs WHERE run_id = ? ORDER BY target, CAST(minor AS INTEGER), phase", (latest_id,)):
+            phase = dict(row)
+            seconds = baselines.get((phase['target'], phase['minor'], phase['phase']))
+            phase['baseline'] = statistics.median(seconds) if seconds else None
+            phase['image_changed'] = phase['image_name'] in previous_images and previous_images[phase['image_name']] != images.get(phase['image_name'])
+            if phase['exit_code'] != 0:
+                phase['status'] = 'failed'
+            elif phase['baseline'] is None:
+                phase['status'] = 'new'
+            elif phase['seconds'] > phase['baseline'] * (1 + threshold) and phase['seconds'] - phase['baseline'] >= MIN_REGRESSION_SECONDS:
+                phase['status'] = 'regressed'
+            else:
+                phase['status'] = 'ok'
+            phases.append(phase)
+    finally:
+        connection.close()
+    return run, phases
+
+def print_report(path, project, baseline_runs=DEFAULT_BASELINE_RUNS, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    """
+    Print the comparison of the latest run of a project to its baseline (see compare_latest_run).
+
+    Parameters:
+    - path (str): The path of the database.
+    - project (str): The project, identified by the path of its workspace on the host.
+    - baseline_runs (int): The number of previous runs of the baseline.
+    - threshold (float): The fraction of the baseline above which a phase regressed.
+
+    Returns:
+    - list: The phases that regressed.
+    """
+    comparison = compare_latest_run(path, project, baseline_runs, threshold)
+    if comparison is None:
+        print(f">> No run of {project} recorded in {path}")
+        return []
+    run, phases = comparison
+
+    print(f">> Run {run['id']} of {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run['started']))} "
+          f"(pookie {run['pookie_version']}, {run['finished'] - run['started']:.1f}s), "
+          f"compared to the median of up to {baseline_runs} previous runs")
+    for phase in phases:
+        name = f"cp3{phase['minor']}-{phase['target']} {phase['phase']}"
+        if phase['baseline'] is None:
+            timing = f"{phase['seconds']:.1f}s"
+        else:
+            change = (phase['seconds'] - phase['baseline']) / phase['baseline'] * 100 if phase['baseline'] else 0
+            timing = f"{phase['seconds']:.1f}s (baseline {phase['baseline']:.1f}s, {change:+.0f}%)"
+        details = [timing]
+        if phase['wheel_bytes'] is not None:
+            details.append(f"wheels {phase['wheel_bytes']} bytes")
+        if phase['exit_code'] != 0:
+            details.append(f"exit code {phase['exit_code']}")
+        if phase['image_changed']:
+            details.append("image rebuilt since the previous run")
+        print(f"- {name}: {phase['status']}, {', '.join(details)}")
+
+    regressed = [phase for phase in phases if phase['status'] == 'regressed']
+    print(f">> {len(regressed)} of {len(phases)} phases regressed by more than {threshold * 100:.0f}%")
+    return regressed
@@ -0,0 +1,202 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+import requests
+
+TARBALLS_DIR = 'tarballs'
+INDEX_FILE = 'index.json'
+CONTEXTS_DIR = 'contexts'
+DEFAULT_MAX_CACHE_BYTES = 10 * 1000 ** 3
+
+_index_lock = threading.Lock()
+_download_locks = defaultdict(threading.Lock)
+
+def load_index(cache_dir):
+    """
+    Load the index of the tarball cache.
+
+    Parameters:
+    - cache_dir (str): The pookie cache directory.
+
+    Returns:
+    - dict: Mapping of filename to a dictionary with the keys 'sha256', 'size' and 'last_used'.
+    """
+    try:
+        with open(os.path.join(cache_dir, TARBALLS_DIR, INDEX_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_index(cache_dir, index):
+    """
+    Atomically write the index of the tarball cache.
+
+    Parameters:
+    - cache_dir (str): The pookie cache directory.
+    - index (dict): The index to write (see load_index).
+    """
+    tarballs_dir = os.path.join(cache_dir, TARBALLS_DIR)
+    os.makedirs(tarballs_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tarballs_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, os.path.join(tarballs_dir, INDEX_FILE))
+
+def get_tarball_path(cache_dir, filename, sha256):
+    """
+    Get the path of a tarball in the cache, which is addressed by its checksum and filename.
+
+    Parameters:
+    - cache_dir (str): The pookie cache directory.
+    - filename (str): The name of the tarball.
+    - sha256 (str): The SHA-256 checksum of the tarball.
+
+    Returns:
+    - str: The path of the tarball.
+    """
+    return os.path.join(cache_dir, TARBALLS_DIR, sha256, filename)
+
+def download_tarball(url, cache_dir, filename, sha256=None):
+    """
+    Download a tarball into the cache, computing its checksum while streaming it to disk.
+
+    Parameters:
+    - url (str): The download URL.
+    - cache_dir (str): The pookie cache directory.
+    - filename (str): The name of the tarball.
+    - sha256 (str): The expected SHA-256 checksum, or None if it is not known.
+
+    Returns:
+    - tuple: The SHA-256 checksum and the size in bytes of the tarball.
+    """
+    tarballs_dir = os.path.join(cache_dir, TARBALLS_DIR)
+    os.makedirs(tarballs_dir, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tarballs_dir, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f, requests.get(url, stream=True, timeout=60) as response:
+            if response.status_code != 200:
+                raise Exception(f"Failed to download {url}: {response.status_code}")
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                f.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+
+        if sha256 is not None and digest.hexdigest() != sha256:
+            raise Exception(f"Checksum mismatch for {filename}: expected {sha256}, got {digest.hexdigest()}")
+
+        path = get_tarball_path(cache_dir, filename, digest.hexdigest())
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return digest.hexdigest(), size
+
+def fetch_tarball(url, cache_dir, filename, sha256=None):
+    """
+    Get a python-build-standalone tarball from the cache, downloading it only once.
+
+    Parameters:
+    - url (str): The download URL.
+    - cache_dir (str): The pookie cache directory.
+    - filename (str): The name of the tarball.
+    - sha256 (str): The expected SHA-256 checksum, or None if it is not known.
+
+    Returns:
+    - str: The path of the cached tarball.
+    """
+    with _download_locks[filename]:
+        with _index_lock:
+            entry = load_index(cache_dir).get(filename)
+
+        if entry is None or (sha256 is not None and entry['sha256'] != sha256) \
+                or not os.path.exists(get_tarball_path(cache_dir, filename, entry['sha256'])):
+            print(f">> Downloading {filename}")
+            downloaded_sha256, size = download_tarball(url, cache_dir, filename, sha256)
+            entry = {'sha256': downloaded_sha256, 'size': size}
+
+        with _index_lock:
+            index = load_index(cache_dir)
+            entry['last_used'] = time.time()
+            index[filename] = entry
+            save_index(cache_dir, index)
+
+    return get_tarball_path(cache_dir, filename, entry['sha256'])
+
+def evict_tarballs(cache_dir, max_bytes, keep=()):
+    """
+    Remove the least recently used tarballs until the cache is under its size cap.
+
+    Parameters:
+    - cache_dir (str): The pookie cache directory.
+    - max_bytes (int): The maximum total size of the cached tarballs.
+    - keep (iterable): Filenames that must not be removed (e.g. those used by the current run).
+
+    Returns:
+    - list: The filenames of the removed tarballs.
+    """
+    removed = []
+    with _index_lock:
+        index = load_index(cache_dir)
+        total = sum(entry['size'] for entry in index.values())
+
+        for filename, entry in sorted(index.items(), key=lambda item: item[1]['last_used']):
+            if total <= max_bytes:
+                break
+            if filename in keep:
+                continue
+            shutil.rmtree(os.path.dirname(get_tarball_path(cache_dir, filename, entry['sha256'])), ignore_errors=True)
+            total -= entry['size']
+            del index[filename]
+            removed.append(filename)
+
+        save_index(cache_dir, index)
+
+    return removed
+
+def prepare_build_context(cache_dir, files):
+    """
+    Create a Docker build context directory containing the given files.
+    Files are hard-linked when possible so that no extra copy is written to disk.
+
+    Parameters:
+    - cache_dir (str): The pookie cache directory.
+    - files (dict): Mapping of the name inside the build context to the path of the file.
+
+    Returns:
+    - str: The path of the build context directory (to be removed by the caller).
+    """
+    os.makedirs(os.path.join(cache_dir, CONTEXTS_DIR), exist_ok=True)
+    context_dir = tempfile.mkdtemp(dir=os.path.join(cache_dir, CONTEXTS_DIR))
+    for name, path in files.items():
+        try:
+            os.link(path, os.path.join(context_dir, name))
+        except OSError:
+            shutil.copy(path, os.path.join(context_dir, name))
+    return context_dir
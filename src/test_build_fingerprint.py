@@ -0,0 +1,55 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from build_fingerprint import hash_workspace, compute_fingerprint, get_cached_wheels, record_wheels
+
+def test_generated_files_do_not_change_the_hash(tmp_path):
+    (tmp_path / "setup.py").write_text("setup()")
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "mylib.c").write_text("int f(void) { return 1; }")
+    tree_hash = hash_workspace(str(tmp_path))
+
+    (tmp_path / "dist").mkdir()
+    (tmp_path / "dist" / "mylib-1.0-cp312-cp312-linux_x86_64.whl").write_text("wheel")
+    (tmp_path / "mylib.egg-info").mkdir()
+    (tmp_path / "pookie.log").write_text("log")
+    assert hash_workspace(str(tmp_path)) == tree_hash
+
+    (tmp_path / "src" / "mylib.c").write_text("int f(void) { return 2; }")
+    assert hash_workspace(str(tmp_path)) != tree_hash
+
+def test_fingerprint_inputs():
+    assert compute_fingerprint("tree", ["build", "12"]) == compute_fingerprint("tree", ["build", "12"])
+    assert compute_fingerprint("tree", ["build", "12"]) != compute_fingerprint("tree", ["build", "13"])
+
+def test_manifest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "dist").mkdir()
+    (tmp_path / "dist" / "mylib-1.0-cp312-cp312-musllinux_1_2_x86_64.whl").write_text("wheel")
+
+    assert get_cached_wheels("fp1") is None
+
+    record_wheels("fp1", "cp312-musllinux_1_2_x86_64", ["mylib-1.0-cp312-cp312-musllinux_1_2_x86_64.whl"])
+    assert get_cached_wheels("fp1") == ["mylib-1.0-cp312-cp312-musllinux_1_2_x86_64.whl"]
+
+    # a new build of the same job replaces the previous entry
+    record_wheels("fp2", "cp312-musllinux_1_2_x86_64", ["mylib-1.0-cp312-cp312-musllinux_1_2_x86_64.whl"])
+    assert get_cached_wheels("fp1") is None
+
+    # deleted wheels have to be built again
+    (tmp_path / "dist" / "mylib-1.0-cp312-cp312-musllinux_1_2_x86_64.whl").unlink()
+    assert get_cached_wheels("fp2") is None
@@ -0,0 +1,263 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+
+import io
+import json
+import socketserver
+import tarfile
+import threading
+import time
+import urllib.parse
+import pytest
+from http.server import BaseHTTPRequestHandler
+import docker_api
+import docker_engine
+import docker_image_inventory
+from docker_api import make_demuxer
+from docker_engine import TIMEOUT_EXIT_CODE, set_engine_api, use_engine_api, run_container, exec_container, build_image, close_api_connections
+from docker_image_inventory import load_image_inventory
+
+class FakeDockerDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        super().__init__(path, FakeDockerHandler)
+        self.connections = 0
+        self.requests = []
+        self.images = {"manylinux-lvl1-base:latest": "sha256:0123456789abcdef"}
+        self.containers = {}
+        self.execs = {}
+        self.deleted = []
+        self.close_after_response = False
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.close_connection = self.server.close_after_response
+
+    def send_chunks(self, chunks):
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def handle_request(self, method):
+        url = urllib.parse.urlparse(self.path)
+        path = url.path[len(f"/v{docker_api.API_VERSION}"):]
+        params = dict(urllib.parse.parse_qsl(url.query))
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests.append((method, path, params, body))
+        parts = path.strip("/").split("/")
+
+        if path == "/_ping":
+            self.send_json(200, "OK")
+        elif path == "/images/json":
+            self.send_json(200, [
+                {"RepoTags": [name], "Id": image_id, "Created": 1735725600, "Size": 120000000}
+                for name, image_id in self.server.images.items()
+            ])
+        elif path == "/build":
+            with tarfile.open(fileobj=io.BytesIO(body)) as tar:
+                dockerfile = tar.extractfile(params["dockerfile"]).read()
+            if b"FAIL" in dockerfile:
+                self.send_chunks([b'{"stream":"Step 1/1 : RUN false\\n"}\n', b'{"error":"The command returned a non-zero code: 1"}\n'])
+            else:
+                self.server.images[f"{params['t']}:latest"] = "sha256:fedcba9876543210"
+                self.send_chunks([b'{"stream":"Step 1/1 : FROM scratch\\n"}', b'\n{"stream":"Successfully tagged ' + params["t"].encode() + b'\\n"}\n'])
+        elif parts[0] == "containers" and parts[-1] == "exec":
+            exec_id = f"e{len(self.server.execs)}"
+            self.server.execs[exec_id] = dict(json.loads(body), Container=parts[1])
+            self.send_json(201, {"Id": exec_id})
+        elif parts[0] == "exec" and parts[-1] == "start":
+            # the output of an exec instance is a raw stream ending with the connection
+            exec_config = self.server.execs[parts[1]]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/vnd.docker.raw-stream")
+            self.end_headers()
+            if exec_config["Cmd"][-1] == "sleep":
+                while exec_config["Container"] not in self.server.deleted:
+                    time.sleep(0.05)
+            else:
+                self.wfile.write(b"\x01\x00\x00\x00\x00\x00\x00\x06built\n")
+            self.close_connection = True
+        elif parts[0] == "exec" and parts[-1] == "json":
+            self.send_json(200, {"ExitCode": 2})
+        elif path == "/containers/create":
+            container_id = f"c{len(self.server.containers)}"
+            self.server.containers[container_id] = dict(json.loads(body), Name=params.get("name"))
+            self.send_json(201, {"Id": container_id})
+        elif parts[0] == "containers" and parts[-1] == "start":
+            self.send_response(204)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif parts[0] == "containers" and parts[-1] == "logs":
+            command = self.server.containers[parts[1]]["Cmd"][-1]
+            if command == "sleep":
+                while parts[1] not in self.server.deleted:
+                    time.sleep(0.05)
+                self.send_chunks([])
+            else:
+                # a frame split across chunks, then stdout and stderr frames
+                frame = b"\x01\x00\x00\x00\x00\x00\x00\x06hello\n"
+                self.send_chunks([frame[:5], frame[5:] + b"\x02\x00\x00\x00\x00\x00\x00\x06world\n"])
+        elif parts[0] == "containers" and parts[-1] == "wait":
+            self.send_json(200, {"StatusCode": 3})
+        elif parts[0] == "containers" and method == "DELETE":
+            self.server.deleted.append(parts[1])
+            self.send_json(204, {})
+        else:
+            self.send_json(404, {"message": f"no such endpoint {path}"})
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    path = str(tmp_path / "docker.sock")
+    server = FakeDockerDaemon(path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(docker_api, "DOCKER_SOCKET", path)
+    monkeypatch.delenv("DOCKER_HOST", raising=False)
+    monkeypatch.delenv("DOCKER_CONTEXT", raising=False)
+    set_engine_api(True)
+    yield server
+    close_api_connections()
+    server.shutdown()
+    server.server_close()
+
+def test_demuxer():
+    output = []
+    on_chunk = make_demuxer(output.append)
+    on_chunk(b"\x01\x00\x00\x00\x00\x00\x00\x03ab")
+    on_chunk(b"c\x02\x00\x00\x00\x00\x00\x00\x01d")
+    assert output == [b"abc", b"d"]
+
+def test_fallback_without_socket(tmp_path, monkeypatch):
+    monkeypatch.setattr(docker_api, "DOCKER_SOCKET", str(tmp_path / "missing.sock"))
+    set_engine_api(True)
+    assert not use_engine_api()
+
+def test_connection_reused(daemon, monkeypatch):
+    monkeypatch.setattr(docker_image_inventory, "_inventory", None)
+
+    assert use_engine_api()
+    inventory = load_image_inventory()
+    load_image_inventory(refresh=True)
+    assert inventory["manylinux-lvl1-base:latest"] == {"id": "0123456789ab", "created": "2025-01-01 10:00:00 +0000 UTC", "size": 120000000}
+    assert daemon.connections == 1
+
+    # a connection closed by the daemon while idle is replaced
+    daemon.close_after_response = True
+    load_image_inventory(refresh=True)
+    assert load_image_inventory(refresh=True)["manylinux-lvl1-base:latest"]["id"] == "0123456789ab"
+    assert daemon.connections > 1
+
+def test_run_container(daemon, tmp_path):
+    log_path = tmp_path / "job.log"
+    returncode = run_container("pookie-job", "manylinux-lvl3-cp312-manylinux_2_17_x86_64", ["/bin/bash", "-c", "make"], str(log_path), prefix="job",
+                               working_dir="/workspace", binds=["/host/workspace:/workspace"], env={"PIP_CACHE_DIR": "/pookie-cache/pip"}, privileged=True)
+
+    assert returncode == 3
+    assert log_path.read_bytes() == b"hello\nworld\n"
+    config = daemon.containers["c0"]
+    assert config["Name"] == "pookie-job"
+    assert config["HostConfig"] == {"Binds": ["/host/workspace:/workspace"], "Privileged": True}
+    assert config["Env"] == ["PIP_CACHE_DIR=/pookie-cache/pip"] and config["WorkingDir"] == "/workspace"
+    assert daemon.deleted == ["c0"]
+    # create, start, logs, wait and delete over one connection
+    assert daemon.connections == 1
+
+def test_run_container_timeout(daemon, tmp_path):
+    started = time.time()
+    returncode = run_container("pookie-job", "manylinux-lvl1-base", ["sleep"], str(tmp_path / "job.log"), timeout=0.2)
+
+    assert returncode == TIMEOUT_EXIT_CODE
+    assert time.time() - started < 4
+    assert daemon.deleted == ["c0"]
+
+def test_build_image(daemon, tmp_path):
+    dockerfile = tmp_path / "Dockerfile.manylinux-lvl2-gnu-gcc-clang"
+    dockerfile.write_text("FROM manylinux-lvl1-base\n")
+    log_path = tmp_path / "pookie.log"
+
+    with open(log_path, "a") as logfile:
+        assert build_image("manylinux-lvl2-gnu-gcc-clang", str(dockerfile), logfile=logfile) == 0
+        dockerfile.write_text("FROM manylinux-lvl1-base\nRUN FAIL\n")
+        assert build_image("manylinux-lvl2-broken", str(dockerfile), logfile=logfile) == 1
+
+    assert "manylinux-lvl2-gnu-gcc-clang:latest" in daemon.images
+    assert "manylinux-lvl2-broken:latest" not in daemon.images
+    assert log_path.read_text().splitlines() == [
+        "Step 1/1 : FROM scratch",
+        "Successfully tagged manylinux-lvl2-gnu-gcc-clang",
+        "Step 1/1 : RUN false",
+        "The command returned a non-zero code: 1"
+    ]
+
+def test_build_image_with_context(daemon, tmp_path):
+    dockerfile = tmp_path / "Dockerfile.manylinux-lvl3-cp3xx-manylinux_2_17_x86_64"
+    dockerfile.write_text("FROM manylinux-lvl2-gnu-gcc-clang\nADD python.tar.gz /\n")
+    context_dir = tmp_path / "context"
+    context_dir.mkdir()
+    (context_dir / "python.tar.gz").write_bytes(b"tarball")
+
+    assert build_image("manylinux-lvl3-cp312-manylinux_2_17_x86_64", str(dockerfile), str(context_dir), {"PYTHON_URL": "url_12"}) == 0
+
+    method, path, params, body = daemon.requests[-1]
+    assert json.loads(params["buildargs"]) == {"PYTHON_URL": "url_12"}
+    with tarfile.open(fileobj=io.BytesIO(body)) as tar:
+        assert tar.extractfile("python.tar.gz").read() == b"tarball"
+        assert tar.extractfile(params["dockerfile"]).read() == dockerfile.read_bytes()
+
+def test_exec_container(daemon, tmp_path):
+    log_path = tmp_path / "build.log"
+    assert exec_container("c7", ["/bin/bash", "-c", "make"], str(log_path), prefix="job") == 2
+
+    assert log_path.read_bytes() == b"built\n"
+    assert daemon.execs["e0"] == {"Cmd": ["/bin/bash", "-c", "make"], "AttachStdout": True, "AttachStderr": True, "Tty": False, "Container": "c7"}
+    assert daemon.deleted == []
+
+def test_exec_container_timeout(daemon, tmp_path):
+    started = time.time()
+    assert exec_container("c7", ["sleep"], str(tmp_path / "build.log"), timeout=0.2) == TIMEOUT_EXIT_CODE
+    assert time.time() - started < 4
+    assert daemon.deleted == ["c7"]
@@ -0,0 +1,117 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import queue
+import sys
+import threading
+import time
+import pytest
+import docker_engine
+import log_streamer
+from docker_engine import TIMEOUT_EXIT_CODE, run_command, capture_command, set_max_processes, cancel_all
+from log_streamer import start_live_view, stop_live_view
+
+def test_output_written_to_the_log_file(tmp_path):
+    log_path = tmp_path / "job.log"
+    returncode = run_command(["bash", "-c", "echo out; echo err >&2; exit 3"], str(log_path), prefix="job")
+
+    assert returncode == 3
+    assert log_path.read_text().split() == ["out", "err"]
+
+def test_capture_command():
+    assert capture_command(["bash", "-c", "echo out; echo err >&2"]) == (0, "out\n", "err\n")
+
+def test_live_view_prefixes_lines(tmp_path, capsys):
+    start_live_view()
+    try:
+        run_command([sys.executable, "-c", "print('a'); print('b', end='')"], str(tmp_path / "job.log"), prefix="cp312-manylinux_2_17_aarch64")
+    finally:
+        stop_live_view()
+
+    assert capsys.readouterr().out.splitlines() == ["[cp312-manylinux_2_17_aarch64] a", "[cp312-manylinux_2_17_aarch64] b"]
+
+def test_chatty_process_is_not_stalled(tmp_path, monkeypatch):
+    # far more output than a pipe buffer while nobody prints the live view
+    monkeypatch.setattr(log_streamer, "_live_queue", queue.Queue(maxsize=10))
+    monkeypatch.setattr(log_streamer, "_live_thread", threading.current_thread())
+    monkeypatch.setattr(log_streamer, "_dropped_lines", 0)
+    log_path = tmp_path / "job.log"
+
+    returncode = run_command([sys.executable, "-c", "for _ in range(20001): print('x' * 99)"], str(log_path), prefix="job")
+
+    assert returncode == 0
+    assert log_path.stat().st_size == 20001 * 100
+    assert log_streamer._dropped_lines == 20001 - 10
+
+def test_timeout_removes_the_container(tmp_path, monkeypatch):
+    removed = []
+    async def remove_container(container, env=None):
+        removed.append((container, env))
+    monkeypatch.setattr(docker_engine, "_remove_container_async", remove_container)
+
+    started = time.time()
+    returncode = run_command(["sleep", "5"], str(tmp_path / "job.log"), timeout=0.2, container="pookie-job")
+
+    assert returncode == TIMEOUT_EXIT_CODE
+    assert time.time() - started < 4
+    assert removed == [("pookie-job", None)]
+
+    # the container is removed from the Docker host the command ran on
+    env = dict(os.environ, DOCKER_HOST="tcp://127.0.0.1:23751")
+    run_command(["sleep", "5"], str(tmp_path / "job.log"), env=env, timeout=0.2, container="pookie-job")
+    assert removed[1] == ("pookie-job", env)
+
+def test_concurrency_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(docker_engine, "_semaphore", None)
+    set_max_processes(2)
+    try:
+        # each command appends its start and end to a file
+        script = f"echo start >> {tmp_path}/events; sleep 0.3; echo end >> {tmp_path}/events"
+        threads = [threading.Thread(target=run_command, args=(["bash", "-c", script],)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        set_max_processes(None)
+
+    running = peak = 0
+    for event in (tmp_path / "events").read_text().split():
+        running += 1 if event == "start" else -1
+        peak = max(peak, running)
+    assert peak == 2
+
+def test_cancel_all_stops_running_commands(monkeypatch):
+    monkeypatch.setattr(docker_engine, "_interrupted", False)
+    errors = []
+    def run():
+        try:
+            run_command(["sleep", "5"])
+        except KeyboardInterrupt:
+            errors.append("interrupted")
+    thread = threading.Thread(target=run)
+    thread.start()
+    time.sleep(0.3)
+
+    cancel_all()
+    thread.join(4)
+
+    assert errors == ["interrupted"]
+    with pytest.raises(KeyboardInterrupt):
+        run_command(["true"])
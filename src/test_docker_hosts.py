@@ -0,0 +1,82 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+
+import threading
+import pytest
+from unittest.mock import patch
+from docker_hosts import parse_docker_host, set_docker_hosts, is_remote_host, acquire_docker_host, release_docker_host, sync_image
+
+def test_parse_docker_host():
+    local = parse_docker_host("local=4")
+    assert (local["name"], local["slots"], local["env"]) == ("local", 4, None)
+    assert not is_remote_host(local)
+
+    tcp = parse_docker_host("tcp://127.0.0.1:23751=2")
+    assert (tcp["name"], tcp["slots"]) == ("tcp://127.0.0.1:23751", 2)
+    assert tcp["env"]["DOCKER_HOST"] == "tcp://127.0.0.1:23751" and "DOCKER_CONTEXT" not in tcp["env"]
+    assert is_remote_host(tcp)
+
+    context = parse_docker_host("builder")
+    assert (context["slots"], context["env"]["DOCKER_CONTEXT"]) == (1, "builder")
+    with pytest.raises(ValueError):
+        parse_docker_host("builder=0")
+
+def test_slots_of_the_hosts():
+    local, remote = parse_docker_host("local=1"), parse_docker_host("ssh://builder=2")
+    set_docker_hosts([local, remote])
+
+    # the host with the most free slots first, the preferred host when it has a free slot
+    assert acquire_docker_host() is remote
+    assert acquire_docker_host(preferred=local) is local
+    assert acquire_docker_host(preferred=local) is remote
+
+    acquired = []
+    waiting = threading.Thread(target=lambda: acquired.append(acquire_docker_host()))
+    waiting.start()
+    waiting.join(0.1)
+    assert not acquired
+    release_docker_host(local)
+    waiting.join(5)
+    assert acquired == [local]
+
+@patch("docker_hosts.run_command", return_value=0)
+@patch("docker_hosts.get_image", return_value={"id": "0123456789ab", "created": "", "size": 0})
+def test_sync_image(mock_image, mock_run, tmp_path):
+    remote = parse_docker_host("tcp://127.0.0.1:23751")
+    set_docker_hosts([remote])
+    log_path = str(tmp_path / "sync.log")
+
+    # sent once when it differs, whatever the number of jobs needing it
+    with patch("docker_hosts.capture_command", return_value=(0, "sha256:ba9876543210\n", "")) as mock_capture:
+        assert sync_image(remote, "manylinux-lvl3-cp312-aarch64", log_path)
+        assert sync_image(remote, "manylinux-lvl3-cp312-aarch64", log_path)
+    assert mock_capture.call_args[1]["env"]["DOCKER_HOST"] == "tcp://127.0.0.1:23751"
+    assert mock_run.call_count == 1
+    args, _ = mock_run.call_args[0]
+    assert args[2] == "set -o pipefail; env -u DOCKER_HOST -u DOCKER_CONTEXT docker save manylinux-lvl3-cp312-aarch64 | docker load"
+    assert mock_run.call_args[1]["env"] is remote["env"]
+
+    # not sent when the host has it already
+    with patch("docker_hosts.capture_command", return_value=(0, "sha256:0123456789abcdef\n", "")):
+        assert sync_image(remote, "manylinux-lvl3-cp313-aarch64", log_path)
+    assert mock_run.call_count == 1
+
+    mock_run.return_value = 1
+    with patch("docker_hosts.capture_command", return_value=(1, "", "No such image")):
+        assert not sync_image(remote, "manylinux-lvl3-cp314-aarch64", log_path)
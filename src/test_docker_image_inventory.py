@@ -0,0 +1,54 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from unittest.mock import patch
+import docker_image_inventory
+from docker_image_inventory import parse_image_inventory, parse_size, load_image_inventory, get_image
+
+DOCKER_IMAGES_OUTPUT = (
+    "manylinux-lvl1-base:latest\tabc123\t2025-01-01 10:00:00 +0000 UTC\t120MB\n"
+    "manylinux-lvl3-cp312-manylinux_2_17_x86_64:latest\tdef456\t2025-01-02 10:00:00 +0000 UTC\t1.5GB\n"
+    "<none>:<none>\t0123ab\t2025-01-03 10:00:00 +0000 UTC\t3kB\n"
+)
+
+def test_parse_size():
+    assert parse_size("120MB") == 120000000
+    assert parse_size("1.5GB") == 1500000000
+    assert parse_size("3kB") == 3000
+    assert parse_size("unknown") == 0
+
+def test_parse_image_inventory():
+    inventory = parse_image_inventory(DOCKER_IMAGES_OUTPUT)
+    assert sorted(inventory.keys()) == [
+        "manylinux-lvl1-base:latest",
+        "manylinux-lvl3-cp312-manylinux_2_17_x86_64:latest"
+    ]
+    assert inventory["manylinux-lvl1-base:latest"] == {
+        "id": "abc123",
+        "created": "2025-01-01 10:00:00 +0000 UTC",
+        "size": 120000000
+    }
+
+@patch("docker_image_inventory.capture_command")
+def test_single_listing(mock_run, monkeypatch):
+    monkeypatch.setattr(docker_image_inventory, "_inventory", None)
+    mock_run.return_value = (0, DOCKER_IMAGES_OUTPUT, "")
+
+    load_image_inventory()
+    assert get_image("manylinux-lvl1-base")["id"] == "abc123"
+    assert get_image("musllinux-lvl1-base") is None
+    assert mock_run.call_count == 1
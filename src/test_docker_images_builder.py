@@ -0,0 +1,137 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from unittest.mock import patch
+from docker_images_builder import get_image_graph, build_docker_images, build_lvl3_image_from_cache
+
+PYTHON_VERSIONS_DIC = {
+    "12": {
+        "manylinux_2_17_x86_64": {"filename": "cpython-3.12.1+1-x86_64-unknown-linux-gnu-install_only.tar.gz", "url": "url/cpython-3.12.1+1-x86_64-unknown-linux-gnu-install_only.tar.gz", "sha256": "sha_x86_64_12"},
+        "manylinux_2_17_aarch64": {"filename": "cpython-3.12.1+1-aarch64-unknown-linux-gnu-install_only.tar.gz", "url": "url/cpython-3.12.1+1-aarch64-unknown-linux-gnu-install_only.tar.gz"},
+        "macosx_11_0_x86_64": {"filename": "cpython-3.12.1+1-x86_64-apple-darwin-install_only.tar.gz", "url": "url/cpython-3.12.1+1-x86_64-apple-darwin-install_only.tar.gz"},
+        "macosx_11_0_arm64": {"filename": "cpython-3.12.1+1-aarch64-apple-darwin-install_only.tar.gz", "url": "url/cpython-3.12.1+1-aarch64-apple-darwin-install_only.tar.gz"},
+    },
+    "13": {
+        "manylinux_2_17_x86_64": {"filename": "cpython-3.13.1+1-x86_64-unknown-linux-gnu-install_only.tar.gz", "url": "url/cpython-3.13.1+1-x86_64-unknown-linux-gnu-install_only.tar.gz"},
+        "manylinux_2_17_aarch64": {"filename": "cpython-3.13.1+1-aarch64-unknown-linux-gnu-install_only.tar.gz", "url": "url/cpython-3.13.1+1-aarch64-unknown-linux-gnu-install_only.tar.gz"},
+        "macosx_11_0_x86_64": {"filename": "cpython-3.13.1+1-x86_64-apple-darwin-install_only.tar.gz", "url": "url/cpython-3.13.1+1-x86_64-apple-darwin-install_only.tar.gz"},
+        "macosx_11_0_arm64": {"filename": "cpython-3.13.1+1-aarch64-apple-darwin-install_only.tar.gz", "url": "url/cpython-3.13.1+1-aarch64-apple-darwin-install_only.tar.gz"},
+    },
+}
+
+def test_image_graph_shares_parents():
+    targets = ["manylinux_2_17_x86_64", "manylinux_2_17_aarch64", "macosx_11_0_x86_64", "macosx_11_0_arm64"]
+    graph = get_image_graph(targets, PYTHON_VERSIONS_DIC)
+
+    assert graph["manylinux-lvl1-base"]["parent"] is None
+    assert graph["manylinux-lvl2-gcc-aarch64-linux-gnu"]["parent"] == "manylinux-lvl1-base"
+    assert graph["win-macosx-pookie-lvl2-osxcross"]["parent"] is None
+    assert graph["manylinux-lvl3-cp312-manylinux_2_17_aarch64"] == {
+        "tree": "manylinux",
+        "level": 3,
+        "parent": "manylinux-lvl2-gcc-aarch64-linux-gnu",
+        "general_image_name": "manylinux-lvl3-cp3xx-manylinux_2_17_aarch64",
+        "python_url": "url/cpython-3.12.1+1-aarch64-unknown-linux-gnu-install_only.tar.gz",
+        "python_filename": "cpython-3.12.1+1-aarch64-unknown-linux-gnu-install_only.tar.gz",
+        "python_sha256": None,
+        "cross_python_image": "manylinux-lvl3-cp312-cross-python"
+    }
+    assert graph["manylinux-lvl3-cp312-cross-python"] == {
+        "tree": "manylinux",
+        "level": 3,
+        "parent": "manylinux-lvl1-base",
+        "general_image_name": "manylinux-lvl3-cp3xx-cross-python",
+        "python_cross_url": "url/cpython-3.12.1+1-x86_64-unknown-linux-gnu-install_only.tar.gz",
+        "python_cross_filename": "cpython-3.12.1+1-x86_64-unknown-linux-gnu-install_only.tar.gz",
+        "python_cross_sha256": "sha_x86_64_12"
+    }
+    assert "python_cross_url" not in graph["manylinux-lvl3-cp312-manylinux_2_17_x86_64"]
+    # the macOS images still install the x86_64 linux Python themselves
+    assert graph["win-macosx-pookie-lvl3-cp312-macosx_11_0_arm64"]["python_cross_filename"] == "cpython-3.12.1+1-x86_64-unknown-linux-gnu-install_only.tar.gz"
+    assert len([name for name, image in graph.items() if image["level"] == 3]) == 10
+
+@patch("docker_images_builder.evict_tarballs")
+@patch("docker_images_builder.load_image_inventory", return_value={})
+@patch("docker_images_builder.build_lvl3_image_from_cache", return_value=True)
+@patch("docker_images_builder.build_lvl1_or_lvl2_image", return_value=True)
+def test_each_image_built_once(mock_lvl1_or_lvl2, mock_lvl3, mock_inventory, mock_evict, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    targets = ["macosx_11_0_x86_64", "macosx_11_0_arm64"]
+    status = build_docker_images(targets, None, PYTHON_VERSIONS_DIC, str(tmp_path), jobs=4)
+
+    assert mock_lvl1_or_lvl2.call_count == 1
+    assert mock_lvl3.call_count == 4
+    assert set(status.values()) == {"ok"}
+
+@patch("docker_images_builder.evict_tarballs")
+@patch("docker_images_builder.load_image_inventory", return_value={})
+@patch("docker_images_builder.build_lvl3_image_from_cache", return_value=True)
+@patch("docker_images_builder.build_lvl1_or_lvl2_image", return_value=False)
+def test_failed_parent_skips_children(mock_lvl1_or_lvl2, mock_lvl3, mock_inventory, mock_evict):
+    status = build_docker_images(["manylinux_2_17_aarch64"], None, PYTHON_VERSIONS_DIC, "/cache")
+
+    assert status["manylinux-lvl1-base"] == "failed"
+    assert status["manylinux-lvl3-cp312-manylinux_2_17_aarch64"] == "skipped"
+    mock_lvl3.assert_not_called()
+
+@patch("docker_images_builder.evict_tarballs")
+@patch("docker_images_builder.load_image_inventory", return_value={})
+@patch("docker_images_builder.build_lvl3_image_from_cache", return_value=True)
+@patch("docker_images_builder.build_lvl1_or_lvl2_image", return_value=True)
+def test_cross_python_image_built_first(mock_lvl1_or_lvl2, mock_lvl3, mock_inventory, mock_evict):
+    mock_lvl3.side_effect = lambda image_name, *args: "cross-python" in image_name
+    status = build_docker_images(["manylinux_2_17_aarch64"], None, PYTHON_VERSIONS_DIC, "/cache")
+
+    assert status["manylinux-lvl3-cp313-cross-python"] == "ok"
+    assert status["manylinux-lvl3-cp313-manylinux_2_17_aarch64"] == "failed"
+    # a single cross Python image per Python version
+    assert [call[0][0] for call in mock_lvl3.call_args_list].count("manylinux-lvl3-cp312-cross-python") == 1
+
+@patch("docker_images_builder.image_exists", return_value=False)
+@patch("docker_images_builder.run_command", return_value=0)
+@patch("docker_images_builder.add_image")
+@patch("docker_images_builder.fetch_tarball")
+def test_cross_python_image_build_args(mock_fetch, mock_add, mock_run, mock_exists, tmp_path):
+    (tmp_path / "python.tar.gz").write_bytes(b"")
+    mock_fetch.return_value = str(tmp_path / "python.tar.gz")
+    graph = get_image_graph(["manylinux_2_17_aarch64"], PYTHON_VERSIONS_DIC)
+
+    assert build_lvl3_image_from_cache("manylinux-lvl3-cp312-manylinux_2_17_aarch64", graph["manylinux-lvl3-cp312-manylinux_2_17_aarch64"], None, str(tmp_path))
+    args = mock_run.call_args[0][0]
+    assert args[args.index("CROSS_PYTHON_IMAGE=manylinux-lvl3-cp312-cross-python") - 1] == "--build-arg"
+    # only the target Python is fetched, the x86_64 linux Python comes from the shared image
+    assert mock_fetch.call_count == 1
+
+    assert build_lvl3_image_from_cache("manylinux-lvl3-cp312-cross-python", graph["manylinux-lvl3-cp312-cross-python"], None, str(tmp_path))
+    assert mock_fetch.call_args[0][2] == "cpython-3.12.1+1-x86_64-unknown-linux-gnu-install_only.tar.gz"
+
+@patch("docker_images_builder.image_exists", return_value=False)
+@patch("docker_images_builder.use_engine_api", return_value=True)
+@patch("docker_images_builder.build_image", return_value=0)
+@patch("docker_images_builder.run_command")
+@patch("docker_images_builder.add_image")
+@patch("docker_images_builder.fetch_tarball")
+def test_lvl3_image_built_through_engine_api(mock_fetch, mock_add, mock_run, mock_build, mock_api, mock_exists, tmp_path):
+    (tmp_path / "python.tar.gz").write_bytes(b"")
+    mock_fetch.return_value = str(tmp_path / "python.tar.gz")
+    graph = get_image_graph(["manylinux_2_17_aarch64"], PYTHON_VERSIONS_DIC)
+
+    assert build_lvl3_image_from_cache("manylinux-lvl3-cp312-manylinux_2_17_aarch64", graph["manylinux-lvl3-cp312-manylinux_2_17_aarch64"], None, str(tmp_path))
+    image_name, dockerfile, context_dir, build_args, logfile = mock_build.call_args[0]
+    assert dockerfile == "/images/manylinux/Dockerfile.manylinux-lvl3-cp3xx-manylinux_2_17_aarch64"
+    assert build_args == {"PYTHON_URL": graph[image_name]["python_url"], "CROSS_PYTHON_IMAGE": "manylinux-lvl3-cp312-cross-python"}
+    assert not mock_run.called
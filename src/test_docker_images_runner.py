@@ -0,0 +1,362 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import subprocess
+import zipfile
+from unittest.mock import patch
+from docker_images_runner import get_lvl3_job, add_pip_cache, share_abi3_builds, uses_limited_api, get_ccache_toolchain, add_compiler_cache, read_ccache_stats, add_non_native_fallback, run_lvl3_job_build, get_test_shards, run_lvl3_job_test, retag_job_wheels, repair_job_wheels, print_plan, run_lvl3_job_command, run_lvl3_image, prepare_job_workspace, strip_job_caches, skip_up_to_date_builds, run_docker_images, run_docker_images_sequentially
+from docker_hosts import parse_docker_host
+from job_costs import estimate_job_costs
+
+def test_lvl3_job_commands():
+    job = get_lvl3_job("manylinux_2_17_aarch64", "12", "python -m build", "python test.py", "gcc", "cross")
+
+    assert job["name"] == "cp312-manylinux_2_17_aarch64"
+    assert job["image_name"] == "manylinux-lvl3-cp312-manylinux_2_17_aarch64"
+    assert job["build_command"].startswith("python -m build")
+    assert "auditwheel" not in job["build_command"]
+    assert job["repair"] == {"pattern": "*-linux_aarch64.whl", "platform": "manylinux_2_17_aarch64"}
+    assert job["test_command"].endswith("python test.py")
+
+def test_lvl3_job_macosx_test_not_supported():
+    job = get_lvl3_job("macosx_11_0_arm64", "12", None, "python test.py", "gcc", "cross")
+
+    assert job["build_command"] is None
+    assert job["test_command"] is None
+
+def test_pip_cache_and_wheelhouse(tmp_path):
+    job = get_lvl3_job("musllinux_1_2_x86_64", "13", "python -m build", None, "gcc", "cross")
+    add_pip_cache(job, str(tmp_path), "/host/cache", ["build", "wheel"])
+
+    assert job["volumes"]["/host/cache/wheelhouse/cp313-musllinux_1_2_x86_64"] == "/pookie-cache/wheelhouse"
+    assert job["env"]["PIP_FIND_LINKS"] == "/pookie-cache/wheelhouse"
+    assert job["build_command"].startswith("pip wheel --wheel-dir /pookie-cache/wheelhouse build wheel")
+
+    # already populated wheelhouses are not populated again
+    (tmp_path / "wheelhouse" / "cp313-musllinux_1_2_x86_64" / ".packages").write_text("wheel build\n")
+    job = get_lvl3_job("musllinux_1_2_x86_64", "13", "python -m build", None, "gcc", "cross")
+    add_pip_cache(job, str(tmp_path), "/host/cache", ["build", "wheel"])
+    assert not job["build_command"].startswith("pip wheel")
+
+def test_abi3_built_once_per_target():
+    jobs = [
+        get_lvl3_job(target, minor, "python -m build", "python test.py", "gcc", "cross", abi3=True)
+        for target in ["manylinux_2_17_x86_64", "win_amd64"]
+        for minor in ["13", "10", "12"]
+    ]
+    share_abi3_builds(jobs)
+
+    built = [job["name"] for job in jobs if job["build_command"] is not None]
+    assert built == ["cp310-manylinux_2_17_x86_64", "cp310-win_amd64"]
+    assert jobs[0]["abi3_provider"] is jobs[1]
+    assert all(job["test_command"] is not None for job in jobs)
+    assert "dist/*-abi3-manylinux2014_x86_64.manylinux_2_17_x86_64.whl" in jobs[0]["test_command"]
+
+def test_abi3_win_amd64_links_the_stable_abi():
+    build_command = get_lvl3_job("win_amd64", "10", "python -m build", None, "gcc", "cross", abi3=True)["build_command"]
+    assert '-L/python/libs -lpython3 ' in build_command
+    assert '"$arg" == "-lpython3"' in build_command
+    assert "-DPy_LIMITED_API=0x030A0000" in build_command
+    assert "-lpython310" not in build_command
+
+    build_command = get_lvl3_job("win_amd64", "10", "python -m build", None, "gcc", "cross")["build_command"]
+    assert '-L/python/libs -lpython310 ' in build_command
+    assert "Py_LIMITED_API" not in build_command
+
+def test_uses_limited_api(tmp_path):
+    assert not uses_limited_api(str(tmp_path))
+
+    (tmp_path / "setup.cfg").write_text("[bdist_wheel]\npy_limited_api = cp39\n")
+    assert uses_limited_api(str(tmp_path))
+
+    (tmp_path / "setup.cfg").unlink()
+    (tmp_path / "Cargo.toml").write_text('pyo3 = { version = "0.22", features = ["abi3-py38"] }\n')
+    assert uses_limited_api(str(tmp_path))
+
+def test_compiler_cache(tmp_path):
+    toolchain = get_ccache_toolchain("manylinux_2_17_x86_64", "clang", "cross")
+    assert toolchain == "manylinux_2_17_x86_64-clang"
+    assert get_ccache_toolchain("manylinux_2_17_s390x", "clang", "emulate") == "manylinux_2_17_s390x-emulate"
+
+    job = get_lvl3_job("manylinux_2_17_x86_64", "12", "python -m build", None, "clang", "cross")
+    add_compiler_cache(job, str(tmp_path), "/host/cache", toolchain)
+
+    assert job["volumes"]["/host/cache/ccache"] == "/pookie-cache/ccache"
+    assert job["env"]["CCACHE_DIR"] == "/pookie-cache/ccache/manylinux_2_17_x86_64-clang"
+    assert job["env"]["CCACHE_LOGFILE"] == "/pookie-cache/ccache/logs/cp312-manylinux_2_17_x86_64.log"
+    assert "export PATH=\"/tmp/pookie-ccache:$PATH\"" in job["build_command"]
+
+def test_read_ccache_stats(tmp_path):
+    log = tmp_path / "job.log"
+    log.write_text(
+        "[2025-01-01T00:00:00 1] Result: cache hit (direct)\n"
+        "[2025-01-01T00:00:00 2] Result: cache miss\n"
+        "[2025-01-01T00:00:00 3] Result: direct_cache_hit\n"
+        "[2025-01-01T00:00:00 4] Result: called for link\n"
+    )
+
+    assert read_ccache_stats(str(log)) == (2, 1)
+    assert not log.exists()
+    assert read_ccache_stats(str(log)) is None
+
+@patch("docker_images_runner.repair_job_wheels", return_value=0)
+@patch("docker_images_runner.run_lvl3_job_phase")
+def test_non_native_fallback(mock_phase, mock_repair, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "pookie_logs").mkdir()
+    (tmp_path / "pookie_logs" / "cp312-manylinux_2_17_aarch64-build.log").write_text("cross failed\n")
+    (tmp_path / "build").mkdir()
+    mock_phase.side_effect = [1, 0]
+
+    job = get_lvl3_job("manylinux_2_17_aarch64", "12", "python -m build", None, "gcc", "cross")
+    job["mode"] = "cross"
+    fallback_job = get_lvl3_job("manylinux_2_17_aarch64", "12", "python -m build", None, "gcc", "emulate")
+    fallback_job["mode"] = "emulate"
+    add_non_native_fallback(job, fallback_job)
+
+    assert run_lvl3_job_build(job, "/host/workspace", ".") == 0
+    assert mock_phase.call_args[0][2] == fallback_job["build_command"]
+    assert job["mode"] == "emulate"
+    assert [(mode, ok) for mode, ok, _ in job["mode_results"]] == [("cross", False), ("emulate", True)]
+    # the whole build, fallback included, is one result
+    assert list(job["results"]) == ["build"] and job["results"]["build"][0] == 0
+    assert (tmp_path / "pookie_logs" / "cp312-manylinux_2_17_aarch64-build-cross.log").read_text() == "cross failed\n"
+    assert not (tmp_path / "build").exists()
+
+def test_test_shards():
+    job = get_lvl3_job("manylinux_2_17_s390x", "12", None, "pytest", "gcc", "cross")
+    job["env"] = {"PIP_FIND_LINKS": "/pookie-cache/wheelhouse"}
+    shards = get_test_shards(job, 3)
+
+    assert [shard["name"] for shard in shards] == ["cp312-manylinux_2_17_s390x-shard0", "cp312-manylinux_2_17_s390x-shard1", "cp312-manylinux_2_17_s390x-shard2"]
+    assert shards[2]["env"] == {"PIP_FIND_LINKS": "/pookie-cache/wheelhouse", "POOKIE_SHARD_INDEX": "2", "POOKIE_SHARD_COUNT": "3"}
+    assert "POOKIE_SHARD_INDEX" not in job["env"]
+
+    # native tests are not split
+    job = get_lvl3_job("manylinux_2_17_x86_64", "12", None, "pytest", "gcc", "cross")
+    assert get_test_shards(job, 3) == [job]
+
+@patch("docker_images_runner.run_lvl3_job_phase")
+def test_test_shards_merged(mock_phase):
+    mock_phase.side_effect = lambda shard_job, *args, **kwargs: 5 if shard_job["name"].endswith("shard1") else 0
+    job = get_lvl3_job("win_amd64", "12", None, "pytest", "gcc", "cross")
+
+    assert run_lvl3_job_test(job, "/host/workspace", ".", test_shards=4) == 5
+    assert job["results"]["test"][0] == 5
+    assert mock_phase.call_count == 4
+    mock_phase.side_effect = None
+    mock_phase.return_value = 0
+    assert run_lvl3_job_test(job, "/host/workspace", ".", test_shards=4) == 0
+
+def test_macosx_wheels_retagged(tmp_path):
+    job = get_lvl3_job("macosx_11_0_arm64", "12", "python -m build", None, "gcc", "cross")
+    assert job["retag"] == {"pattern": "*-cp312-cp312-linux_x86_64.whl", "platform": "macosx_11_0_arm64"}
+    assert retag_job_wheels(job, str(tmp_path)) == 1
+
+    (tmp_path / "dist").mkdir()
+    with zipfile.ZipFile(tmp_path / "dist" / "pkg-1.0-cp312-cp312-linux_x86_64.whl", "w") as zf:
+        zf.writestr("pkg-1.0.dist-info/WHEEL", "Wheel-Version: 1.0\nTag: cp312-cp312-linux_x86_64\n")
+
+    assert retag_job_wheels(job, str(tmp_path)) == 0
+    assert [p.name for p in (tmp_path / "dist").iterdir()] == ["pkg-1.0-cp312-cp312-macosx_11_0_arm64.whl"]
+
+@patch("wheel_repair.get_auditwheel", return_value="/usr/local/bin/auditwheel")
+@patch("wheel_repair.run_command")
+def test_linux_wheels_repaired(mock_run, mock_which, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    job = get_lvl3_job("manylinux_2_17_ppc64le", "12", "python -m build", None, "gcc", "cross")
+    assert repair_job_wheels(job, ".") == 1
+
+    (tmp_path / "dist").mkdir()
+    for name in ["a-1.0-cp312-cp312-linux_ppc64le.whl", "b-1.0-cp312-cp312-linux_ppc64le.whl", "c-1.0-py3-none-any.whl"]:
+        (tmp_path / "dist" / name).write_bytes(b"")
+    mock_run.side_effect = lambda args, log_path, prefix=None: 0 if "a-1.0" in args[2] else 1
+
+    assert repair_job_wheels(job, ".") == 1
+    assert mock_run.call_count == 2
+    args, log_path = mock_run.call_args_list[0][0]
+    assert args[1:] == ["repair", "./dist/a-1.0-cp312-cp312-linux_ppc64le.whl", "--plat", "manylinux_2_17_ppc64le", "--only-plat", "-w", "./dist"]
+    assert sorted(call[0][1] for call in mock_run.call_args_list) == ["pookie_logs/cp312-manylinux_2_17_ppc64le-repair-0.log", "pookie_logs/cp312-manylinux_2_17_ppc64le-repair-1.log"]
+    # only the repaired wheel is removed
+    assert sorted(p.name for p in (tmp_path / "dist").iterdir()) == ["b-1.0-cp312-cp312-linux_ppc64le.whl", "c-1.0-py3-none-any.whl"]
+
+def test_plan_longest_path_first(capsys):
+    jobs = [get_lvl3_job(target, "12", "python -m build", "pytest", "gcc", "emulate") for target in ["manylinux_2_17_x86_64", "manylinux_2_17_s390x"]]
+    estimate_job_costs(jobs, {}, "emulate")
+    print_plan(jobs, 2)
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == ">> Plan: 4 build and test phases on 2 worker(s), longest path first"
+    assert lines[1] == "- cp312-manylinux_2_17_s390x-build [emulate]: ~480s (emulate weight), path ~720s"
+    assert lines[2].startswith("- cp312-manylinux_2_17_s390x-test [emulate]: ~240s (emulate weight), path ~240s after cp312-manylinux_2_17_s390x-build")
+    assert lines[-1] == ">> Estimated duration: ~720s with 2 worker(s) (~810s of work)"
+
+def test_plan_leaves_the_caches_untouched(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "setup.py").write_text("setup()")
+    cache_dir = tmp_path / "cache"
+    ccache_log = cache_dir / "ccache" / "logs" / "cp312-manylinux_2_17_x86_64.log"
+    ccache_log.parent.mkdir(parents=True)
+    ccache_log.write_text("previous run")
+
+    run_docker_images(["manylinux_2_17_x86_64"], None, {"12": {}}, "python -m build", "pytest", "gcc", "cross", "/host/workspace",
+                      cache_dir=str(cache_dir), host_cache_path="/host/cache", ccache=True, plan=True)
+    assert ">> Plan: 2 build and test phases on 1 worker(s), longest path first" in capsys.readouterr().out
+    assert ccache_log.read_text() == "previous run"
+    assert sorted(p.name for p in cache_dir.iterdir()) == ["ccache"]
+
+@patch("docker_images_runner.start_lvl3_container", side_effect=["container1", "container2"])
+@patch("docker_images_runner.exec_lvl3_container", side_effect=[124, 0])
+def test_timed_out_warm_container_is_replaced(mock_exec, mock_start):
+    job = get_lvl3_job("manylinux_2_17_x86_64", "12", "python -m build", "pytest", "gcc", "native")
+    containers = {}
+
+    assert run_lvl3_job_command(job, job["build_command"], "/host/workspace", "build.log", containers=containers) == 124
+    assert containers == {}
+    assert run_lvl3_job_command(job, job["test_command"], "/host/workspace", "test.log", containers=containers) == 0
+    assert [call[0][0] for call in mock_exec.call_args_list] == ["container1", "container2"]
+    assert containers == {"cp312-manylinux_2_17_x86_64": "container2"}
+
+@patch("docker_images_runner.run_lvl3_job_test")
+@patch("docker_images_runner.run_lvl3_job_build", return_value=124)
+def test_sequential_test_skipped_after_failed_build(mock_build, mock_test, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    jobs = [get_lvl3_job("manylinux_2_17_x86_64", "12", "python -m build", "pytest", "gcc", "native")]
+    run_docker_images_sequentially(jobs, None, "python -m build", "pytest", "gcc", "native", "/host/workspace", warm_containers=True)
+
+    assert not mock_test.called
+    assert ">> The build for cp312-manylinux_2_17_x86_64 failed, skipping its test" in capsys.readouterr().out
+
+@patch("docker_images_runner.sync_image", return_value=True)
+@patch("docker_images_runner.remove_container")
+@patch("docker_images_runner.run_command", return_value=0)
+@patch("docker_images_runner.capture_command")
+def test_remote_host_copies_the_workspace(mock_capture, mock_run, mock_remove, mock_sync, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "job").mkdir()
+    host = parse_docker_host("tcp://127.0.0.1:23751=2")
+    job = dict(get_lvl3_job("manylinux_2_17_aarch64", "12", "python -m build", "pytest", "gcc", "cross"), docker_host=host)
+
+    def capture(args, env=None):
+        if args[1] == "cp" and args[3] == "job/dist":
+            (tmp_path / "job" / "dist" / "stub-0.1-cp312-cp312-linux_aarch64.whl").write_bytes(b"")
+        return 0, "", ""
+    mock_capture.side_effect = capture
+
+    # warm containers cannot mount the workspace on a remote host
+    assert run_lvl3_job_command(job, "build", "/host/workspace", "build.log", containers={}, workspace="job") == 0
+    create, copy_in, copy_out = [call[0][0] for call in mock_capture.call_args_list]
+    name = create[create.index("--name") + 1]
+    assert create[:2] == ["docker", "create"] and "/host/workspace:/workspace" not in create
+    assert copy_in == ["docker", "cp", "job/.", f"{name}:/workspace"]
+    assert mock_run.call_args[0][0] == ["docker", "start", "-a", name]
+    assert copy_out == ["docker", "cp", f"{name}:/workspace/dist/.", "job/dist"]
+    assert all(call[1]["env"] is host["env"] for call in mock_capture.call_args_list)
+    mock_remove.assert_called_once_with(name, host["env"])
+    assert [p.name for p in (tmp_path / "job" / "dist").iterdir()] == ["stub-0.1-cp312-cp312-linux_aarch64.whl"]
+
+@patch("docker_images_runner.get_image", return_value=None)
+def test_tracing_keeps_the_build_fingerprint(mock_image, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "setup.py").write_text("setup()")
+    job = get_lvl3_job("manylinux_2_17_x86_64", "12", "python -m build", "pytest", "gcc", "native")
+    monkeypatch.setattr("trace_events._enabled", True)
+    traced_job = get_lvl3_job("manylinux_2_17_x86_64", "12", "python -m build", "pytest", "gcc", "native")
+    assert traced_job["build_command"] != job["build_command"]
+
+    skip_up_to_date_builds([job, traced_job], ["gcc", "native"])
+    assert traced_job["fingerprint"] == job["fingerprint"]
+
+@patch("docker_images_runner.get_image", return_value=None)
+def test_fingerprint_covers_the_chosen_mode(mock_image, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "setup.py").write_text("setup()")
+    cross_job = dict(get_lvl3_job("manylinux_2_17_aarch64", "12", "python -m build", "pytest", "gcc", "cross"), mode="cross")
+    emulate_job = dict(get_lvl3_job("manylinux_2_17_aarch64", "12", "python -m build", "pytest", "gcc", "emulate"), mode="emulate")
+
+    skip_up_to_date_builds([cross_job, emulate_job], ["gcc", "auto"])
+    assert cross_job["fingerprint"] != emulate_job["fingerprint"]
+
+@patch("docker_images_runner.get_image", return_value=None)
+def test_fingerprint_covers_abi3(mock_image, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "setup.py").write_text("setup()")
+    job = get_lvl3_job("manylinux_2_17_x86_64", "12", "python -m build", "pytest", "gcc", "native")
+    abi3_job = get_lvl3_job("manylinux_2_17_x86_64", "12", "python -m build", "pytest", "gcc", "native", abi3=True)
+
+    skip_up_to_date_builds([job, abi3_job], ["gcc", "native"])
+    assert job["fingerprint"] != abi3_job["fingerprint"]
+
+def test_remote_jobs_run_without_caches(tmp_path):
+    job = get_lvl3_job("manylinux_2_17_x86_64", "12", "python -m build", "pytest", "gcc", "native")
+    job["env"] = {"SETUPTOOLS_SCM_PRETEND_VERSION": "1.0"}
+    build_command = job["build_command"]
+    add_pip_cache(job, str(tmp_path), "/host/cache", ["build"])
+    add_compiler_cache(job, str(tmp_path), "/host/cache", "gcc")
+
+    command, env = strip_job_caches(job, job["build_command"])
+    assert command == build_command
+    assert env == {"SETUPTOOLS_SCM_PRETEND_VERSION": "1.0"}
+    assert strip_job_caches(job, job["test_command"])[0] == job["test_command"]
+
+@patch("docker_images_runner.run_command")
+@patch("docker_images_runner.run_container", return_value=0)
+@patch("docker_images_runner.use_engine_api", return_value=True)
+def test_engine_api_runs_the_container(mock_api, mock_run_container, mock_run_command):
+    assert run_lvl3_image("manylinux-lvl3-cp312-manylinux_2_17_x86_64", "make", "/host/workspace", "build.log",
+                          volumes={"/host/cache/pip": "/pookie-cache/pip"}, env={"PIP_CACHE_DIR": "/pookie-cache/pip"}, timeout=60) == 0
+
+    args, kwargs = mock_run_container.call_args
+    assert args[1:] == ("manylinux-lvl3-cp312-manylinux_2_17_x86_64", ["/bin/bash", "-c", "make"], "build.log", None,
+                        "manylinux-lvl3-cp312-manylinux_2_17_x86_64", "/workspace",
+                        ["/host/cache/pip:/pookie-cache/pip", "/host/workspace:/workspace"], {"PIP_CACHE_DIR": "/pookie-cache/pip"}, False)
+    assert kwargs == {"privileged": True, "timeout": 60}
+    assert not mock_run_command.called
+
+def test_job_workspace_ignores_only_root_outputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for path in ["dist/old.whl", "build/lib/x.o", ".git/HEAD", "mypkg/build/data.txt", "tests/data/dist/sample.tar.gz", "mypkg/__pycache__/m.pyc", "setup.py"]:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text("")
+
+    job_workspace = tmp_path / prepare_job_workspace("cp312-manylinux_2_17_x86_64")
+    assert sorted(str(p.relative_to(job_workspace)) for p in job_workspace.rglob("*") if p.is_file()) == [
+        ".git/HEAD", "mypkg/build/data.txt", "setup.py", "tests/data/dist/sample.tar.gz"
+    ]
+
+def test_job_workspace_keeps_the_git_version(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "setup.py").write_text("setup()")
+    (tmp_path / ".gitignore").write_text("*.log\n")
+    git = ["git", "-c", "user.name=pookie", "-c", "user.email=pookie@example.com"]
+    subprocess.run(["git", "init", "-q"], check=True)
+    subprocess.run(git + ["add", "."], check=True)
+    subprocess.run(git + ["commit", "-q", "-m", "release"], check=True)
+    subprocess.run(git + ["tag", "v1.2.3"], check=True)
+    (tmp_path / "debug.log").write_text("ignored")
+
+    job_workspace = tmp_path / prepare_job_workspace("cp312-manylinux_2_17_x86_64")
+    assert not (job_workspace / "debug.log").exists()
+    describe = subprocess.run(["git", "describe", "--tags", "--dirty"], cwd=job_workspace, capture_output=True, text=True, check=True)
+    assert describe.stdout.strip() == "v1.2.3"
+
+    # the objects are shared with the workspace, the refs and the index are not
+    head = subprocess.run(["git", "rev-parse", "HEAD:setup.py"], capture_output=True, text=True, check=True).stdout.strip()
+    obj = f"objects/{head[:2]}/{head[2:]}"
+    assert os.path.samefile(tmp_path / ".git" / obj, job_workspace / ".git" / obj)
+    assert not os.path.samefile(tmp_path / ".git" / "index", job_workspace / ".git" / "index")
@@ -0,0 +1,107 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import gzip
+import os
+import tarfile
+import pytest
+from unittest.mock import patch
+from image_bundle import get_compressor, get_bundle_images, export_images, import_images
+
+PYTHON_VERSIONS_DIC = {
+    minor: {
+        target: {"url": f"https://example.invalid/cpython-3.{minor}.0-{target}.tar.gz", "filename": f"cpython-3.{minor}.0-{target}.tar.gz", "tag": "stub"}
+        for target in ["manylinux_2_17_x86_64", "manylinux_2_17_aarch64", "win_amd64"]
+    }
+    for minor in ["12", "13"]
+}
+
+# docker stub whose 'save' writes a tar file with one member per image
+STUB_DOCKER = """#!/bin/bash
+[ "$1" == "save" ] || exit 1
+shift
+tmp="$(mktemp -d)"
+for image in "$@"; do echo "$image" > "$tmp/$image"; done
+tar -C "$tmp" -cf - "$@"
+"""
+
+def test_get_compressor():
+    assert get_compressor("images.tar") == []
+    assert get_compressor("images.tar.gz")[0] in ("pigz", "gzip")
+    with pytest.raises(ValueError):
+        get_compressor("images.zip")
+
+def test_bundle_images_parents_first():
+    images = get_bundle_images(["manylinux_2_17_aarch64", "win_amd64"], PYTHON_VERSIONS_DIC)
+
+    assert images == [
+        "win-macosx-pookie-lvl1-base",
+        "manylinux-lvl1-base",
+        "manylinux-lvl2-gcc-aarch64-linux-gnu",
+        "win-macosx-pookie-lvl2-msvc-mingw64",
+        "manylinux-lvl3-cp312-cross-python",
+        "manylinux-lvl3-cp312-manylinux_2_17_aarch64",
+        "manylinux-lvl3-cp313-cross-python",
+        "manylinux-lvl3-cp313-manylinux_2_17_aarch64",
+        "win-macosx-pookie-lvl3-cp312-win_amd64",
+        "win-macosx-pookie-lvl3-cp313-win_amd64"
+    ]
+
+@patch("image_bundle.load_image_inventory")
+@patch("image_bundle.get_image")
+def test_export_images(mock_get_image, mock_inventory, tmp_path, monkeypatch):
+    (tmp_path / "bin").mkdir()
+    (tmp_path / "bin" / "docker").write_text(STUB_DOCKER)
+    os.chmod(tmp_path / "bin" / "docker", 0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path / 'bin'}{os.pathsep}{os.environ['PATH']}")
+    mock_get_image.side_effect = lambda image_name: None if "cp313" in image_name else {"id": "abc"}
+    archive = tmp_path / "out" / "images.tar.gz"
+
+    with open(tmp_path / "pookie.log", "w") as logfile:
+        assert export_images(str(archive), ["manylinux_2_17_x86_64"], PYTHON_VERSIONS_DIC, logfile) == 0
+
+    with gzip.open(archive) as f, tarfile.open(fileobj=f) as tar:
+        assert tar.getnames() == ["manylinux-lvl1-base", "manylinux-lvl2-gnu-gcc-clang", "manylinux-lvl3-cp312-manylinux_2_17_x86_64"]
+    assert os.listdir(tmp_path / "out") == ["images.tar.gz"]
+
+@patch("image_bundle.load_image_inventory")
+@patch("image_bundle.get_image", return_value={"id": "abc"})
+@patch("image_bundle.run_command", return_value=1)
+def test_export_images_failed(mock_run, mock_get_image, mock_inventory, tmp_path):
+    archive = tmp_path / "images.tar"
+    archive.write_text("previous")
+
+    assert export_images(str(archive), ["manylinux_2_17_x86_64"], PYTHON_VERSIONS_DIC, None) == 1
+    assert "docker save manylinux-lvl1-base " in mock_run.call_args[0][0][2]
+    # the previous archive is kept
+    assert archive.read_text() == "previous"
+
+@patch("image_bundle.load_image_inventory")
+@patch("image_bundle.capture_command")
+def test_import_images(mock_capture, mock_inventory, tmp_path):
+    archive = tmp_path / "images.tar.zst"
+    with open(tmp_path / "pookie.log", "w") as logfile:
+        assert import_images(str(archive), logfile) == 1
+        assert mock_capture.call_count == 0
+
+        archive.write_bytes(b"")
+        mock_capture.return_value = (0, "Loaded image: manylinux-lvl1-base:latest\nLoaded image: manylinux-lvl2-gnu-gcc-clang:latest\n", "")
+        assert import_images(str(archive), logfile) == 0
+
+    assert mock_capture.call_args[0][0] == ["docker", "load", "-i", str(archive)]
+    mock_inventory.assert_called_with(refresh=True)
@@ -0,0 +1,86 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from unittest.mock import patch
+import docker_image_inventory
+from image_gc import get_image_parent, get_pookie_images, record_image_use, load_image_usage, collect_images
+
+DOCKER_IMAGES_OUTPUT = (
+    "manylinux-lvl1-base:latest\ta1\t2025-01-01 10:00:00 +0000 UTC\t1GB\n"
+    "manylinux-lvl2-gcc-s390x-linux-gnu:latest\ta2\t2025-01-01 10:00:00 +0000 UTC\t3GB\n"
+    "manylinux-lvl3-cp310-manylinux_2_17_s390x:latest\ta3\t2025-01-02 10:00:00 +0000 UTC\t5GB\n"
+    "manylinux-lvl3-cp311-manylinux_2_17_s390x:latest\ta4\t2025-01-03 10:00:00 +0000 UTC\t5GB\n"
+    "manylinux-lvl2-gcc-aarch64-linux-gnu:latest\ta5\t2025-01-01 10:00:00 +0000 UTC\t3GB\n"
+    "manylinux-lvl3-cp312-manylinux_2_17_aarch64:latest\ta6\t2025-01-04 10:00:00 +0000 UTC\t5GB\n"
+    "win-macosx-pookie-lvl2-pookie:latest\ta7\t2025-01-01 10:00:00 +0000 UTC\t2GB\n"
+    "ubuntu:24.04\ta8\t2025-01-01 10:00:00 +0000 UTC\t80MB\n"
+)
+
+def test_image_parent():
+    assert get_image_parent("manylinux-lvl3-cp312-manylinux_2_17_s390x") == "manylinux-lvl2-gcc-s390x-linux-gnu"
+    assert get_image_parent("manylinux-lvl3-cp312-cross-python") == "manylinux-lvl1-base"
+    assert get_image_parent("musllinux-lvl2-musl-gcc-clang") == "musllinux-lvl1-base"
+    assert get_image_parent("win-macosx-pookie-lvl2-osxcross") == "win-macosx-pookie-lvl1-base"
+    assert get_image_parent("manylinux-lvl1-base") is None
+    assert get_image_parent("ubuntu") is None
+
+def test_pookie_images_shared_layers_counted_once():
+    images = get_pookie_images(docker_image_inventory.parse_image_inventory(DOCKER_IMAGES_OUTPUT))
+
+    assert "ubuntu" not in images
+    assert images["manylinux-lvl1-base"]["size"] == 1000 ** 3
+    assert images["manylinux-lvl2-gcc-s390x-linux-gnu"]["size"] == 2 * 1000 ** 3
+    assert images["manylinux-lvl3-cp310-manylinux_2_17_s390x"]["size"] == 2 * 1000 ** 3
+    assert images["manylinux-lvl3-cp310-manylinux_2_17_s390x"]["level"] == 3
+
+def test_record_image_use(tmp_path):
+    record_image_use(str(tmp_path), ["a", "b"], now=10)
+    record_image_use(str(tmp_path), ["b"], now=20)
+    assert load_image_usage(str(tmp_path)) == {"a": 10, "b": 20}
+
+@patch("image_gc.capture_command")
+@patch("docker_image_inventory.capture_command")
+def test_collect_images(mock_list, mock_rmi, tmp_path, monkeypatch):
+    monkeypatch.setattr(docker_image_inventory, "_inventory", None)
+    mock_list.return_value = (0, DOCKER_IMAGES_OUTPUT, "")
+    mock_rmi.return_value = (0, "", "")
+    # cp311 was used recently, cp310 and cp312 were not used since they were created
+    record_image_use(str(tmp_path), ["manylinux-lvl3-cp311-manylinux_2_17_s390x"])
+
+    # 13 GB of images (1 + 2 + 2 + 2 + 2 + 2 + 2)
+    removed = collect_images(str(tmp_path), 8 * 1000 ** 3, keep=["manylinux-lvl3-cp311-manylinux_2_17_s390x", "manylinux-lvl2-gcc-s390x-linux-gnu"])
+
+    # least recently used level 3 images first, then the level 2 image left without level 3 images
+    assert removed == [
+        "manylinux-lvl3-cp310-manylinux_2_17_s390x",
+        "manylinux-lvl3-cp312-manylinux_2_17_aarch64",
+        "manylinux-lvl2-gcc-aarch64-linux-gnu"
+    ]
+    assert [call[0][0] for call in mock_rmi.call_args_list] == [["docker", "rmi", name] for name in removed]
+    assert mock_list.call_count == 1
+    assert docker_image_inventory.get_image("manylinux-lvl3-cp310-manylinux_2_17_s390x") is None
+    assert list(load_image_usage(str(tmp_path))) == ["manylinux-lvl3-cp311-manylinux_2_17_s390x"]
+
+@patch("image_gc.capture_command")
+@patch("docker_image_inventory.capture_command")
+def test_collect_images_under_budget(mock_list, mock_rmi, tmp_path, monkeypatch):
+    monkeypatch.setattr(docker_image_inventory, "_inventory", None)
+    mock_list.return_value = (0, DOCKER_IMAGES_OUTPUT, "")
+
+    assert collect_images(str(tmp_path), 20 * 1000 ** 3) == []
+    assert mock_rmi.call_count == 0
@@ -0,0 +1,75 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from docker_images_runner import get_lvl3_job
+from job_costs import get_phase_kind, record_job_durations, load_job_durations, estimate_job_costs, estimate_makespan
+
+def make_jobs(targets, minors=("12",), mode="cross"):
+    return [get_lvl3_job(target, minor, "python -m build", "pytest", "gcc", mode) for target in targets for minor in minors]
+
+def test_phase_kind():
+    x86_64, s390x, win = make_jobs(["manylinux_2_17_x86_64", "manylinux_2_17_s390x", "win_amd64"])
+
+    assert get_phase_kind(x86_64, "test", "cross") == "native"
+    assert get_phase_kind(s390x, "build", "emulate") == "emulate"
+    assert get_phase_kind(s390x, "test", "cross") == "emulate"
+    assert get_phase_kind(win, "build", "cross") == "cross"
+    assert get_phase_kind(win, "test", "cross") == "wine"
+    s390x["mode"] = "cross"
+    assert get_phase_kind(s390x, "build", "auto") == "cross"
+
+def test_default_weights():
+    x86_64, s390x, win = make_jobs(["manylinux_2_17_x86_64", "manylinux_2_17_s390x", "win_amd64"])
+    estimate_job_costs([x86_64, s390x, win], {}, "cross", test_shards=2)
+
+    assert x86_64["costs"] == {"build": (60, "native weight", "native"), "test": (30, "native weight", "native")}
+    assert s390x["costs"]["build"] == (120, "cross weight", "cross")
+    # the emulated tests are split into 2 shards
+    assert s390x["costs"]["test"] == (120, "emulate weight", "emulate")
+    assert win["costs"]["test"] == (60, "wine weight", "wine")
+
+def test_durations_of_previous_run(tmp_path):
+    path = str(tmp_path / "job_durations.json")
+    jobs = make_jobs(["manylinux_2_17_x86_64", "manylinux_2_17_s390x"], minors=("12", "13"))
+    jobs[0]["durations"] = {"build": 10, "test": 5}
+    jobs[2]["durations"] = {"build": 40}
+    record_job_durations(path, "/project", jobs, "cross")
+    records = load_job_durations(path)["/project"]
+    assert records["cp312-manylinux_2_17_s390x"] == {"build": {"seconds": 40, "kind": "cross"}}
+
+    estimate_job_costs(jobs, records, "cross")
+    assert jobs[0]["costs"]["build"] == (10, "previous run", "native")
+    assert jobs[3]["costs"]["build"] == (40, "other Python versions", "cross")
+    # measured native test of 5 seconds times the emulate weight
+    assert jobs[2]["costs"]["test"] == (40, "emulate weight, previous runs", "emulate")
+
+    # a build measured in another mode is not reused
+    estimate_job_costs(jobs, records, "emulate")
+    assert jobs[2]["costs"]["build"][1] != "previous run"
+
+def test_makespan_longest_first():
+    jobs = {
+        "a": {"deps": [], "cost": 3},
+        "b": {"deps": [], "cost": 3},
+        "c": {"deps": [], "cost": 6},
+    }
+    # c starts first, a and b share the second worker
+    assert estimate_makespan(jobs, 2) == 6
+    assert estimate_makespan(jobs, 1) == 12
+    jobs["d"] = {"deps": ["a"], "cost": 10}
+    assert estimate_makespan(jobs, 2) == 13
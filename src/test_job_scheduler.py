@@ -0,0 +1,90 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+import pytest
+from job_scheduler import run_job_graph, get_critical_paths
+
+def test_dependencies_run_in_order():
+    order = []
+    lock = threading.Lock()
+
+    def make(name):
+        def func():
+            with lock:
+                order.append(name)
+            return True
+        return func
+
+    jobs = {
+        'build': {'func': make('build'), 'deps': []},
+        'test': {'func': make('test'), 'deps': ['build']},
+    }
+
+    status = run_job_graph(jobs, 4)
+    assert status == {'build': 'ok', 'test': 'ok'}
+    assert order == ['build', 'test']
+
+def test_independent_jobs_run_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+
+    def func():
+        barrier.wait()
+        return True
+
+    jobs = {
+        'a': {'func': func, 'deps': []},
+        'b': {'func': func, 'deps': []},
+    }
+
+    assert run_job_graph(jobs, 2) == {'a': 'ok', 'b': 'ok'}
+
+def test_failed_dependency_skips_dependents():
+    jobs = {
+        'build': {'func': lambda: False, 'deps': []},
+        'test': {'func': lambda: True, 'deps': ['build']},
+        'report': {'func': lambda: True, 'deps': ['test']},
+    }
+
+    status = run_job_graph(jobs, 2)
+    assert status == {'build': 'failed', 'test': 'skipped', 'report': 'skipped'}
+
+def test_unknown_dependency():
+    with pytest.raises(ValueError):
+        run_job_graph({'test': {'func': lambda: True, 'deps': ['build']}}, 1)
+
+def test_longest_path_first():
+    order = []
+    lock = threading.Lock()
+
+    def make(name):
+        def func():
+            with lock:
+                order.append(name)
+            return True
+        return func
+
+    jobs = {
+        'short': {'func': make('short'), 'deps': [], 'cost': 1},
+        'medium': {'func': make('medium'), 'deps': [], 'cost': 5},
+        'build': {'func': make('build'), 'deps': [], 'cost': 2},
+        'test': {'func': make('test'), 'deps': ['build'], 'cost': 10},
+    }
+
+    assert get_critical_paths(jobs) == {'short': 1, 'medium': 5, 'build': 12, 'test': 10}
+    assert set(run_job_graph(jobs, 1).values()) == {'ok'}
+    assert order == ['build', 'test', 'medium', 'short']
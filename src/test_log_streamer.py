@@ -0,0 +1,30 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import queue
+import log_streamer
+from log_streamer import show_line
+
+def test_full_live_view_drops_lines(monkeypatch):
+    monkeypatch.setattr(log_streamer, "_live_queue", queue.Queue(maxsize=1))
+    monkeypatch.setattr(log_streamer, "_dropped_lines", 0)
+
+    for _ in range(3):
+        show_line("job", b"line")
+
+    assert log_streamer._live_queue.qsize() == 1
+    assert log_streamer._dropped_lines == 2
@@ -0,0 +1,67 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from non_native_modes import choose_mode, select_modes, record_mode_results, load_mode_records
+
+def test_choose_mode_measures_both_modes_first():
+    assert choose_mode(None, "tree") == ("cross", "emulate")
+
+    record = {"tree_hash": "tree", "modes": {"cross": {"ok": True, "seconds": 60, "measured": 1000}}}
+    assert choose_mode(record, "tree", now=2000) == ("emulate", "cross")
+
+def test_choose_mode_fastest_working_mode():
+    record = {"tree_hash": "tree", "modes": {
+        "cross": {"ok": True, "seconds": 60, "measured": 1000},
+        "emulate": {"ok": True, "seconds": 30, "measured": 1000}
+    }}
+    assert choose_mode(record, "tree", now=2000) == ("emulate", "cross")
+
+    record["modes"]["emulate"]["ok"] = False
+    assert choose_mode(record, "tree", now=2000) == ("cross", "emulate")
+
+    # the measures expire
+    assert choose_mode(record, "tree", ttl=500, now=2000) == ("cross", "emulate")
+
+def test_choose_mode_retries_failed_mode_when_sources_change():
+    record = {"tree_hash": "old", "modes": {
+        "cross": {"ok": False, "seconds": None, "measured": 1000},
+        "emulate": {"ok": True, "seconds": 300, "measured": 1000}
+    }}
+    assert choose_mode(record, "old", now=2000) == ("emulate", "cross")
+    assert choose_mode(record, "new", now=2000) == ("cross", "emulate")
+
+def test_record_and_select_modes(tmp_path):
+    path = str(tmp_path / "modes.json")
+    assert select_modes(path, "/project", ["manylinux_2_17_x86_64", "manylinux_2_17_s390x"], "tree") == {
+        "manylinux_2_17_s390x": ("cross", "emulate")
+    }
+
+    record_mode_results(path, "/project", "tree", [
+        ("manylinux_2_17_s390x", "cross", False, 10),
+        ("manylinux_2_17_s390x", "emulate", True, 100),
+        ("manylinux_2_17_s390x", "emulate", True, 200)
+    ])
+    modes = load_mode_records(path)["/project"]["manylinux_2_17_s390x"]["modes"]
+    assert modes["cross"]["ok"] is False
+    assert modes["emulate"]["seconds"] == 150
+    assert select_modes(path, "/project", ["manylinux_2_17_s390x"], "tree") == {
+        "manylinux_2_17_s390x": ("emulate", "cross")
+    }
+    assert select_modes(path, "/other", ["manylinux_2_17_s390x"], "tree") == {
+        "manylinux_2_17_s390x": ("cross", "emulate")
+    }
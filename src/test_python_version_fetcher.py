@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
+import pytest
 from unittest.mock import patch
 from python_version_fetcher import get_latest_release_urls
 
@@ -65,4 +66,64 @@ def test_no_matching_versions(mock_get):
     }
 
     result = get_latest_release_urls(["10"], ["manylinux_2_17_x86_64"])
-    assert result == {}
\ No newline at end of file
+    assert result == {}
+
+
+RELEASE = {
+    "tag_name": "v1.0.0",
+    "assets": [
+        {"name": "cpython-3.12.1+123-x86_64-unknown-linux-gnu-install_only.tar.gz", "browser_download_url": "url_12", "digest": "sha256:abc"}
+    ]
+}
+
+@patch("python_version_fetcher.requests.get")
+def test_cache_within_ttl(mock_get, tmp_path):
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.headers = {"ETag": '"etag1"'}
+    mock_get.return_value.json.return_value = RELEASE
+
+    first = get_latest_release_urls(["12"], ["manylinux_2_17_x86_64"], str(tmp_path))
+    second = get_latest_release_urls(["12"], ["manylinux_2_17_x86_64"], str(tmp_path))
+
+    assert first == second
+    assert first["12"]["manylinux_2_17_x86_64"]["sha256"] == "abc"
+    assert mock_get.call_count == 1
+
+@patch("python_version_fetcher.requests.get")
+def test_cache_revalidation(mock_get, tmp_path):
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.headers = {"ETag": '"etag1"'}
+    mock_get.return_value.json.return_value = RELEASE
+    get_latest_release_urls(["12"], ["manylinux_2_17_x86_64"], str(tmp_path), ttl=0)
+
+    mock_get.return_value.status_code = 304
+    result = get_latest_release_urls(["12"], ["manylinux_2_17_x86_64"], str(tmp_path), ttl=0)
+
+    assert mock_get.call_args.kwargs["headers"]["If-None-Match"] == '"etag1"'
+    assert result["12"]["manylinux_2_17_x86_64"]["url"] == "url_12"
+
+@patch("python_version_fetcher.requests.get")
+def test_offline(mock_get, tmp_path):
+    with pytest.raises(Exception):
+        get_latest_release_urls(["12"], ["manylinux_2_17_x86_64"], str(tmp_path), offline=True)
+
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.headers = {}
+    mock_get.return_value.json.return_value = RELEASE
+    get_latest_release_urls(["12"], ["manylinux_2_17_x86_64"], str(tmp_path))
+
+    mock_get.reset_mock()
+    result = get_latest_release_urls(None, ["manylinux_2_17_x86_64"], str(tmp_path), ttl=0, offline=True)
+    assert list(result.keys()) == ["12"]
+    mock_get.assert_not_called()
+
+@patch("python_version_fetcher.requests.get")
+def test_stale_cache_when_api_is_down(mock_get, tmp_path):
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.headers = {}
+    mock_get.return_value.json.return_value = RELEASE
+    get_latest_release_urls(["12"], ["manylinux_2_17_x86_64"], str(tmp_path))
+
+    mock_get.return_value.status_code = 503
+    result = get_latest_release_urls(["12"], ["manylinux_2_17_x86_64"], str(tmp_path), ttl=0)
+    assert result["12"]["manylinux_2_17_x86_64"]["url"] == "url_12"
@@ -0,0 +1,77 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+
+from unittest.mock import patch
+from docker_images_runner import get_lvl3_job
+from run_history import record_run, compare_latest_run, print_report, get_pookie_version
+
+def make_jobs(build_seconds, test_seconds=10, test_exit_code=0):
+    jobs = [get_lvl3_job(target, "12", "python -m build", "pytest", "gcc", "cross") for target in ["manylinux_2_17_x86_64", "manylinux_2_17_s390x"]]
+    for lvl3_job, seconds in zip(jobs, build_seconds):
+        lvl3_job["results"] = {"build": (0, seconds), "test": (test_exit_code, test_seconds)}
+        lvl3_job["wheels"] = [f"stub-0.1-cp312-cp312-{lvl3_job['target']}.whl"]
+    return jobs
+
+def record(path, jobs, image_id="sha256:aaa", dist_dir="dist"):
+    with patch("run_history.get_image", return_value={"id": image_id, "created": "", "size": 0}):
+        return record_run(path, "/project", jobs, 0, {"jobs": 1}, dist_dir)
+
+def test_record_run(tmp_path):
+    path = str(tmp_path / "run_history.sqlite")
+    (tmp_path / "stub-0.1-cp312-cp312-manylinux_2_17_x86_64.whl").write_bytes(b"x" * 100)
+
+    assert record(path, make_jobs([]), dist_dir=str(tmp_path)) is None
+    run_id = record(path, make_jobs([20, 60]), dist_dir=str(tmp_path))
+
+    run, phases = compare_latest_run(path, "/project")
+    assert run["id"] == run_id
+    assert run["pookie_version"] == get_pookie_version()
+    assert [(phase["target"], phase["phase"], phase["wheel_bytes"], phase["status"]) for phase in phases] == [
+        ("manylinux_2_17_s390x", "build", None, "new"),
+        ("manylinux_2_17_s390x", "test", None, "new"),
+        ("manylinux_2_17_x86_64", "build", 100, "new"),
+        ("manylinux_2_17_x86_64", "test", None, "new"),
+    ]
+    assert compare_latest_run(path, "/other") is None
+
+def test_regression_against_median(tmp_path):
+    path = str(tmp_path / "run_history.sqlite")
+    for seconds in [20, 21, 100, 19]:
+        record(path, make_jobs([seconds, 60]))
+    # median of 20, 21, 100 and 19, the outlier does not hide the regression
+    record(path, make_jobs([30, 62], test_exit_code=1), image_id="sha256:bbb")
+
+    phases = {(phase["target"], phase["phase"]): phase for phase in compare_latest_run(path, "/project", threshold=0.25)[1]}
+    x86_64 = phases[("manylinux_2_17_x86_64", "build")]
+    assert x86_64["baseline"] == 20.5
+    assert x86_64["status"] == "regressed"
+    assert x86_64["image_changed"]
+    assert phases[("manylinux_2_17_s390x", "build")]["status"] == "ok"
+    assert phases[("manylinux_2_17_s390x", "test")]["status"] == "failed"
+
+    # only the previous run is in a baseline of 1 run
+    assert compare_latest_run(path, "/project", baseline_runs=1)[1][2]["baseline"] == 19
+
+def test_small_slowdowns_are_noise(tmp_path, capsys):
+    path = str(tmp_path / "run_history.sqlite")
+    record(path, make_jobs([2, 60]))
+    record(path, make_jobs([4, 60]))
+
+    assert print_report(path, "/project") == []
+    assert "0 of 4 phases regressed" in capsys.readouterr().out
@@ -0,0 +1,92 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import http.server
+import os
+import threading
+import pytest
+from tarball_cache import fetch_tarball, evict_tarballs, load_index, prepare_build_context
+
+TARBALLS = {
+    "/python-a.tar.gz": b"a" * 1000,
+    "/python-b.tar.gz": b"b" * 2000,
+}
+
+@pytest.fixture
+def server():
+    requests_count = {"count": 0}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_count["count"] += 1
+            body = TARBALLS.get(self.path)
+            if body is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", requests_count
+    httpd.shutdown()
+
+def test_downloaded_once(server, tmp_path):
+    url, requests_count = server
+    sha256 = hashlib.sha256(TARBALLS["/python-a.tar.gz"]).hexdigest()
+
+    path1 = fetch_tarball(f"{url}/python-a.tar.gz", str(tmp_path), "python-a.tar.gz", sha256)
+    path2 = fetch_tarball(f"{url}/python-a.tar.gz", str(tmp_path), "python-a.tar.gz", sha256)
+
+    assert path1 == path2
+    assert sha256 in path1
+    assert open(path1, "rb").read() == TARBALLS["/python-a.tar.gz"]
+    assert requests_count["count"] == 1
+
+def test_checksum_mismatch(server, tmp_path):
+    url, _ = server
+    with pytest.raises(Exception):
+        fetch_tarball(f"{url}/python-a.tar.gz", str(tmp_path), "python-a.tar.gz", "0" * 64)
+    assert load_index(str(tmp_path)) == {}
+
+def test_lru_eviction(server, tmp_path):
+    url, _ = server
+    fetch_tarball(f"{url}/python-a.tar.gz", str(tmp_path), "python-a.tar.gz")
+    fetch_tarball(f"{url}/python-b.tar.gz", str(tmp_path), "python-b.tar.gz")
+
+    # python-a is the least recently used one
+    assert evict_tarballs(str(tmp_path), 2500) == ["python-a.tar.gz"]
+    assert list(load_index(str(tmp_path))) == ["python-b.tar.gz"]
+
+    # tarballs in use are never evicted
+    assert evict_tarballs(str(tmp_path), 0, keep=["python-b.tar.gz"]) == []
+
+def test_build_context(server, tmp_path):
+    url, _ = server
+    path = fetch_tarball(f"{url}/python-a.tar.gz", str(tmp_path), "python-a.tar.gz")
+
+    context_dir = prepare_build_context(str(tmp_path), {"python.tar.gz": path})
+    assert os.listdir(context_dir) == ["python.tar.gz"]
+    assert os.path.samefile(os.path.join(context_dir, "python.tar.gz"), path)
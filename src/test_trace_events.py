@@ -0,0 +1,46 @@
+import json
+import os
+import subprocess
+import pytest
+import trace_events
+from trace_events import trace_span, mark_phase, prepare_marks, collect_marks, get_trace_events, write_trace
+
+@pytest.fixture
+def tracing(monkeypatch):
+    monkeypatch.setattr(trace_events, "_enabled", True)
+    monkeypatch.setattr(trace_events, "_spans", [])
+    monkeypatch.setattr(trace_events, "_tracks", {})
+
+def test_disabled_tracing_does_not_change_commands():
+    assert mark_phase("test", "python test.py") == "python test.py"
+
+def test_trace_events(tracing, tmp_path):
+    with trace_span("release fetch"):
+        pass
+    with trace_span("docker build", "manylinux-lvl1-base", level=1):
+        pass
+
+    write_trace(str(tmp_path / "trace.json"))
+    trace = json.loads((tmp_path / "trace.json").read_text())
+
+    tracks = {event["args"]["name"]: event["tid"] for event in trace["traceEvents"] if event["name"] == "thread_name"}
+    assert set(tracks) == {"pookie", "manylinux-lvl1-base"}
+
+    spans = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    assert [span["name"] for span in spans] == ["release fetch", "docker build"]
+    assert spans[1]["tid"] == tracks["manylinux-lvl1-base"]
+    assert spans[1]["args"] == {"level": 1}
+    assert spans[0]["ts"] == 0
+
+def test_marks_written_inside_the_container(tracing, tmp_path):
+    # run the marked command as if /workspace was the temporary directory
+    command = mark_phase("user build", "true") + " && " + mark_phase("test", "false")
+    command = command.replace(trace_events.MARKS_MOUNT, str(tmp_path / trace_events.MARKS_FILE))
+    prepare_marks(str(tmp_path))
+    subprocess.run(["bash", "-c", command])
+
+    collect_marks("cp312-win_amd64", str(tmp_path))
+
+    spans = get_trace_events()["traceEvents"]
+    assert [span["name"] for span in spans if span["ph"] == "X"] == ["user build"]
+    assert not os.path.exists(tmp_path / trace_events.MARKS_FILE)
@@ -0,0 +1,44 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from unittest.mock import patch
+from wheel_repair import repair_wheel, repair_wheels
+
+@patch("wheel_repair.get_auditwheel", return_value=None)
+def test_auditwheel_missing(mock_which, tmp_path):
+    wheel = tmp_path / "pkg-1.0-cp312-cp312-linux_x86_64.whl"
+    wheel.write_bytes(b"")
+    log = tmp_path / "repair.log"
+
+    assert repair_wheel(str(wheel), "manylinux_2_17_x86_64", str(log)) == 127
+    assert "win-macosx-pookie-lvl2-pookie" in log.read_text()
+    assert wheel.exists()
+
+@patch("wheel_repair.get_auditwheel", return_value="auditwheel")
+@patch("wheel_repair.run_command")
+def test_repair_wheels(mock_run, mock_which, tmp_path):
+    paths = [str(tmp_path / f"pkg{i}-1.0-cp312-cp312-linux_s390x.whl") for i in range(3)]
+    for path in paths:
+        open(path, "wb").close()
+    mock_run.side_effect = lambda args, log_path, prefix=None: 2 if "pkg1" in args[2] else 0
+
+    returncodes = repair_wheels(paths, "manylinux_2_17_s390x", [f"{path}.log" for path in paths])
+
+    assert returncodes == {paths[0]: 0, paths[1]: 2, paths[2]: 0}
+    assert [p.name for p in tmp_path.iterdir()] == ["pkg1-1.0-cp312-cp312-linux_s390x.whl"]
+    assert mock_run.call_args_list[0][0][0][-2:] == ["-w", str(tmp_path)]
@@ -0,0 +1,90 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import base64
+import csv
+import hashlib
+import io
+import zipfile
+import pytest
+from wheel_retagger import get_retagged_filename, retag_wheel_metadata, retag_wheel, retag_wheels
+
+WHEEL_METADATA = "Wheel-Version: 1.0\nGenerator: setuptools (75.0.0)\nRoot-Is-Purelib: false\nTag: cp312-cp312-linux_x86_64\n"
+
+def make_wheel(path, name="pkg"):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(f"{name}/__init__.py", "from ._ext import *\n")
+        info = zipfile.ZipInfo(f"{name}/_ext.so")
+        info.external_attr = 0o755 << 16
+        zf.writestr(info, bytes(range(256)) * 4096)
+        zf.writestr(f"{name}-1.0.dist-info/METADATA", f"Metadata-Version: 2.1\nName: {name}\nVersion: 1.0\n")
+        zf.writestr(f"{name}-1.0.dist-info/WHEEL", WHEEL_METADATA)
+        zf.writestr(f"{name}-1.0.dist-info/RECORD", "stale\n")
+
+def test_retagged_filename():
+    assert get_retagged_filename("pkg-1.0-cp312-cp312-linux_x86_64.whl", "macosx_11_0_arm64") == "pkg-1.0-cp312-cp312-macosx_11_0_arm64.whl"
+    assert get_retagged_filename("pkg-1.0-1-cp312-abi3-linux_x86_64.whl", "macosx_11_0_x86_64") == "pkg-1.0-1-cp312-abi3-macosx_11_0_x86_64.whl"
+    with pytest.raises(ValueError):
+        get_retagged_filename("pkg.whl", "macosx_11_0_arm64")
+
+def test_retag_wheel_metadata():
+    assert retag_wheel_metadata(WHEEL_METADATA, "macosx_11_0_arm64").splitlines()[-1] == "Tag: cp312-cp312-macosx_11_0_arm64"
+
+def test_retag_wheel(tmp_path):
+    path = tmp_path / "pkg-1.0-cp312-cp312-linux_x86_64.whl"
+    make_wheel(path)
+
+    new_path = retag_wheel(str(path), "macosx_11_0_arm64")
+
+    assert new_path == str(tmp_path / "pkg-1.0-cp312-cp312-macosx_11_0_arm64.whl")
+    assert not path.exists()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["pkg-1.0-cp312-cp312-macosx_11_0_arm64.whl"]
+    with zipfile.ZipFile(new_path) as zf:
+        assert "Tag: cp312-cp312-macosx_11_0_arm64" in zf.read("pkg-1.0.dist-info/WHEEL").decode()
+        assert zf.getinfo("pkg/_ext.so").external_attr == 0o755 << 16
+        assert zf.namelist()[-1] == "pkg-1.0.dist-info/RECORD"
+
+        records = list(csv.reader(io.StringIO(zf.read("pkg-1.0.dist-info/RECORD").decode())))
+        assert len(records) == len(zf.namelist())
+        for name, digest, size in records:
+            if name == "pkg-1.0.dist-info/RECORD":
+                assert digest == size == ""
+                continue
+            data = zf.read(name)
+            assert digest == "sha256=" + base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b"=").decode()
+            assert int(size) == len(data)
+
+def test_retag_wheels_in_parallel(tmp_path):
+    paths = []
+    for name in ["a", "b", "c"]:
+        path = tmp_path / f"{name}-1.0-cp312-cp312-linux_x86_64.whl"
+        make_wheel(path, name)
+        paths.append(str(path))
+
+    assert retag_wheels(paths, "macosx_11_0_x86_64") == [
+        str(tmp_path / f"{name}-1.0-cp312-cp312-macosx_11_0_x86_64.whl") for name in ["a", "b", "c"]
+    ]
+
+def test_retag_wheel_without_metadata(tmp_path):
+    path = tmp_path / "pkg-1.0-cp312-cp312-linux_x86_64.whl"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("pkg/__init__.py", "")
+
+    with pytest.raises(ValueError):
+        retag_wheel(str(path), "macosx_11_0_arm64")
+    assert [p.name for p in tmp_path.iterdir()] == [path.name]
@@ -0,0 +1,215 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+MAIN_TRACK = 'pookie'
+
+# Phases timed inside the containers append "<phase>\t<B|E>\t<epoch ns>" lines to this file of the workspace
+MARKS_FILE = os.path.join('.pookie', 'trace-marks')
+MARKS_MOUNT = f'/workspace/{MARKS_FILE}'
+
+_enabled = False
+_spans = []
+_tracks = {}
+_trace_lock = threading.Lock()
+
+def enable_tracing():
+    """
+    Start recording the phases of the run, including the phases timed inside the containers.
+    """
+    global _enabled
+    _enabled = True
+
+def is_tracing_enabled():
+    """
+    Check if the phases of the run are recorded.
+
+    Returns:
+    - bool: True if enable_tracing was called.
+    """
+    return _enabled
+
+def add_span(name, track, start, end, args=None):
+    """
+    Record a phase of the run.
+
+    Parameters:
+    - name (str): The name of the phase (e.g., "docker build").
+    - track (str): The track of the phase, usually the job or image name.
+    - start (float): The start time, in seconds since the epoch.
+    - end (float): The end time, in seconds since the epoch.
+    - args (dict): Extra details shown with the phase, or None.
+    """
+    if not _enabled:
+        return
+    with _trace_lock:
+        _tracks.setdefault(track, len(_tracks) + 1)
+        _spans.append({
+            'name': name,
+            'track': track,
+            'start': start,
+            'end': end,
+            'args': args or {}
+        })
+
+@contextlib.contextmanager
+def trace_span(name, track=MAIN_TRACK, **args):
+    """
+    Time the block of a with statement as a phase of the run.
+
+    Parameters:
+    - name (str): The name of the phase.
+    - track (str): The track of the phase (default: the main track).
+    - **args: Extra details shown with the phase.
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        add_span(name, track, start, time.time(), args)
+
+def mark_phase(name, command):
+    """
+    Wrap a shell command so that its start and end times are written to the marks file.
+    The command is returned unchanged when tracing is disabled.
+
+    Parameters:
+    - name (str): The name of the phase (e.g., "auditwheel repair").
+    - command (str): The shell command run inside the container.
+
+    Returns:
+    - str: The command surrounded by the marks of the phase.
+    """
+    if not _enabled:
+        return command
+    return \
+        f'''echo "{name}\tB\t$(date +%s%N)" >> {MARKS_MOUNT} && ''' + \
+        command + \
+        f''' && echo "{name}\tE\t$(date +%s%N)" >> {MARKS_MOUNT}'''
+
+def prepare_marks(workspace='.'):
+    """
+    Create the directory of the marks file of a workspace before running a container on it.
+
+    Parameters:
+    - workspace (str): The workspace mounted on /workspace.
+    """
+    if _enabled:
+        os.makedirs(os.path.join(workspace, os.path.dirname(MARKS_FILE)), exist_ok=True)
+
+def collect_marks(track, workspace='.', started=None):
+    """
+    Record the phases written to the marks file of a workspace and remove it.
+    Phases that began but did not end (because a command failed) are ignored.
+
+    Parameters:
+    - track (str): The track of the phases.
+    - workspace (str): The workspace mounted on /workspace.
+    - started (float): The time the container was launched, to record the time until
+      its first phase began as "container start", or None.
+    """
+    path = os.path.join(workspace, MARKS_FILE)
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+        os.remove(path)
+    except OSError:
+        return
+
+    begins = {}
+    first = None
+    for line in lines:
+        fields = line.split('\t')
+        if len(fields) != 3 or not fields[2].isdigit():
+            continue
+        name, kind, timestamp = fields[0], fields[1], int(fields[2]) / 1e9
+        if kind == 'B':
+            begins[name] = timestamp
+            if first is None:
+                first = timestamp
+                if started is not None and started < first:
+                    add_span('container start', track, started, first)
+        elif kind == 'E' and name in begins:
+            add_span(name, track, begins.pop(name), timestamp)
+
+def get_trace_events():
+    """
+    Convert the recorded phases into Chrome trace events, with one thread (track) per job.
+
+    Returns:
+    - dict: The trace, in the JSON object format of the Trace Event Format.
+    """
+    with _trace_lock:
+        spans = list(_spans)
+        tracks = dict(_tracks)
+
+    origin = min((span['start'] for span in spans), default=0)
+    events = [{
+        'name': 'process_name',
+        'ph': 'M',
+        'pid': 1,
+        'tid': 0,
+        'args': {'name': 'pookie'}
+    }]
+    for track, tid in tracks.items():
+        events.append({
+            'name': 'thread_name',
+            'ph': 'M',
+            'pid': 1,
+            'tid': tid,
+            'args': {'name': track}
+        })
+        events.append({
+            'name': 'thread_sort_index',
+            'ph': 'M',
+            'pid': 1,
+            'tid': tid,
+            'args': {'sort_index': tid}
+        })
+    for span in sorted(spans, key=lambda span: span['start']):
+        events.append({
+            'name': span['name'],
+            'cat': span['track'],
+            'ph': 'X',
+            'pid': 1,
+            'tid': tracks[span['track']],
+            'ts': round((span['start'] - origin) * 1e6),
+            'dur': max(round((span['end'] - span['start']) * 1e6), 0),
+            'args': span['args']
+        })
+
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+def write_trace(path):
+    """
+    Write the recorded phases to a trace file that can be opened with Perfetto or chrome://tracing.
+
+    Parameters:
+    - path (str): The path of the trace file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(get_trace_events(), f)
+    os.replace(tmp_path, path)
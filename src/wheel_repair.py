@@ -0,0 +1,99 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import concurrent.futures
+import os
+import shutil
+import threading
+from docker_engine import run_command
+
+# auditwheel is installed in the pookie image, so that every wheel is repaired natively
+# on the x86_64 host instead of installing it in every build container (under QEMU in emulate mode)
+AUDITWHEEL_EXECUTABLE = 'auditwheel'
+
+_auditwheel_checked = False
+_auditwheel_path = None
+_auditwheel_lock = threading.Lock()
+
+def get_auditwheel():
+    """
+    Find the auditwheel executable of the pookie image, once per run.
+
+    Returns:
+    - str: The path of auditwheel, or None if it is not installed.
+    """
+    global _auditwheel_checked, _auditwheel_path
+    with _auditwheel_lock:
+        if not _auditwheel_checked:
+            _auditwheel_path = shutil.which(AUDITWHEEL_EXECUTABLE)
+            _auditwheel_checked = True
+        return _auditwheel_path
+
+def repair_wheel(path, platform_tag, log_path, prefix=None):
+    """
+    Repair a wheel for a manylinux or musllinux platform with auditwheel, writing the repaired
+    wheel next to it. The original wheel is removed once repaired.
+
+    Parameters:
+    - path (str): The path of the wheel (e.g., "dist/pkg-1.0-cp312-cp312-linux_aarch64.whl").
+    - platform_tag (str): The platform to repair the wheel for (e.g., "manylinux_2_17_aarch64").
+    - log_path (str): The path of the log file of auditwheel.
+    - prefix (str): The name printed before the output lines in the live view, or None to hide them.
+
+    Returns:
+    - int: The exit code of auditwheel.
+    """
+    auditwheel = get_auditwheel()
+    if auditwheel is None:
+        with open(log_path, 'w') as f:
+            f.write("auditwheel is not installed in the pookie image, remove the win-macosx-pookie-lvl2-pookie image to rebuild it\n")
+        return 127
+
+    returncode = run_command([
+        auditwheel,
+            'repair',
+            path,
+            '--plat',
+                platform_tag,
+            '--only-plat',
+            '-w',
+                os.path.dirname(path) or '.'
+    ], log_path, prefix=prefix)
+    if returncode == 0:
+        os.remove(path)
+    return returncode
+
+def repair_wheels(paths, platform_tag, log_paths, prefix=None, max_workers=None):
+    """
+    Repair several wheels for a platform in parallel (see repair_wheel).
+
+    Parameters:
+    - paths (list): The paths of the wheels.
+    - platform_tag (str): The platform to repair the wheels for.
+    - log_paths (list): The paths of the log files, one per wheel.
+    - prefix (str): The name printed before the output lines in the live view, or None to hide them.
+    - max_workers (int): Maximum number of wheels repaired at the same time (default: one per CPU).
+
+    Returns:
+    - dict: Mapping of wheel path to the exit code of its repair.
+    """
+    if len(paths) <= 1:
+        return {path: repair_wheel(path, platform_tag, log_path, prefix) for path, log_path in zip(paths, log_paths)}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        returncodes = executor.map(lambda args: repair_wheel(args[0], platform_tag, args[1], prefix), zip(paths, log_paths))
+        return dict(zip(paths, returncodes))
@@ -0,0 +1,198 @@
+# This file is part of pookie.
+
+# Copyright (C) 2025 Andrés Lillo Ortiz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import base64
+import concurrent.futures
+import csv
+import hashlib
+import io
+import os
+import tempfile
+import zipfile
+
+# Size of the chunks copied between the wheels, so that no member is held in memory or extracted to disk
+COPY_CHUNK_BYTES = 1024 * 1024
+
+# Signatures of RECORD, invalid once the wheel is retagged
+RECORD_SIGNATURES = ['RECORD.jws', 'RECORD.p7s']
+
+def parse_wheel_filename(filename):
+    """
+    Split a wheel filename into its components.
+
+    Parameters:
+    - filename (str): The wheel filename (e.g., "pkg-1.0-cp312-cp312-linux_x86_64.whl").
+
+    Returns:
+    - tuple: The distribution, version, build tag (or None), Python tag, ABI tag and platform tag.
+    """
+    parts = os.path.basename(filename)[:-len('.whl')].split('-')
+    if len(parts) == 5:
+        name, version, python_tag, abi_tag, platform_tag = parts
+        return name, version, None, python_tag, abi_tag, platform_tag
+    if len(parts) == 6:
+        return tuple(parts)
+    raise ValueError(f"Invalid wheel filename: {filename}")
+
+def get_retagged_filename(filename, platform_tag):
+    """
+    Get the filename of a wheel once retagged for another platform.
+
+    Parameters:
+    - filename (str): The wheel filename.
+    - platform_tag (str): The new platform tag (e.g., "macosx_11_0_arm64").
+
+    Returns:
+    - str: The new wheel filename.
+    """
+    name, version, build_tag, python_tag, abi_tag, _ = parse_wheel_filename(filename)
+    parts = [name, version] + ([build_tag] if build_tag else []) + [python_tag, abi_tag, platform_tag]
+    return '-'.join(parts) + '.whl'
+
+def retag_wheel_metadata(text, platform_tag):
+    """
+    Replace the platform of the tags of a WHEEL metadata file.
+
+    Parameters:
+    - text (str): The contents of the WHEEL file.
+    - platform_tag (str): The new platform tag.
+
+    Returns:
+    - str: The new contents of the WHEEL file.
+    """
+    lines = []
+    for line in text.splitlines():
+        if line.startswith('Tag:'):
+            python_tag, abi_tag, _ = line[len('Tag:'):].strip().split('-')
+            line = f"Tag: {python_tag}-{abi_tag}-{platform_tag}"
+            if line in lines:
+                continue
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+def get_record_hash(digest):
+    """
+    Format a SHA-256 digest as a RECORD hash.
+
+    Parameters:
+    - digest (hashlib._Hash): The digest of the file contents.
+
+    Returns:
+    - str: The hash in the "sha256=<urlsafe base64>" form.
+    """
+    return 'sha256=' + base64.urlsafe_b64encode(digest.digest()).rstrip(b'=').decode()
+
+def copy_zip_info(info):
+    """
+    Copy the name, date, permissions and compression of a zip member for the new wheel.
+
+    Parameters:
+    - info (zipfile.ZipInfo): The member of the original wheel.
+
+    Returns:
+    - zipfile.ZipInfo: The member of the new wheel.
+    """
+    new_info = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+    new_info.compress_type = info.compress_type
+    new_info.create_system = info.create_system
+    new_info.external_attr = info.external_attr
+    return new_info
+
+def retag_wheel(path, platform_tag):
+    """
+    Retag a wheel for another platform, streaming its members one by one into the new wheel:
+    only the tags of the WHEEL file change, RECORD is regenerated and the wheel is renamed.
+
+    Parameters:
+    - path (str): The path of the wheel, removed once retagged.
+    - platform_tag (str): The new platform tag.
+
+    Returns:
+    - str: The path of the retagged wheel.
+    """
+    new_path = os.path.join(os.path.dirname(path), get_retagged_filename(path, platform_tag))
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    os.close(fd)
+
+    try:
+        with zipfile.ZipFile(path) as zin, zipfile.ZipFile(tmp_path, 'w') as zout:
+            dist_info = next((
+                name.split('/')[0] for name in zin.namelist()
+                if name.count('/') == 1 and name.split('/')[0].endswith('.dist-info') and name.endswith('/WHEEL')
+            ), None)
+            if dist_info is None:
+                raise ValueError(f"No .dist-info/WHEEL file in {path}")
+            record_name = f"{dist_info}/RECORD"
+            skipped = {record_name} | {f"{dist_info}/{signature}" for signature in RECORD_SIGNATURES}
+
+            records = []
+            for info in zin.infolist():
+                if info.filename in skipped:
+                    continue
+                digest = hashlib.sha256()
+                size = 0
+
+                if info.filename == f"{dist_info}/WHEEL":
+                    data = retag_wheel_metadata(zin.read(info).decode(), platform_tag).encode()
+                    digest.update(data)
+                    size = len(data)
+                    zout.writestr(copy_zip_info(info), data)
+                elif info.is_dir():
+                    zout.writestr(copy_zip_info(info), b'')
+                    continue
+                else:
+                    force_zip64 = info.file_size >= zipfile.ZIP64_LIMIT
+                    with zin.open(info) as src, zout.open(copy_zip_info(info), 'w', force_zip64=force_zip64) as dst:
+                        for chunk in iter(lambda: src.read(COPY_CHUNK_BYTES), b''):
+                            digest.update(chunk)
+                            size += len(chunk)
+                            dst.write(chunk)
+
+                records.append((info.filename, get_record_hash(digest), size))
+
+            record = io.StringIO()
+            writer = csv.writer(record, lineterminator='\n')
+            writer.writerows(records)
+            writer.writerow((record_name, '', ''))
+            zout.writestr(zipfile.ZipInfo(record_name, date_time=zin.getinfo(f"{dist_info}/WHEEL").date_time), record.getvalue(), compress_type=zipfile.ZIP_DEFLATED)
+
+        os.replace(tmp_path, new_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    if new_path != path:
+        os.remove(path)
+    return new_path
+
+def retag_wheels(paths, platform_tag, max_workers=None):
+    """
+    Retag several wheels for another platform in parallel (see retag_wheel).
+
+    Parameters:
+    - paths (list): The paths of the wheels.
+    - platform_tag (str): The new platform tag.
+    - max_workers (int): Maximum number of wheels retagged at the same time (default: one per CPU).
+
+    Returns:
+    - list: The paths of the retagged wheels, in the order of paths.
+    """
+    if len(paths) <= 1:
+        return [retag_wheel(path, platform_tag) for path in paths]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        return list(executor.map(lambda path: retag_wheel(path, platform_tag), paths))
@@ -68,6 +68,15 @@ echo "- test command: $TEST_CMD"
 
 CLEAN="./pookie.sh --workspace \"$WORKSPACE\" --clean"
 
+# Print the test output of every job, captured by pookie in its own log file
+print_test_logs() {
+    for LOG in "$WORKSPACE"/pookie_logs/*-test.log; do
+        [ -f "$LOG" ] || continue
+        echo ">> Testing the library for $(basename "$LOG" -test.log)"
+        cat "$LOG"
+    done
+}
+
 SECONDS=0
 
 eval $CLEAN >> /dev/null 2>> /dev/null
@@ -106,25 +115,7 @@ for FILE in "${FILES1[@]}"; do
     fi
 done
 
-awk '
-{
-  if ($0 ~ />> Testing/) {
-    in_block = 1
-  }
-
-  if (in_block && $0 ~ />>/ && $0 !~ />> Testing/ && seen_testing) {
-    in_block = 0
-    next
-  }
-
-  if (in_block) {
-    print
-    if ($0 ~ />> Testing/) {
-      seen_testing = 1
-    }
-  }
-}
-' "$WORKSPACE/pookie.log"
+print_test_logs
 
 # -------------------------------------------------
 # Build and test for linux x86_64 with clang
@@ -155,25 +146,7 @@ for FILE in "${FILES2[@]}"; do
     fi
 done
 
-awk '
-{
-  if ($0 ~ />> Testing/) {
-    in_block = 1
-  }
-
-  if (in_block && $0 ~ />>/ && $0 !~ />> Testing/ && seen_testing) {
-    in_block = 0
-    next
-  }
-
-  if (in_block) {
-    print
-    if ($0 ~ />> Testing/) {
-      seen_testing = 1
-    }
-  }
-}
-' "$WORKSPACE/pookie.log"
+print_test_logs
 
 # -------------------------------------------------
 # Build and test for linux non native in emulate mode
@@ -206,25 +179,7 @@ for FILE in "${FILES3[@]}"; do
     fi
 done
 
-awk '
-{
-  if ($0 ~ />> Testing/) {
-    in_block = 1
-  }
-
-  if (in_block && $0 ~ />>/ && $0 !~ />> Testing/ && seen_testing) {
-    in_block = 0
-    next
-  }
-
-  if (in_block) {
-    print
-    if ($0 ~ />> Testing/) {
-      seen_testing = 1
-    }
-  }
-}
-' "$WORKSPACE/pookie.log"
+print_test_logs
 
 # End of tests
 echo ">> Cleaning workspace"